@@ -0,0 +1,84 @@
+# aquecer_textos.py
+#
+# Pré-carrega o armazém de textos extraídos com todos os PDFs de uma ou mais empresas:
+# cada PDF é baixado e lido uma vez, e as execuções seguintes (diagnóstico, análise, novo
+# prompt) usam o texto guardado. PDFs já no armazém, com o mesmo ETag, são pulados.
+#
+#   python aquecer_textos.py "Empresa A" "Empresa B"
+import argparse
+import sys
+from functools import partial
+from time import time
+
+import configuracao
+import motor
+import processamento
+from armazem_textos import ArmazemTextos
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="IMANI – pré-carga do armazém de textos extraídos")
+    parser.add_argument("empresas", nargs="+", help="Empresas (pastas em Relatórios Técnicos/) a pré-carregar")
+    parser.add_argument("--segredos", help="Arquivo secrets.toml (padrão: .streamlit/secrets.toml)")
+    parser.add_argument("--workers-download", type=int, default=4)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _argumentos(argv)
+
+    segredos = configuracao.carregar_segredos(args.segredos)
+    faltando = [c for c in configuracao.chaves_faltando(segredos) if c.startswith("BLOB_")]
+    if faltando:
+        print(f"❌ Variáveis obrigatórias faltando: {', '.join(faltando)}", file=sys.stderr)
+        return 2
+    credencial, metodo_auth = configuracao.criar_credencial_blob(segredos)
+    print(f"🔑 Autenticação Blob: {metodo_auth}")
+    container_client = configuracao.conectar_container(segredos, credencial)
+    armazem = ArmazemTextos()
+
+    # ——— Uma listagem por empresa; o ETag da listagem diz o que já está no armazém ———
+    indices = {}
+    prefixos = [motor.prefixo_empresa(empresa.strip()) for empresa in args.empresas]
+    motor.carregar_indices(container_client, prefixos, indices)
+    itens, ja_armazenados = [], 0
+    for prefixo in prefixos:
+        for nome, propriedades in indices[prefixo].propriedades.items():
+            if not nome.lower().endswith(".pdf"):
+                continue
+            item = {"chave": nome, "match": [nome], "propriedades": propriedades}
+            if processamento.chave_armazem(item, container_client) in armazem:
+                ja_armazenados += 1
+            else:
+                itens.append(item)
+    print(f"📄 {len(itens) + ja_armazenados} PDFs; {ja_armazenados} já no armazém; {len(itens)} a ler.")
+
+    # ——— Download → extração (que grava no armazém) ———
+    etapas = [
+        ("download", partial(processamento.baixar_pdf, container_client=container_client), args.workers_download),
+        ("extracao", partial(processamento.extrair_texto, container_client=container_client, armazem=armazem), 1),
+    ]
+    inicio = time()
+    falhas = 0
+    for concluidos, (posicao, item, erro) in enumerate(
+        processamento.processar_em_pipeline(itens, etapas), start=1
+    ):
+        # Com erro em uma etapa, o pipeline devolve item None
+        if erro is None and item.get("doc") is None:
+            erro = item.get("texto")
+        if erro is not None:
+            falhas += 1
+            print(f"❌ {itens[posicao]['chave']}: {erro}", file=sys.stderr)
+        else:
+            print(f"[{concluidos}/{len(itens)}] {item['chave']}: {item['doc'].page_count} páginas")
+        if item is not None:
+            # O texto já está no armazém: não fica em memória
+            item.pop("texto", None)
+            item.pop("doc", None)
+
+    print(f"✅ {len(itens) - falhas}/{len(itens)} PDFs lidos em {time() - inicio:.1f} segundos.")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# armazem_textos.py
+#
+# Armazém local do texto extraído de cada PDF (compactado com zlib) e dos seus metadados
+# básicos, por container, blob e ETag. O texto de um relatório só muda se o ETag mudar:
+# diagnósticos, novas análises e mudanças de prompt reaproveitam o texto sem baixar nem
+# ler o PDF de novo.
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from time import time
+
+from cache_ia import DIRETORIO_CACHE
+from extracao_pdf import ResultadoPDF
+from utilidades import metadados_texto
+
+NIVEL_COMPRESSAO = 6
+
+
+class ArmazemTextos:
+    """
+    Armazém persistente (SQLite) de textos extraídos, com despejo dos menos acessados
+    recentemente acima de `max_bytes` (tamanho compactado).
+    """
+
+    def __init__(self, caminho=None, max_bytes=2 * 1024 * 1024 * 1024):
+        if caminho is None:
+            os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+            caminho = os.path.join(DIRETORIO_CACHE, "textos.sqlite3")
+        self.max_bytes = max_bytes
+        self.acertos = 0
+        self.falhas = 0
+        # Uma conexão compartilhada entre as threads do pipeline, protegida por lock
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        # Uma versão por blob: um ETag novo substitui o texto antigo
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS textos ("
+            " container TEXT NOT NULL,"
+            " blob TEXT NOT NULL,"
+            " etag TEXT NOT NULL,"
+            " texto BLOB NOT NULL,"
+            " offsets TEXT NOT NULL,"
+            " metadados TEXT NOT NULL,"
+            " tamanho INTEGER NOT NULL,"
+            " criado_em REAL NOT NULL,"
+            " acessado_em REAL NOT NULL,"
+            " PRIMARY KEY (container, blob))"
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_acessado_em ON textos (acessado_em)")
+        self._conexao.commit()
+        self._total = 0
+        self.despejar()
+
+    def __contains__(self, chave: tuple[str, str, str]) -> bool:
+        container, blob, etag = chave
+        with self._lock:
+            return self._conexao.execute(
+                "SELECT 1 FROM textos WHERE container = ? AND blob = ? AND etag = ?", (container, blob, etag)
+            ).fetchone() is not None
+
+    def _ler(self, colunas: str, container: str, blob: str, etag: str):
+        with self._lock:
+            linha = self._conexao.execute(
+                f"SELECT {colunas} FROM textos WHERE container = ? AND blob = ? AND etag = ?",
+                (container, blob, etag),
+            ).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return None
+            self._conexao.execute(
+                "UPDATE textos SET acessado_em = ? WHERE container = ? AND blob = ?", (time(), container, blob)
+            )
+            self._conexao.commit()
+            self.acertos += 1
+            return linha
+
+    def obter(self, container: str, blob: str, etag: str) -> ResultadoPDF | None:
+        """
+        Texto e páginas do blob nesta versão (ETag), ou None.
+        """
+        linha = self._ler("texto, offsets, metadados", container, blob, etag)
+        if linha is None:
+            return None
+        texto = zlib.decompress(linha[0]).decode("utf-8")
+        metadados = json.loads(linha[2])
+        return ResultadoPDF(
+            texto, metadados["Páginas"], json.loads(linha[1]), {"total": 0.0, "processos": 0}
+        )
+
+    def metadados(self, container: str, blob: str, etag: str) -> dict | None:
+        """
+        Só os metadados (título, data, empresa elaboradora, páginas), sem descompactar o texto.
+        """
+        linha = self._ler("metadados", container, blob, etag)
+        return json.loads(linha[0]) if linha is not None else None
+
+    def gravar(self, container: str, blob: str, etag: str, resultado: ResultadoPDF):
+        """
+        Guarda o texto completo de um PDF (extrações parciais não devem ser gravadas).
+        """
+        texto = zlib.compress(resultado.texto.encode("utf-8"), NIVEL_COMPRESSAO)
+        offsets = json.dumps(resultado.offsets)
+        metadados = json.dumps(metadados_texto(resultado.texto, resultado), ensure_ascii=False)
+        tamanho = len(texto) + len(offsets) + len(metadados)
+        agora = time()
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO textos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (container, blob, etag, texto, offsets, metadados, tamanho, agora, agora),
+            )
+            self._conexao.commit()
+            self._total += tamanho
+            excedeu = self._total > self.max_bytes
+        if excedeu:
+            self.despejar()
+
+    def despejar(self):
+        """
+        Acima do limite de tamanho, remove os textos menos acessados recentemente.
+        """
+        with self._lock:
+            total = self._conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM textos").fetchone()[0]
+            if total > self.max_bytes:
+                excesso = total - self.max_bytes
+                for container, blob, tamanho in self._conexao.execute(
+                    "SELECT container, blob, tamanho FROM textos ORDER BY acessado_em"
+                ).fetchall():
+                    if excesso <= 0:
+                        break
+                    self._conexao.execute("DELETE FROM textos WHERE container = ? AND blob = ?", (container, blob))
+                    excesso -= tamanho
+                    total -= tamanho
+            self._conexao.commit()
+            self._total = total
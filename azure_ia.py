@@ -1,82 +1,655 @@
-import streamlit as st
-from azure.identity import ClientSecretCredential
-from openai import AzureOpenAI
+import hashlib
+import random
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from functools import partial
+from time import monotonic, sleep, time
+from types import SimpleNamespace
+
+from azure.identity import get_bearer_token_provider
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AzureOpenAI
+
+# tiktoken é opcional: sem ele, os tokens são estimados pelo número de caracteres
+try:
+    import tiktoken
+    _codificador = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _codificador = None
 
 # Globais para cliente e deployment
 client = None
 deployment = None
 
-def configure_azure(azure_endpoint: str, deployment_name: str):
+# ——— Prompt e parâmetros de geração (entram na chave do cache de recomendações) ———
+PROMPT_SISTEMA = "Você é um especialista em engenharia que extrai recomendações técnicas de documentos."
+INSTRUCOES = (
+    "Leia o relatório técnico a seguir e extraia APENAS as recomendações  técnicas obligatórios presentes, "
+    "principalmente nas conclusões. Apresente-as de forma clara e objetiva, "
+    "utilizando bullet points para facilitar a cópia e organização no Excel:"
+    "Não apresente as recomendações que são sugestões"
+    "Apresente cada recomendação em uma linha numerada: 1. , 2. , etc"
+    "Não utilizar símbolos (*, $, #) nem pontuação especial além da numeração e texto limpo"
+    "Alem nas conslusões,Sempre olhar no corpo do texto para verificar se tem recomendações"
+    "Os texto que você vai receber pode estar em qualquer lingua"
+    " Sempre listar as recomendações encontradas na lingua portugues formal e tecnica "
+)
+PARAMETROS_GERACAO = {"max_tokens": 1024, "temperature": 0.7}
+
+# ——— Divisão de relatórios grandes em blocos (map-reduce) ———
+LIMITE_TOKENS_BLOCO = 12000      # tokens de texto do relatório por chamada
+WORKERS_BLOCOS = 4               # blocos do mesmo documento enviados em paralelo
+PRIORIZAR_CONCLUSOES = False     # envia primeiro conclusões/recomendações e para se encontrar algo
+
+INTERVALO_CANCELAMENTO = 0.5     # segundos entre verificações de cancelamento na espera por cota
+
+# ——— Padrões de seção (usados também pelo pré-filtro de relevância) ———
+# Títulos de seção que costumam concentrar as recomendações (PT/EN/ES)
+RE_SECAO_PRIORITARIA = re.compile(
+    r"conclus|recomenda|considera[cç][oõ]es finais|recommendation|conclusi[oó]n|"
+    r"recomendaci[oó]n|consideraciones finales",
+    re.IGNORECASE,
+)
+# Linhas que parecem títulos de seção: “5. CONCLUSÕES”, “5.2 Recomendações”, “CONCLUSIONS”
+RE_TITULO = re.compile(r"^\s*(\d+(\.\d+)*\.?\s+\S.{0,80}|[A-ZÀ-Ý0-9 ,\-–]{4,80})\s*$", re.MULTILINE)
+_RE_NUMERACAO = re.compile(r"^\s*\d+\s*[\.\)\-–]\s*")
+
+
+def versao_prompt() -> str:
+    """
+    Hash do texto do prompt: muda sempre que as instruções forem alteradas.
+    """
+    return hashlib.sha256(f"{PROMPT_SISTEMA}\n{INSTRUCOES}".encode("utf-8")).hexdigest()[:16]
+
+
+def parametros_cache(limite_tokens_bloco: int = None, priorizar_conclusoes: bool = None) -> dict:
+    """
+    Parâmetros que alteram a resposta e, portanto, fazem parte da chave do cache
+    (None = valor padrão do módulo).
+    """
+    return {
+        **PARAMETROS_GERACAO,
+        "limite_tokens_bloco": limite_tokens_bloco or LIMITE_TOKENS_BLOCO,
+        "priorizar_conclusoes": PRIORIZAR_CONCLUSOES if priorizar_conclusoes is None else priorizar_conclusoes,
+    }
+
+
+def contar_tokens(texto: str) -> int:
+    """
+    Conta os tokens do texto (tiktoken, se instalado; senão ~4 caracteres por token).
+    """
+    if _codificador is not None:
+        return len(_codificador.encode(texto, disallowed_special=()))
+    return len(texto) // 4 + 1
+
+
+def _separar(texto: str, separador: str) -> list[str]:
+    # Cada parte mantém o separador no fim: juntas com "" voltam ao texto original
+    partes = texto.split(separador)
+    return [p + separador for p in partes[:-1]] + [partes[-1]]
+
+
+def _dividir_unidade(texto: str, limite_tokens: int) -> list[str]:
+    """
+    Quebra um trecho maior que o limite em parágrafos, depois em linhas e, por fim, à força.
+    As quebras de parágrafo e de linha ficam nas partes.
+    """
+    if contar_tokens(texto) <= limite_tokens:
+        return [texto]
+    for separador in ("\n\n", "\n"):
+        partes = [p for p in _separar(texto, separador) if p]
+        if len(partes) > 1:
+            return [u for p in partes for u in _dividir_unidade(p, limite_tokens)]
+    passo = max(1, limite_tokens * 4)
+    return [texto[i:i + passo] for i in range(0, len(texto), passo)]
+
+
+def dividir_em_blocos(texto: str, limite_tokens: int = None, offsets_paginas: list[int] = None) -> list[str]:
+    """
+    Divide o texto em blocos de até `limite_tokens`, respeitando quebras de página (offsets
+    da extração ou \\f) e títulos de seção sempre que possível.
+    """
+    limite_tokens = limite_tokens or LIMITE_TOKENS_BLOCO
+    if offsets_paginas:
+        fins = offsets_paginas[1:] + [len(texto)]
+        paginas = [texto[a:b] for a, b in zip(offsets_paginas, fins)]
+    else:
+        paginas = _separar(texto, "\f")
+
+    # ——— Unidades naturais: páginas e, dentro delas, seções ———
+    unidades = []
+    for pagina in paginas:
+        inicios = [m.start() for m in RE_TITULO.finditer(pagina)] or [0]
+        if inicios[0] != 0:
+            inicios.insert(0, 0)
+        for a, b in zip(inicios, inicios[1:] + [len(pagina)]):
+            if pagina[a:b].strip():
+                unidades.extend(_dividir_unidade(pagina[a:b], limite_tokens))
+
+    # ——— Agrupa as unidades em blocos até o limite de tokens ———
+    blocos, atual, tokens_atual = [], [], 0
+    for unidade in unidades:
+        tokens = contar_tokens(unidade)
+        if atual and tokens_atual + tokens > limite_tokens:
+            blocos.append("".join(atual))
+            atual, tokens_atual = [], 0
+        atual.append(unidade)
+        tokens_atual += tokens
+    if atual:
+        blocos.append("".join(atual))
+    return blocos
+
+
+def _normalizar_recomendacao(texto: str) -> str:
+    sem_numero = _RE_NUMERACAO.sub("", texto)
+    decomposto = unicodedata.normalize("NFKD", sem_numero)
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", sem_acentos).casefold().split())
+
+
+def _e_recomendacao(linha: str) -> bool:
     """
-    Inicializa o cliente AzureOpenAI usando Service Principal (AAD) via ClientSecretCredential.
+    Linha no formato pedido no prompt (“1. texto”); frases como “Não foram encontradas
+    recomendações.” não contam.
     """
+    return bool(_RE_NUMERACAO.match(linha)) and bool(_RE_NUMERACAO.sub("", linha).strip())
+
+
+def mesclar_recomendacoes(listas: list[list[str]]) -> list[str]:
+    """
+    Junta as recomendações de vários blocos, remove duplicatas (exatas ou quase idênticas)
+    e renumera: 1. , 2. , etc. Só entram linhas numeradas: avisos como “Este trecho não
+    contém recomendações.” e preâmbulos são descartados (nenhuma sobrando = lista vazia).
+    """
+    mantidas, chaves = [], []
+    for lista in listas:
+        for recomendacao in lista:
+            if not _e_recomendacao(recomendacao):
+                continue
+            chave = _normalizar_recomendacao(recomendacao)
+            if not chave or chave in chaves:
+                continue
+            if any(SequenceMatcher(None, chave, k).ratio() >= 0.9 for k in chaves):
+                continue
+            chaves.append(chave)
+            mantidas.append(_RE_NUMERACAO.sub("", recomendacao).strip())
+    return [f"{i}. {texto}" for i, texto in enumerate(mantidas, start=1)]
+
+
+# ================================
+# Agendador com limites de cota (TPM/RPM), concorrência adaptativa e retentativas
+# ================================
+
+class FalhaIA(RuntimeError):
+    """
+    Chamada ao modelo que falhou de vez (erro não recuperável ou retentativas esgotadas).
+    """
+
+
+class Cancelado(Exception):
+    """
+    Levantada por quem recebe as linhas em streaming para abandonar a resposta (execução
+    interrompida pelo usuário). Não conta como falha nem é repetida.
+    """
+
+
+def _retry_after(erro) -> float | None:
+    """
+    Segundos indicados pelo Azure nos cabeçalhos retry-after-ms / retry-after, se houver.
+    """
+    resposta = getattr(erro, "response", None)
+    cabecalhos = getattr(resposta, "headers", None) or {}
     try:
-        # Lê credenciais do AAD de st.secrets
-        tenant_id = st.secrets["BLOB_TENANT_ID"]
-        client_id = st.secrets["BLOB_CLIENT_ID"]
-        client_secret = st.secrets["BLOB_CLIENT_SECRET"]
-        
-        credential = ClientSecretCredential(
-            tenant_id=tenant_id,
-            client_id=client_id,
-            client_secret=client_secret
-        )
-
-        global client, deployment
-        deployment = deployment_name
-        client = AzureOpenAI(
-            azure_api_base=azure_endpoint,
-            azure_api_version="2025-01-01-preview",
-            deployment_name=deployment_name,
-            credential=credential
-        )
-        st.sidebar.success("✅ Azure OpenAI configurado (AAD Service Principal)")
-    except Exception as e:
-        st.error(f"❌ Falha ao configurar Azure OpenAI: {e}")
-        client = None
-        deployment = None
+        if cabecalhos.get("retry-after-ms"):
+            return float(cabecalhos["retry-after-ms"]) / 1000
+        if cabecalhos.get("retry-after"):
+            return float(cabecalhos["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _recuperavel(erro) -> bool:
+    if isinstance(erro, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(erro, APIStatusError) and (erro.status_code == 429 or erro.status_code >= 500)
+
+
+class AgendadorIA:
+    """
+    Controla o ritmo das chamadas ao modelo: balde de tokens (TPM) e de requisições (RPM),
+    concorrência adaptativa (cai pela metade a cada 429 e sobe aos poucos com sucessos),
+    respeito ao Retry-After e retentativas com backoff exponencial e jitter. Um 429 pausa
+    todas as chamadas (não só a que o recebeu) até o fim da espera indicada.
+
+    O tempo parado por limitação (cota local ou 429) é contado à parte das falhas reais.
+    """
+
+    def __init__(self, tpm: int = 0, rpm: int = 0, max_concorrencia: int = 8, max_tentativas: int = 6):
+        self.tpm = tpm                   # 0 = sem limite conhecido
+        self.rpm = rpm
+        self.max_concorrencia = max_concorrencia
+        self.max_tentativas = max_tentativas
+        self._cond = threading.Condition()
+        self._tokens = float(tpm)
+        self._requisicoes = float(rpm)
+        self._atualizado = monotonic()
+        self._limite = float(max_concorrencia)
+        self._em_andamento = 0
+        self._pausado_ate = 0.0           # monotonic(): após um 429, ninguém envia antes disso
+        # ——— Totais da execução ———
+        self.chamadas = 0
+        self.throttles = 0
+        self.falhas = 0
+        self.segundos_espera_cota = 0.0   # esperas do balde local (antes de enviar)
+        self.segundos_throttle = 0.0      # esperas após 429 / Retry-After
+
+    @property
+    def concorrencia_atual(self) -> int:
+        return max(1, int(self._limite))
+
+    def _recarregar(self):
+        agora = monotonic()
+        decorrido = agora - self._atualizado
+        self._atualizado = agora
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + decorrido * self.tpm / 60)
+        if self.rpm:
+            self._requisicoes = min(self.rpm, self._requisicoes + decorrido * self.rpm / 60)
+
+    def _adquirir(self, tokens: int, cancelado: threading.Event = None) -> tuple[float, float, int]:
+        """
+        Espera o fim da pausa por 429, vaga de concorrência e saldo nos baldes; retorna os
+        segundos esperados pela cota local, os esperados na pausa por 429 e os tokens
+        efetivamente reservados (limitados ao TPM). Levanta Cancelado se `cancelado` for
+        sinalizado durante a espera.
+        """
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        inicio = monotonic()
+        em_pausa = 0.0
+        with self._cond:
+            while True:
+                if cancelado is not None and cancelado.is_set():
+                    raise Cancelado()
+                self._recarregar()
+                pausa = max(0.0, self._pausado_ate - monotonic())
+                espera = pausa
+                if self.tpm and self._tokens < tokens:
+                    espera = max(espera, (tokens - self._tokens) * 60 / self.tpm)
+                if self.rpm and self._requisicoes < 1:
+                    espera = max(espera, (1 - self._requisicoes) * 60 / self.rpm)
+                if self._em_andamento < self.concorrencia_atual and espera == 0:
+                    if self.tpm:
+                        self._tokens -= tokens
+                    if self.rpm:
+                        self._requisicoes -= 1
+                    self._em_andamento += 1
+                    return monotonic() - inicio - em_pausa, em_pausa, tokens
+                if cancelado is not None:
+                    # Acorda de tempos em tempos para ver se a execução foi interrompida
+                    espera = min(espera or INTERVALO_CANCELAMENTO, INTERVALO_CANCELAMENTO)
+                antes = monotonic()
+                self._cond.wait(timeout=espera or None)
+                em_pausa += min(pausa, monotonic() - antes)
+
+    def _liberar(self, tokens_reservados: int, tokens_usados: int | None, sucesso: bool, throttled: bool = False):
+        """
+        Devolve a vaga e acerta o balde de tokens: com o uso real, cobra só a diferença para a
+        reserva; sem ele (falha, cancelamento), devolve a reserva inteira. A concorrência só
+        sobe com sucessos e cai pela metade a cada 429; outras falhas não a alteram.
+        """
+        with self._cond:
+            self._em_andamento -= 1
+            if self.tpm:
+                usados = 0 if tokens_usados is None else tokens_usados
+                self._tokens = min(self.tpm, self._tokens + tokens_reservados - usados)
+            if throttled:
+                self._limite = max(1.0, self._limite / 2)
+            elif sucesso:
+                self._limite = min(self.max_concorrencia, self._limite + 1 / self._limite)
+            self._cond.notify_all()
+
+    def executar(self, funcao, tokens_estimados: int, cancelado: threading.Event = None):
+        """
+        Executa `funcao()` (uma chamada ao modelo) respeitando os limites.
+        Retorna (resposta, info) com tentativas, throttles e tempos de espera da chamada.
+        Com `cancelado` sinalizado, levanta Cancelado em vez de esperar cota ou tentar de novo.
+        """
+        info = {"tentativas": 0, "throttles": 0, "espera_cota": 0.0, "espera_throttle": 0.0}
+        while True:
+            info["tentativas"] += 1
+            espera, em_pausa, reservados = self._adquirir(tokens_estimados, cancelado)
+            info["espera_cota"] += espera
+            if em_pausa:
+                # Parada pelo 429 de outra chamada: conta como throttling, não como cota local
+                info["espera_throttle"] += em_pausa
+                with self._cond:
+                    self.segundos_throttle += em_pausa
+            try:
+                resposta = funcao()
+            except Cancelado:
+                self._liberar(reservados, None, sucesso=False)
+                raise
+            except Exception as e:
+                throttled = isinstance(e, APIStatusError) and e.status_code == 429
+                self._liberar(reservados, None, sucesso=False, throttled=throttled)
+                with self._cond:
+                    self.segundos_espera_cota += espera
+                    self.throttles += throttled
+                if not _recuperavel(e) or info["tentativas"] >= self.max_tentativas:
+                    with self._cond:
+                        self.falhas += 1
+                    raise FalhaIA(f"{e} (após {info['tentativas']} tentativa(s))") from e
+
+                # Retry-After do servidor; senão, backoff exponencial com jitter
+                pausa = _retry_after(e)
+                if pausa is None:
+                    pausa = random.uniform(0, min(60.0, 2.0 ** info["tentativas"]))
+                else:
+                    pausa += random.uniform(0, 0.5)
+                info["throttles"] += throttled
+                info["espera_throttle"] += pausa
+                with self._cond:
+                    self.segundos_throttle += pausa
+                    if throttled:
+                        # O deployment está limitando: as outras chamadas também esperam (em _adquirir)
+                        self._pausado_ate = max(self._pausado_ate, monotonic() + pausa)
+                if cancelado is None:
+                    sleep(pausa)
+                elif cancelado.wait(pausa):
+                    raise Cancelado()
+                continue
+
+            uso = getattr(resposta, "usage", None)
+            usados = getattr(uso, "total_tokens", None)
+            # Sem `usage` na resposta, a estimativa fica como consumo
+            self._liberar(reservados, reservados if usados is None else usados, sucesso=True)
+            with self._cond:
+                self.chamadas += 1
+                self.segundos_espera_cota += espera
+            return resposta, info
+
+    def zerar_totais(self):
+        with self._cond:
+            self.chamadas = self.throttles = self.falhas = 0
+            self.segundos_espera_cota = self.segundos_throttle = 0.0
+
+    def resumo(self) -> dict:
+        return {
+            "Chamadas": self.chamadas,
+            "Throttles (429)": self.throttles,
+            "Falhas": self.falhas,
+            "Espera por Cota Local (s)": round(self.segundos_espera_cota, 1),
+            "Espera por Throttling (s)": round(self.segundos_throttle, 1),
+            "Concorrência Atual": self.concorrencia_atual,
+        }
+
+
+# Agendador compartilhado por todas as chamadas (ver configurar_limites)
+agendador = AgendadorIA()
+
+
+def configurar_limites(tpm: int = 0, rpm: int = 0, max_concorrencia: int = 8):
+    """
+    Recria o agendador com os limites do deployment (0 = sem limite conhecido),
+    apenas se eles mudaram: reruns do Streamlit mantêm o estado dos baldes.
+    """
+    global agendador
+    if (agendador.tpm, agendador.rpm, agendador.max_concorrencia) != (tpm, rpm, max_concorrencia):
+        agendador = AgendadorIA(tpm=tpm, rpm=rpm, max_concorrencia=max_concorrencia)
+
+
+def configure_azure(azure_endpoint: str, deployment_name: str, credential):
+    """
+    Inicializa o cliente AzureOpenAI com uma credencial AAD (ex.: Service Principal via
+    ClientSecretCredential). Não depende do Streamlit: erros são propagados.
+    """
+    global client, deployment
+    client = None
+    deployment = None
+    token_provider = get_bearer_token_provider(credential, "https://cognitiveservices.azure.com/.default")
+    client = AzureOpenAI(
+        azure_endpoint=azure_endpoint,
+        api_version="2025-01-01-preview",
+        azure_ad_token_provider=token_provider,
+        max_retries=0  # retentativas ficam com o AgendadorIA
+    )
+    deployment = deployment_name
 
 
 def extrair_recomendacoes_ia(texto: str) -> list[str]:
     """
-    Extrai recomendações técnicas do texto usando AzureOpenAI.
+    Extrai recomendações técnicas do texto usando AzureOpenAI (mostra erros no Streamlit).
     """
+    import streamlit as st
+
     if client is None or not deployment:
         st.error("❌ AzureOpenAI não está configurado. Verifique suas chaves em st.secrets.")
         return []
 
-    prompt = [
-        {
-            "role": "system",
-            "content": "Você é um especialista em engenharia que extrai recomendações técnicas de documentos."
-        },
-        {
-            "role": "user",
-            "content": (
-                "Leia o relatório técnico a seguir e extraia APENAS as recomendações  técnicas obligatórios presentes, "
-                "principalmente nas conclusões. Apresente-as de forma clara e objetiva, "
-                "utilizando bullet points para facilitar a cópia e organização no Excel:"
-                "Não apresente as recomendações que são sugestões"
-                "Apresente cada recomendação em uma linha numerada: 1. , 2. , etc"
-                "Não utilizar símbolos (*, $, #) nem pontuação especial além da numeração e texto limpo"
-                "Alem nas conslusões,Sempre olhar no corpo do texto para verificar se tem recomendações"
-                "Os texto que você vai receber pode estar em qualquer lingua"
-                " Sempre listar as recomendações encontradas na lingua portugues formal e tecnica \n\n"
-                f"{texto}"
-            )
-        }
-    ]
-
-
     try:
-        resp = client.chat.completions.create(
-            model=deployment,
-            messages=prompt,
-            max_tokens=1024,
-            temperature=0.7
-        )
-        raw = resp.choices[0].message.content or ""
-        return [item.strip("-• ") for item in raw.split("\n") if item.strip()]
+        return solicitar_recomendacoes(texto)
     except Exception as e:
         st.error(f"❌ Erro ao chamar AzureOpenAI: {e}")
         return []
+
+
+def solicitar_recomendacoes(texto: str) -> list[str]:
+    """
+    Igual a `extrair_recomendacoes_ia`, mas sem chamadas ao Streamlit: erros são propagados.
+    Pode ser chamada a partir de threads de trabalho.
+    """
+    recomendacoes, _ = extrair_recomendacoes_detalhado(texto)
+    return recomendacoes
+
+
+def _limpar_linha(linha: str) -> str:
+    return linha.strip().strip("-• ")
+
+
+def montar_prompt(texto: str) -> list[dict]:
+    return [
+        {"role": "system", "content": PROMPT_SISTEMA},
+        {"role": "user", "content": f"{INSTRUCOES}\n\n{texto}"}
+    ]
+
+
+def interpretar_resposta(conteudo: str) -> list[str]:
+    """
+    Uma recomendação por linha não vazia da resposta do modelo.
+    """
+    return [_limpar_linha(item) for item in (conteudo or "").split("\n") if item.strip()]
+
+
+def blocos_do_documento(texto: str, offsets_paginas: list[int] = None, limite_tokens: int = None) -> list[str]:
+    """
+    Textos enviados ao modelo para um documento: o texto inteiro ou, acima de
+    `limite_tokens` (padrão: LIMITE_TOKENS_BLOCO), os blocos do map-reduce.
+    """
+    limite_tokens = limite_tokens or LIMITE_TOKENS_BLOCO
+    if contar_tokens(texto) <= limite_tokens:
+        return [texto]
+    return dividir_em_blocos(texto, limite_tokens, offsets_paginas)
+
+
+def linhas_em_streaming(pedacos):
+    """
+    Gera cada linha da resposta assim que ela se completa (já limpa, sem as vazias), a partir
+    dos fragmentos de texto de uma resposta em streaming.
+    """
+    pendente = ""
+    for pedaco in pedacos:
+        pendente += pedaco
+        *completas, pendente = pendente.split("\n")
+        for linha in completas:
+            if linha.strip():
+                yield _limpar_linha(linha)
+    if pendente.strip():
+        yield _limpar_linha(pendente)
+
+
+def _resposta_em_streaming(prompt, ao_receber_linha, cancelado: threading.Event = None):
+    """
+    Chamada com stream=True: repassa cada linha a `ao_receber_linha` conforme chega e devolve
+    um objeto com o mesmo formato de uma resposta comum (choices[0].message.content e usage).
+    Com `cancelado` sinalizado, abandona o stream no próximo evento (mesmo no meio de uma linha).
+    """
+    fluxo = client.chat.completions.create(
+        model=deployment,
+        messages=prompt,
+        stream=True,
+        stream_options={"include_usage": True},
+        **PARAMETROS_GERACAO
+    )
+    partes, uso = [], None
+
+    def pedacos():
+        nonlocal uso
+        for evento in fluxo:
+            if cancelado is not None and cancelado.is_set():
+                raise Cancelado()
+            # O último evento traz só o uso de tokens (sem choices)
+            uso = getattr(evento, "usage", None) or uso
+            for escolha in getattr(evento, "choices", None) or []:
+                conteudo = getattr(escolha.delta, "content", None)
+                if conteudo:
+                    partes.append(conteudo)
+                    yield conteudo
+
+    try:
+        for linha in linhas_em_streaming(pedacos()):
+            ao_receber_linha(linha)
+    finally:
+        # Interrompida (Cancelado) ou não, encerra a conexão HTTP
+        fechar = getattr(fluxo, "close", None)
+        if fechar is not None:
+            fechar()
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="".join(partes)))],
+        usage=uso,
+    )
+
+
+def _chamar_modelo(texto: str, ao_receber_linha=None, cancelado: threading.Event = None) -> tuple[list[str], dict]:
+    """
+    Uma chamada ao modelo com o prompt de extração sobre um trecho do relatório,
+    passando pelo agendador. Retorna (recomendações, info da chamada), com tempos de montagem
+    do prompt e da chamada e os tokens informados pelo serviço (resp.usage).
+    Com `ao_receber_linha`, a resposta vem em streaming e cada linha é repassada assim que
+    termina. Em uma retentativa, as linhas recomeçam do início: antes, `ao_receber_linha(None,
+    descartar=linhas)` recebe as linhas da tentativa que falhou, para que sejam removidas.
+    Com `cancelado` sinalizado, levanta Cancelado antes de esperar cota ou de cada tentativa.
+    """
+    if cancelado is not None and cancelado.is_set():
+        raise Cancelado()
+    inicio = time()
+    prompt = montar_prompt(texto)
+    # A cota do Azure conta os tokens do prompt + max_tokens da resposta
+    tokens_estimados = contar_tokens(PROMPT_SISTEMA) + contar_tokens(prompt[1]["content"]) + PARAMETROS_GERACAO["max_tokens"]
+    segundos_prompt = time() - inicio
+    primeira_linha = None
+    linhas_da_tentativa = []
+
+    if ao_receber_linha is None:
+        def chamar():
+            return client.chat.completions.create(model=deployment, messages=prompt, **PARAMETROS_GERACAO)
+    else:
+        def receber(linha):
+            nonlocal primeira_linha
+            if primeira_linha is None:
+                primeira_linha = time()
+            linhas_da_tentativa.append(linha)
+            ao_receber_linha(linha)
+
+        def chamar():
+            if linhas_da_tentativa:
+                ao_receber_linha(None, descartar=list(linhas_da_tentativa))
+                linhas_da_tentativa.clear()
+            return _resposta_em_streaming(prompt, receber, cancelado)
+
+    resp, info = agendador.executar(chamar, tokens_estimados, cancelado)
+    uso = getattr(resp, "usage", None)
+    info.update(
+        inicio=inicio,
+        segundos_prompt=segundos_prompt,
+        segundos_modelo=time() - inicio - segundos_prompt,
+        caracteres=len(texto),
+        tokens_prompt=getattr(uso, "prompt_tokens", None) or 0,
+        tokens_resposta=getattr(uso, "completion_tokens", None) or 0,
+    )
+    if primeira_linha is not None:
+        info["segundos_primeira_linha"] = primeira_linha - inicio - segundos_prompt
+    return interpretar_resposta(resp.choices[0].message.content), info
+
+
+def extrair_recomendacoes_detalhado(
+    texto: str, offsets_paginas: list[int] = None, chamadas: list[dict] = None, ao_receber_linha=None,
+    cancelado: threading.Event = None, limite_tokens_bloco: int = None, workers_blocos: int = None,
+    priorizar_conclusoes: bool = None,
+) -> tuple[list[str], dict]:
+    """
+    Extrai as recomendações e devolve também estatísticas do documento (tokens, blocos,
+    chamadas, retentativas). Relatórios acima de `limite_tokens_bloco` são divididos em blocos
+    processados em paralelo (`workers_blocos` por vez), e as recomendações são mescladas sem
+    duplicatas. Sem esses argumentos, valem LIMITE_TOKENS_BLOCO, WORKERS_BLOCOS e
+    PRIORIZAR_CONCLUSOES.
+    Se `chamadas` for uma lista, recebe a info de cada chamada ao modelo (tempos, tokens).
+    Com `ao_receber_linha`, as respostas vêm em streaming e cada linha é repassada assim que
+    chega (de qualquer bloco, chamada da thread do bloco); o retorno final é o mesmo.
+    Com `cancelado` sinalizado, as chamadas ainda não enviadas levantam Cancelado.
+    Levanta FalhaIA se alguma chamada falhar de vez: o documento não vira “sem recomendações”.
+    """
+    if client is None or not deployment:
+        raise RuntimeError("AzureOpenAI não está configurado.")
+    limite_tokens_bloco = limite_tokens_bloco or LIMITE_TOKENS_BLOCO
+    workers_blocos = workers_blocos or WORKERS_BLOCOS
+    if priorizar_conclusoes is None:
+        priorizar_conclusoes = PRIORIZAR_CONCLUSOES
+
+    tokens = contar_tokens(texto)
+    estatisticas = {"Tokens do Documento": tokens, "Blocos": 1, "Chamadas à IA": 1, "Parada Antecipada": "Não"}
+
+    def _registrar(infos):
+        estatisticas["Retentativas"] = sum(i["tentativas"] - 1 for i in infos)
+        estatisticas["Throttling (s)"] = f"{sum(i['espera_throttle'] for i in infos):.1f}"
+        estatisticas["Espera por Cota (s)"] = f"{sum(i['espera_cota'] for i in infos):.1f}"
+        estatisticas["Tokens do Prompt"] = sum(i["tokens_prompt"] for i in infos)
+        estatisticas["Tokens da Resposta"] = sum(i["tokens_resposta"] for i in infos)
+        if chamadas is not None:
+            chamadas.extend(infos)
+
+    chamar_modelo = partial(_chamar_modelo, ao_receber_linha=ao_receber_linha, cancelado=cancelado)
+
+    if tokens <= limite_tokens_bloco:
+        recomendacoes, info = chamar_modelo(texto)
+        _registrar([info])
+        return recomendacoes, estatisticas
+
+    blocos = dividir_em_blocos(texto, limite_tokens_bloco, offsets_paginas)
+    estatisticas["Blocos"] = len(blocos)
+
+    # ——— Opcionalmente, conclusões/recomendações primeiro; se houver resultado, para ———
+    if priorizar_conclusoes:
+        prioritarios = [b for b in blocos if RE_SECAO_PRIORITARIA.search(b)]
+        if prioritarios:
+            restantes = [b for b in blocos if not RE_SECAO_PRIORITARIA.search(b)]
+        else:
+            restantes = blocos
+    else:
+        prioritarios, restantes = [], blocos
+
+    with ThreadPoolExecutor(max_workers=workers_blocos, thread_name_prefix="imani-blocos") as executor:
+        respostas = list(executor.map(chamar_modelo, prioritarios))
+        # Só para com recomendações de fato (linhas numeradas), não com qualquer resposta
+        if any(_e_recomendacao(linha) for lista, _ in respostas for linha in lista):
+            estatisticas["Chamadas à IA"] = len(prioritarios)
+            estatisticas["Parada Antecipada"] = "Sim"
+            _registrar([info for _, info in respostas])
+            return mesclar_recomendacoes([lista for lista, _ in respostas]), estatisticas
+        respostas += list(executor.map(chamar_modelo, restantes))
+
+    estatisticas["Chamadas à IA"] = len(prioritarios) + len(restantes)
+    _registrar([info for _, info in respostas])
+    return mesclar_recomendacoes([lista for lista, _ in respostas]), estatisticas
@@ -0,0 +1,269 @@
+# benchmark_imani.py
+#
+# Benchmark offline do pipeline do IMANI: gera um corpus de PDFs sintéticos, substitui o Blob
+# Storage e o Azure OpenAI pelos simuladores de `simulacao.py` e percorre o mesmo caminho do
+# app (preparar_itens → executar → montar_linha). O resultado vai para um JSON, para comparar
+# execuções e detectar regressões.
+#
+#   python benchmark_imani.py --perfis 20x5 10x40 2x200 --saida bench.json
+#   python benchmark_imani.py --latencia-ia 1.0 --throttle-ia 0.1 --comparar bench.json
+#   python benchmark_imani.py --lote-ia --duracao-lote 5 --falhas-lote 0.05
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+
+import pandas as pd
+
+import azure_ia
+import lote_ia
+import motor
+import simulacao
+import telemetria
+from armazem_textos import ArmazemTextos
+
+EMPRESA = "Empresa Simulada"
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="IMANI – benchmark offline com Blob Storage e IA simulados")
+    parser.add_argument(
+        "--perfis", nargs="+", default=["20x5", "10x40", "2x200"],
+        help="Corpus como QUANTIDADExPÁGINAS (ex.: 20x5 10x40)"
+    )
+    parser.add_argument("--empresas", type=int, default=1, help="Empresas (prefixos) com o mesmo corpus cada")
+    parser.add_argument("--saida", default="benchmark_imani.json", help="Arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--rotulo", default="", help="Identificação livre da execução")
+    parser.add_argument("--somente-diagnostico", action="store_true")
+    parser.add_argument("--leitura-diagnostico", choices=["parcial", "metadados", "completa"], default="parcial")
+    parser.add_argument("--workers-download", type=int, default=4)
+    parser.add_argument("--workers-ia", type=int, default=4)
+    parser.add_argument("--latencia-requisicao", type=float, default=0.02, help="Segundos por requisição ao Blob")
+    parser.add_argument("--latencia-mb", type=float, default=0.05, help="Segundos por MB baixado")
+    parser.add_argument("--falhas-blob", type=float, default=0.0, help="Fração de downloads que falham")
+    parser.add_argument("--latencia-ia", type=float, default=0.3, help="Segundos fixos por chamada à IA")
+    parser.add_argument("--latencia-mil-tokens", type=float, default=0.05, help="Segundos por mil tokens do prompt")
+    parser.add_argument("--latencia-token-resposta", type=float, default=0.0, help="Segundos por token gerado")
+    parser.add_argument("--streaming", action="store_true", help="Respostas da IA em streaming, linha a linha")
+    parser.add_argument("--falhas-ia", type=float, default=0.0, help="Fração de chamadas com erro 500")
+    parser.add_argument("--throttle-ia", type=float, default=0.0, help="Fração de chamadas com 429")
+    parser.add_argument("--lote-ia", action="store_true", help="IA pela Batch API simulada (jobs assíncronos)")
+    parser.add_argument("--duracao-lote", type=float, default=1.0, help="Segundos até um job do lote concluir")
+    parser.add_argument("--falhas-lote", type=float, default=0.0, help="Fração das requisições do lote com erro")
+    parser.add_argument(
+        "--armazem-textos", help="SQLite do armazém de textos extraídos (rode duas vezes para medir a reutilização)"
+    )
+    parser.add_argument("--sem-filtro", action="store_true", help="Desliga o pré-filtro de trechos relevantes")
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--rpm", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def _perfis(perfis: list[str]) -> list[tuple[int, int]]:
+    resultado = []
+    for perfil in perfis:
+        quantidade, paginas = perfil.lower().split("x")
+        resultado.append((int(quantidade), int(paginas)))
+    return resultado
+
+
+def _versao() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecida"
+
+
+def executar_benchmark(args) -> dict:
+    perfis = _perfis(args.perfis)
+    inicio_corpus = perf_counter()
+    empresas = [EMPRESA] if args.empresas <= 1 else [f"{EMPRESA} {i}" for i in range(1, args.empresas + 1)]
+    corpus = {}
+    for empresa in empresas:
+        corpus.update(simulacao.gerar_corpus(perfis, empresa=empresa))
+    tempo_corpus = perf_counter() - inicio_corpus
+
+    container = simulacao.ContainerSimulado(
+        corpus, latencia_requisicao=args.latencia_requisicao, latencia_por_mb=args.latencia_mb,
+        taxa_falha=args.falhas_blob,
+    )
+    cliente = simulacao.ClienteOpenAISimulado(
+        latencia_base=args.latencia_ia, latencia_por_mil_tokens=args.latencia_mil_tokens,
+        taxa_falha=args.falhas_ia, taxa_throttle=args.throttle_ia,
+        latencia_por_token_resposta=args.latencia_token_resposta,
+        duracao_lote=args.duracao_lote, taxa_falha_lote=args.falhas_lote,
+    )
+    azure_ia.client, azure_ia.deployment = cliente, "simulado"
+    azure_ia.configurar_limites(tpm=args.tpm, rpm=args.rpm, max_concorrencia=args.workers_ia)
+    azure_ia.agendador.zerar_totais()
+
+    opcoes = motor.OpcoesAnalise(
+        account_url="https://simulado.blob.core.windows.net",
+        container_name="simulado",
+        deployment_name="simulado",
+        somente_diagnostico=args.somente_diagnostico,
+        diagnostico_ativo=True,
+        workers_download=args.workers_download,
+        workers_ia=args.workers_ia,
+        leitura_diagnostico=args.leitura_diagnostico,
+        filtro_ativo=not args.sem_filtro,
+    )
+    # Mesmas colunas do Excel de projetos; os nomes saem do próprio corpus
+    df = pd.DataFrame({
+        motor.COLUNA_EMPRESA: [nome.split("/")[1] for nome in corpus],
+        motor.COLUNA_ARQUIVO: [os.path.basename(nome)[:-4] for nome in corpus],
+    })
+
+    tracemalloc.start()
+    inicio = perf_counter()
+    itens, indices = motor.preparar_itens(df, container, opcoes, {}, cache=None)
+    tempos = {"listagem": [indice.tempo_construcao for indice in indices.values()]}
+    for etapa in ("download", "extracao", "ler_pdf_bytes", "ia", "modelo", "primeira_linha", "montar_linha"):
+        tempos[etapa] = []
+    status = {}
+    erros = 0
+
+    linhas_recebidas = 0
+
+    def receber_linha(chave, linha, descartar=()):
+        nonlocal linhas_recebidas
+        linhas_recebidas += (linha is not None) - len(descartar)
+
+    armazem = ArmazemTextos(args.armazem_textos) if args.armazem_textos else None
+    lote = None
+    if args.lote_ia and not args.somente_diagnostico:
+        opcoes.deployment_lote = "simulado-lote"
+        lote = lote_ia.LoteIA(cliente, opcoes.deployment_lote)
+        execucao = motor.executar_em_lote(
+            itens, container, opcoes, lote, intervalo=min(1.0, args.duracao_lote / 4), armazem_textos=armazem
+        )
+    else:
+        execucao = motor.executar(
+            itens, container, opcoes, ao_receber_linha=receber_linha if args.streaming else None,
+            armazem_textos=armazem,
+        )
+    for posicao, item, erro in execucao:
+        if erro is not None:
+            item = dict(itens[posicao], erro=str(erro))
+            erros += 1
+        duracoes = item.get("duracoes", {})
+        for etapa in ("download", "extracao", "ia"):
+            if etapa in duracoes:
+                tempos[etapa].append(duracoes[etapa])
+        for span in item.get("spans", []):
+            if span["etapa"] == "modelo":
+                tempos["modelo"].append(span["duracao"])
+                if "primeira_linha" in span:
+                    tempos["primeira_linha"].append(span["primeira_linha"])
+        if item.get("doc") is not None:
+            tempos["ler_pdf_bytes"].append(item["doc"].tempos["total"])
+        inicio_linha = perf_counter()
+        resultado, _, _ = motor.montar_linha(item, opcoes)
+        tempos["montar_linha"].append(perf_counter() - inicio_linha)
+        status[resultado["Status"]] = status.get(resultado["Status"], 0) + 1
+
+    duracao = perf_counter() - inicio
+    _, pico_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss: KB no Linux, bytes no macOS; inclui as alocações do MuPDF, fora do tracemalloc
+    pico_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pico_rss_mb = pico_rss / 1024 / 1024 if sys.platform == "darwin" else pico_rss / 1024
+
+    return {
+        "versao": _versao(),
+        "rotulo": args.rotulo,
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {"python": platform.python_version(), "cpus": os.cpu_count(), "plataforma": platform.platform()},
+        "parametros": {
+            **{k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+            "max_processos": opcoes.max_processos_extracao,
+            "limite_tokens_bloco": opcoes.limite_tokens_bloco,
+            "orcamento_filtro": opcoes.orcamento_filtro,
+            "limite_memoria_download": opcoes.limite_memoria_download,
+        },
+        "corpus": {
+            "documentos": len(corpus),
+            "empresas": len(empresas),
+            "paginas": sum(q * p for q, p in perfis) * len(empresas),
+            "bytes": sum(len(c) for c in corpus.values()),
+            "segundos_geracao": round(tempo_corpus, 2),
+        },
+        "resultados": {
+            "segundos": round(duracao, 3),
+            "documentos_por_minuto": round(len(itens) * 60 / duracao, 2) if duracao else 0.0,
+            "erros": erros,
+            "status": status,
+            "bytes_baixados": container.bytes_servidos,
+            "listagens": container.listagens,
+            "textos_do_armazem": armazem.acertos if armazem is not None else 0,
+            "pico_memoria_python_mb": round(pico_python / 1024 / 1024, 1),
+            "pico_memoria_rss_mb": round(pico_rss_mb, 1),
+            "ia": {
+                **azure_ia.agendador.resumo(), "Tokens do Prompt": cliente.tokens_prompt,
+                "Linhas em Streaming": linhas_recebidas,
+                **({
+                    "Requisições no Lote": cliente.requisicoes_lote,
+                    "Falhas no Lote": len(lote.falhas),
+                    "Espera do Lote (s)": round(lote.segundos_espera, 2),
+                } if lote is not None else {}),
+            },
+            "etapas": {etapa: telemetria.percentis(valores) for etapa, valores in tempos.items()},
+        },
+    }
+
+
+def comparar(atual: dict, anterior: dict) -> list[str]:
+    """
+    Linhas com a variação das métricas principais em relação a uma execução anterior.
+    """
+    linhas = [f"Comparação com {anterior.get('versao')} ({anterior.get('data')}):"]
+    a, b = atual["resultados"], anterior["resultados"]
+    for chave in ("documentos_por_minuto", "pico_memoria_rss_mb", "segundos"):
+        if b.get(chave):
+            linhas.append(f"  {chave}: {b[chave]} → {a[chave]} ({(a[chave] - b[chave]) / b[chave]:+.1%})")
+    for etapa, estatisticas in a["etapas"].items():
+        anterior_p90 = b.get("etapas", {}).get(etapa, {}).get("p90")
+        if anterior_p90 and "p90" in estatisticas:
+            variacao = (estatisticas["p90"] - anterior_p90) / anterior_p90
+            linhas.append(f"  p90 {etapa}: {anterior_p90} → {estatisticas['p90']} ({variacao:+.1%})")
+    return linhas
+
+
+def main(argv=None) -> int:
+    args = _argumentos(argv)
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+
+    relatorio = executar_benchmark(args)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+    resultados = relatorio["resultados"]
+    print(f"📄 {relatorio['corpus']['documentos']} documentos ({relatorio['corpus']['paginas']} páginas) "
+          f"em {resultados['segundos']:.1f} s → {resultados['documentos_por_minuto']} docs/min")
+    print(f"🧠 Pico de memória: {resultados['pico_memoria_rss_mb']} MB (RSS), "
+          f"{resultados['pico_memoria_python_mb']} MB (Python)")
+    for etapa, estatisticas in resultados["etapas"].items():
+        if estatisticas["n"]:
+            print(f"⏱️ {etapa}: p50 {estatisticas['p50']:.3f} s · p90 {estatisticas['p90']:.3f} s · "
+                  f"p99 {estatisticas['p99']:.3f} s (n={estatisticas['n']})")
+    if anterior is not None:
+        print("\n".join(comparar(relatorio, anterior)))
+    print(f"✅ Resultados em {args.saida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
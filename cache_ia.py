@@ -0,0 +1,114 @@
+# cache_ia.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from time import time
+
+# Diretório local dos caches persistentes do IMANI
+DIRETORIO_CACHE = os.environ.get("IMANI_CACHE_DIR", ".imani_cache")
+
+
+def identidade_blob(propriedades) -> str:
+    """
+    Identifica o conteúdo de um blob a partir das propriedades da listagem: usa o MD5 do
+    conteúdo quando disponível (cópias idênticas compartilham a entrada) e, senão, nome + ETag.
+    """
+    content_settings = getattr(propriedades, "content_settings", None)
+    md5 = getattr(content_settings, "content_md5", None) if content_settings else None
+    if md5:
+        return "md5:" + bytes(md5).hex()
+    return f"etag:{propriedades.name}@{propriedades.etag}"
+
+
+def gerar_chave(identidade: str, versao_prompt: str, deployment: str, parametros: dict) -> str:
+    """
+    Chave do cache: blob + versão do prompt + deployment + parâmetros de geração.
+    """
+    bruto = json.dumps([identidade, versao_prompt, deployment, parametros], sort_keys=True)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class CacheRecomendacoes:
+    """
+    Cache persistente (SQLite) das recomendações extraídas pela IA, com despejo por idade e tamanho.
+    """
+
+    def __init__(self, caminho=None, max_idade_dias=90, max_bytes=200 * 1024 * 1024):
+        if caminho is None:
+            os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+            caminho = os.path.join(DIRETORIO_CACHE, "recomendacoes.sqlite3")
+        self.max_idade = max_idade_dias * 86400
+        self.max_bytes = max_bytes
+        self.acertos = 0
+        self.falhas = 0
+        # Uma conexão compartilhada entre as threads do pipeline, protegida por lock
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS recomendacoes ("
+            " chave TEXT PRIMARY KEY,"
+            " blob TEXT,"
+            " conteudo TEXT NOT NULL,"
+            " tamanho INTEGER NOT NULL,"
+            " criado_em REAL NOT NULL,"
+            " acessado_em REAL NOT NULL)"
+        )
+        self._conexao.commit()
+        self._total = 0
+        self.despejar()
+
+    def obter(self, chave: str) -> list[str] | None:
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT conteudo, criado_em FROM recomendacoes WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None or time() - linha[1] > self.max_idade:
+                self.falhas += 1
+                return None
+            self._conexao.execute(
+                "UPDATE recomendacoes SET acessado_em = ? WHERE chave = ?", (time(), chave)
+            )
+            self._conexao.commit()
+            self.acertos += 1
+            return json.loads(linha[0])
+
+    def gravar(self, chave: str, blob: str, recomendacoes: list[str]):
+        conteudo = json.dumps(recomendacoes, ensure_ascii=False)
+        tamanho = len(conteudo.encode("utf-8"))
+        agora = time()
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO recomendacoes VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, blob, conteudo, tamanho, agora, agora),
+            )
+            self._conexao.commit()
+            self._total += tamanho
+            excedeu = self._total > self.max_bytes
+        if excedeu:
+            self.despejar()
+
+    def despejar(self):
+        """
+        Remove entradas expiradas e, acima do limite de tamanho, as menos acessadas recentemente.
+        """
+        with self._lock:
+            self._conexao.execute(
+                "DELETE FROM recomendacoes WHERE criado_em < ?", (time() - self.max_idade,)
+            )
+            total = self._conexao.execute(
+                "SELECT COALESCE(SUM(tamanho), 0) FROM recomendacoes"
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                excesso = total - self.max_bytes
+                for chave, tamanho in self._conexao.execute(
+                    "SELECT chave, tamanho FROM recomendacoes ORDER BY acessado_em"
+                ).fetchall():
+                    if excesso <= 0:
+                        break
+                    self._conexao.execute("DELETE FROM recomendacoes WHERE chave = ?", (chave,))
+                    excesso -= tamanho
+                    total -= tamanho
+            self._conexao.commit()
+            self._total = total
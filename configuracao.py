@@ -0,0 +1,121 @@
+# configuracao.py
+import os
+import tomllib
+
+from azure.identity import ClientSecretCredential, DefaultAzureCredential, UsernamePasswordCredential
+from azure.storage.blob import BlobServiceClient
+
+import azure_ia
+
+CHAVES_OBRIGATORIAS = [
+    "AZURE_OPENAI_ENDPOINT",
+    "AZURE_OPENAI_DEPLOYMENT_NAME",
+    "BLOB_ACCOUNT_URL",
+    "BLOB_CONTAINER_NAME",
+    "BLOB_AUTH_METHOD"
+]
+CHAVES_OPCIONAIS = [
+    "BLOB_CLIENT_ID",
+    "BLOB_CLIENT_SECRET",
+    "BLOB_TENANT_ID",
+    "BLOB_USERNAME",
+    "BLOB_PASSWORD",
+    "AZURE_OPENAI_TPM",
+    "AZURE_OPENAI_RPM",
+    "AZURE_OPENAI_BATCH_DEPLOYMENT",
+]
+
+
+def carregar_segredos(caminho_toml: str = None) -> dict:
+    """
+    Segredos para execução fora do Streamlit: lê o mesmo arquivo `.streamlit/secrets.toml`
+    e deixa as variáveis de ambiente de mesmo nome sobrescreverem os valores.
+    """
+    caminho_toml = caminho_toml or os.path.join(".streamlit", "secrets.toml")
+    segredos = {}
+    if os.path.exists(caminho_toml):
+        with open(caminho_toml, "rb") as f:
+            segredos.update(tomllib.load(f))
+    for chave in CHAVES_OBRIGATORIAS + CHAVES_OPCIONAIS:
+        if os.environ.get(chave):
+            segredos[chave] = os.environ[chave]
+    return segredos
+
+
+def chaves_faltando(segredos) -> list[str]:
+    return [c for c in CHAVES_OBRIGATORIAS if c not in segredos]
+
+
+def criar_credencial_blob(segredos) -> tuple[object, str]:
+    """
+    Cria a credencial do Blob Storage conforme BLOB_AUTH_METHOD.
+    Retorna (credencial, descrição do método) e levanta KeyError se faltar alguma chave.
+    """
+    auth_method = segredos["BLOB_AUTH_METHOD"].lower()
+
+    if auth_method == "service_principal":
+        client_id = segredos.get("BLOB_CLIENT_ID", "")
+        client_secret = segredos.get("BLOB_CLIENT_SECRET", "")
+        tenant_id = segredos.get("BLOB_TENANT_ID", "")
+        if not client_id or not client_secret or not tenant_id:
+            raise KeyError("BLOB_CLIENT_ID, BLOB_CLIENT_SECRET e BLOB_TENANT_ID devem estar nos segredos.")
+        credencial = ClientSecretCredential(
+            tenant_id=tenant_id,
+            client_id=client_id,
+            client_secret=client_secret
+        )
+        return credencial, "Service Principal"
+
+    if auth_method == "username_password":
+        username = segredos.get("BLOB_USERNAME", "")
+        password = segredos.get("BLOB_PASSWORD", "")
+        tenant_id = segredos.get("BLOB_TENANT_ID", "")
+        if not username or not password or not tenant_id:
+            raise KeyError("BLOB_USERNAME, BLOB_PASSWORD e BLOB_TENANT_ID devem estar nos segredos.")
+        credencial = UsernamePasswordCredential(
+            username=username,
+            password=password,
+            tenant_id=tenant_id
+        )
+        return credencial, "Usuário/Senha"
+
+    # azure_cli
+    return DefaultAzureCredential(), "Azure CLI (DefaultAzureCredential)"
+
+
+def conectar_container(segredos, credencial):
+    """
+    Instancia o BlobServiceClient e devolve o container_client, verificando se o container existe.
+    """
+    blob_service_client = BlobServiceClient(
+        account_url=segredos["BLOB_ACCOUNT_URL"].rstrip("/"),
+        credential=credencial
+    )
+    container_client = blob_service_client.get_container_client(segredos["BLOB_CONTAINER_NAME"])
+    container_client.get_container_properties()  # Verificação de existência
+    return container_client
+
+
+def configurar_ia(segredos, credencial=None):
+    """
+    Configura o cliente Azure OpenAI com o Service Principal (AAD) dos segredos.
+    Uma credencial já existente pode ser passada para reaproveitar os tokens em cache.
+    """
+    if credencial is None:
+        credencial = ClientSecretCredential(
+            tenant_id=segredos["BLOB_TENANT_ID"],
+            client_id=segredos["BLOB_CLIENT_ID"],
+            client_secret=segredos["BLOB_CLIENT_SECRET"]
+        )
+    azure_ia.configure_azure(
+        segredos["AZURE_OPENAI_ENDPOINT"].rstrip("/"),
+        segredos["AZURE_OPENAI_DEPLOYMENT_NAME"],
+        credencial
+    )
+
+
+def limites_ia(segredos) -> tuple[int, int]:
+    """
+    Cota do deployment (tokens e requisições por minuto); 0 quando não informada.
+    """
+    return int(segredos.get("AZURE_OPENAI_TPM", 0) or 0), int(segredos.get("AZURE_OPENAI_RPM", 0) or 0)
@@ -0,0 +1,252 @@
+# duplicatas.py
+#
+# Detecção de relatórios duplicados ou quase idênticos (revisões, cópias com outro nome):
+# impressão digital do texto extraído (SHA-256 do texto normalizado + SimHash de shingles)
+# e um índice local para reaproveitar as recomendações do documento já analisado.
+# Só o texto idêntico (com os mesmos números) é reaproveitado por padrão; quase idênticos
+# (SimHash) são opcionais e aparecem no status para revisão.
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from dataclasses import dataclass
+from time import time
+
+import numpy as np
+
+from cache_ia import DIRETORIO_CACHE
+
+TAMANHO_SHINGLE = 5        # palavras por shingle
+LIMIAR_HAMMING = 3         # bits diferentes (de 64) para considerar quase idêntico
+BANDAS = 4                 # faixas de 16 bits para a busca (LSH): distância ≤ 3 garante uma faixa igual
+MIN_PALAVRAS = 50          # textos menores (ex.: PDF escaneado) não são comparados
+ESPERA_MAXIMA = 600        # segundos aguardando a análise do original na mesma execução
+VERSAO = 2                 # incrementar ao mudar a impressão digital (descarta o índice salvo)
+
+EXATA = "exata (texto)"
+APROXIMADA = "aproximada (SimHash)"
+
+_RE_PALAVRA = re.compile(r"\w+")
+
+
+@dataclass
+class Assinatura:
+    sha256: str        # texto normalizado idêntico
+    simhash: int       # 64 bits; textos parecidos diferem em poucos bits
+
+
+class Reserva:
+    """
+    Documento original em análise nesta execução: as duplicatas esperam o seu resultado.
+    """
+
+    def __init__(self, blob: str):
+        self.blob = blob
+        self.recomendacoes: list[str] | None = None
+        self._evento = threading.Event()
+
+    def concluir(self, recomendacoes: list[str] | None):
+        """
+        Libera quem espera; None indica que o original falhou.
+        """
+        self.recomendacoes = recomendacoes
+        self._evento.set()
+
+    @property
+    def concluida(self) -> bool:
+        return self._evento.is_set()
+
+    def esperar(self, timeout: float = None) -> list[str] | None:
+        self._evento.wait(ESPERA_MAXIMA if timeout is None else timeout)
+        return self.recomendacoes
+
+
+@dataclass
+class Correspondencia:
+    """
+    Documento do qual este é duplicata: com as recomendações prontas (índice) ou com a
+    reserva do original ainda em análise.
+    """
+    blob: str
+    tipo: str
+    distancia: int = 0
+    recomendacoes: list[str] | None = None
+    reserva: Reserva | None = None
+
+
+def _palavras(texto: str) -> list[str]:
+    # Sem acentos e caixa; os números ficam (relatórios do mesmo modelo diferem neles)
+    decomposto = unicodedata.normalize("NFKD", texto.casefold())
+    simples = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return _RE_PALAVRA.findall(simples)
+
+
+def impressao_digital(texto: str) -> Assinatura | None:
+    """
+    SHA-256 do texto normalizado (com números) e SimHash (64 bits) dos shingles de palavras
+    sem números: datas e revisões mudam, o texto do modelo não.
+    Retorna None para textos curtos demais.
+    """
+    palavras = _palavras(texto)
+    sha256 = hashlib.sha256(" ".join(palavras).encode("utf-8")).hexdigest()
+    palavras = [p for p in palavras if not p.isdigit()]
+    if len(palavras) < MIN_PALAVRAS:
+        return None
+
+    shingles = {
+        " ".join(palavras[i:i + TAMANHO_SHINGLE]) for i in range(len(palavras) - TAMANHO_SHINGLE + 1)
+    }
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles), dtype=np.uint8
+    ).reshape(-1, 8)
+    # Cada bit do SimHash é o voto da maioria dos shingles
+    votos = np.unpackbits(hashes, axis=1).sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    simhash = int.from_bytes(np.packbits(votos > 0).tobytes(), "big")
+    return Assinatura(sha256, simhash)
+
+
+def distancia(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _bandas(simhash: int) -> list[int]:
+    largura = 64 // BANDAS
+    return [(simhash >> (largura * i)) & ((1 << largura) - 1) for i in range(BANDAS)]
+
+
+def _com_sinal(valor: int) -> int:
+    # SQLite guarda inteiros de 64 bits com sinal
+    return valor - (1 << 64) if valor >= 1 << 63 else valor
+
+
+class IndiceDuplicatas:
+    """
+    Índice persistente (SQLite) das assinaturas dos documentos já analisados e das suas
+    recomendações, por contexto da IA (prompt, deployment e parâmetros), mais as reservas
+    dos originais em análise na execução corrente.
+    """
+
+    def __init__(self, caminho=None, max_idade_dias=90):
+        if caminho is None:
+            os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+            caminho = os.path.join(DIRETORIO_CACHE, "duplicatas.sqlite3")
+        self.max_idade = max_idade_dias * 86400
+        self._lock = threading.Lock()
+        self._exatas: dict[str, Reserva] = {}                # identidade ou sha256 -> reserva
+        self._aproximadas: list[tuple[int, Reserva]] = []    # (simhash, reserva)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        if self._conexao.execute("PRAGMA user_version").fetchone()[0] != VERSAO:
+            # Assinaturas de outra versão não são comparáveis com as novas
+            self._conexao.execute("DROP TABLE IF EXISTS documentos")
+            self._conexao.execute(f"PRAGMA user_version = {VERSAO}")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS documentos ("
+            " contexto TEXT NOT NULL,"
+            " blob TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " simhash INTEGER NOT NULL,"
+            + "".join(f" banda{i} INTEGER NOT NULL," for i in range(BANDAS))
+            + " recomendacoes TEXT NOT NULL,"
+            " criado_em REAL NOT NULL,"
+            " PRIMARY KEY (contexto, blob))"
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_sha256 ON documentos (contexto, sha256)")
+        for i in range(BANDAS):
+            self._conexao.execute(f"CREATE INDEX IF NOT EXISTS idx_banda{i} ON documentos (contexto, banda{i})")
+        self._conexao.execute("DELETE FROM documentos WHERE criado_em < ?", (time() - self.max_idade,))
+        self._conexao.commit()
+
+    # ——— Reservas da execução corrente ———
+
+    def reservar_identidade(self, identidade: str, blob: str) -> tuple[Reserva, bool]:
+        """
+        Reserva por identidade do blob (MD5 da listagem), antes de qualquer download.
+        Retorna (reserva, True) para o primeiro documento e (reserva do original, False) para as cópias.
+        """
+        with self._lock:
+            reserva = self._exatas.get(identidade)
+            if reserva is not None:
+                return reserva, False
+            reserva = self._exatas[identidade] = Reserva(blob)
+            return reserva, True
+
+    def liberar_todas(self):
+        """
+        Fim (ou interrupção) da execução: ninguém fica esperando um original que não virá.
+        """
+        with self._lock:
+            for reserva in list(self._exatas.values()) + [r for _, r in self._aproximadas]:
+                if not reserva.concluida:
+                    reserva.concluir(None)
+            self._exatas.clear()
+            self._aproximadas.clear()
+
+    # ——— Busca ———
+
+    def localizar(self, assinatura: Assinatura, contexto: str, blob: str, persistente: bool = True,
+                  aproximadas: bool = False):
+        """
+        Procura um documento idêntico (ou, com `aproximadas`, quase idêntico): primeiro entre
+        os em análise nesta execução, depois no índice (outros blobs; o mesmo blob alterado
+        não conta como cópia). Sem correspondência, reserva a assinatura para este blob.
+        Retorna (correspondência ou None, reserva própria ou None).
+        """
+        with self._lock:
+            reserva = self._exatas.get("sha256:" + assinatura.sha256)
+            if reserva is not None:
+                return Correspondencia(reserva.blob, EXATA, reserva=reserva), None
+            if aproximadas:
+                for simhash, reserva in self._aproximadas:
+                    d = distancia(simhash, assinatura.simhash)
+                    if d <= LIMIAR_HAMMING:
+                        return Correspondencia(reserva.blob, APROXIMADA, d, reserva=reserva), None
+
+            if persistente:
+                correspondencia = self._consultar(assinatura, contexto, blob, aproximadas)
+                if correspondencia is not None:
+                    return correspondencia, None
+
+            reserva = Reserva(blob)
+            self._exatas["sha256:" + assinatura.sha256] = reserva
+            self._aproximadas.append((assinatura.simhash, reserva))
+            return None, reserva
+
+    def _consultar(self, assinatura, contexto, blob, aproximadas=False) -> Correspondencia | None:
+        linha = self._conexao.execute(
+            "SELECT blob, recomendacoes FROM documentos WHERE contexto = ? AND sha256 = ? AND blob <> ? LIMIT 1",
+            (contexto, assinatura.sha256, blob),
+        ).fetchone()
+        if linha is not None:
+            return Correspondencia(linha[0], EXATA, 0, json.loads(linha[1]))
+        if not aproximadas:
+            return None
+
+        bandas = _bandas(assinatura.simhash)
+        condicao = " OR ".join(f"banda{i} = ?" for i in range(BANDAS))
+        melhor = None
+        for outro_blob, simhash, recomendacoes in self._conexao.execute(
+            f"SELECT blob, simhash, recomendacoes FROM documentos WHERE contexto = ? AND blob <> ? AND ({condicao})",
+            (contexto, blob, *bandas),
+        ):
+            d = distancia(simhash & ((1 << 64) - 1), assinatura.simhash)
+            if d <= LIMIAR_HAMMING and (melhor is None or d < melhor.distancia):
+                melhor = Correspondencia(outro_blob, APROXIMADA, d, json.loads(recomendacoes))
+        return melhor
+
+    def registrar(self, assinatura: Assinatura, contexto: str, blob: str, recomendacoes: list[str]):
+        """
+        Guarda a assinatura e as recomendações de um documento analisado.
+        """
+        with self._lock:
+            self._conexao.execute(
+                f"INSERT OR REPLACE INTO documentos VALUES (?, ?, ?, ?, {', '.join('?' * BANDAS)}, ?, ?)",
+                (
+                    contexto, blob, assinatura.sha256, _com_sinal(assinatura.simhash),
+                    *_bandas(assinatura.simhash),
+                    json.dumps(recomendacoes, ensure_ascii=False), time(),
+                ),
+            )
+            self._conexao.commit()
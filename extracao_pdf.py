@@ -1,10 +1,146 @@
 # extracao_pdf.py
+import atexit
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+
 import fitz
 
-def ler_pdf_bytes(pdf_bytes):
+# ——— Extração em paralelo (processos) para documentos grandes ———
+MIN_PAGINAS_PARALELO = 80        # abaixo disso, extrai na própria thread
+PAGINAS_POR_PARTE = 40           # páginas por tarefa enviada ao pool
+MAX_PROCESSOS = max(1, min(4, (os.cpu_count() or 1)))
+
+# Um pool por número de processos: execuções com configurações diferentes não se afetam
+_pools: dict[int, ProcessPoolExecutor] = {}
+_lock_pools = threading.Lock()
+
+
+@dataclass
+class ResultadoPDF:
+    """
+    Resultado leve da extração: não mantém o documento do PyMuPDF aberto.
+    """
+    texto: str
+    page_count: int
+    offsets: list[int] = field(default_factory=list)   # início de cada página em `texto`
+    tempos: dict = field(default_factory=dict)         # segundos por fase da extração
+
+    def paginas(self) -> list[str]:
+        """
+        Texto de cada página, recortado a partir dos offsets.
+        """
+        fins = self.offsets[1:] + [len(self.texto)]
+        return [self.texto[a:b] for a, b in zip(self.offsets, fins)]
+
+
+def _obter_pool(processos: int):
+    with _lock_pools:
+        if processos not in _pools:
+            # “spawn” evita herdar threads e locks do processo do Streamlit
+            _pools[processos] = ProcessPoolExecutor(
+                max_workers=processos, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pools[processos]
+
+
+@atexit.register
+def _encerrar_pool():
+    for pool in _pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _abrir(origem):
+    if isinstance(origem, str):
+        return fitz.open(origem)
+    return fitz.open("pdf", origem)
+
+
+def _extrair_intervalo(origem, inicio: int, fim: int) -> list[str]:
+    """
+    Extrai o texto das páginas [inicio, fim). Executado nos processos do pool.
+    """
+    with _abrir(origem) as doc:
+        return [doc[i].get_text() for i in range(inicio, fim)]
+
+
+def _extrair_em_processos(origem, page_count: int, processos: int) -> list[str]:
+    # Os processos leem o PDF de um arquivo: bytes em memória vão uma única vez para o disco,
+    # em vez de uma cópia por tarefa
+    temporario = None
+    if not isinstance(origem, str):
+        temporario = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        with temporario:
+            temporario.write(origem)
+        origem = temporario.name
+    try:
+        pool = _obter_pool(processos)
+        partes = [
+            pool.submit(_extrair_intervalo, origem, inicio, min(inicio + PAGINAS_POR_PARTE, page_count))
+            for inicio in range(0, page_count, PAGINAS_POR_PARTE)
+        ]
+        return [pagina for parte in partes for pagina in parte.result()]
+    finally:
+        if temporario is not None:
+            os.unlink(temporario.name)
+
+
+def extrair_pdf(origem, max_paginas: int = None, max_processos: int = None) -> ResultadoPDF:
+    """
+    Extrai o texto de um PDF (caminho, bytes, memoryview ou BytesIO). Documentos com muitas páginas são
+    divididos em intervalos processados em paralelo, em até `max_processos` processos
+    (padrão: MAX_PROCESSOS). O documento é sempre fechado ao final.
+    Com `max_paginas`, só as primeiras páginas são lidas (page_count continua sendo o total).
+    """
+    max_processos = max_processos or MAX_PROCESSOS
+    inicio = perf_counter()
+    # BytesIO é aberto pelo seu buffer (memoryview), sem copiar os bytes
+    if hasattr(origem, "getbuffer"):
+        origem = origem.getbuffer()
+
+    with _abrir(origem) as doc:
+        page_count = doc.page_count
+        tempo_abertura = perf_counter() - inicio
+        if max_paginas is not None:
+            paginas = [doc[i].get_text() for i in range(min(max_paginas, page_count))]
+            processos = 0
+        elif page_count < MIN_PAGINAS_PARALELO or max_processos <= 1:
+            paginas = [pagina.get_text() for pagina in doc]
+            processos = 0
+        else:
+            paginas = None
+            processos = max_processos
+    if paginas is None:
+        paginas = _extrair_em_processos(origem, page_count, processos)
+
+    # ——— Texto final igual ao formato anterior (páginas unidas por “\n”) + offsets ———
+    offsets, posicao = [], 0
+    for pagina in paginas:
+        offsets.append(posicao)
+        posicao += len(pagina) + 1
+    texto = "\n".join(paginas)
+
+    total = perf_counter() - inicio
+    return ResultadoPDF(
+        texto=texto,
+        page_count=page_count,
+        offsets=offsets,
+        tempos={
+            "abertura": tempo_abertura,
+            "extracao": total - tempo_abertura,
+            "total": total,
+            "processos": processos,
+        },
+    )
+
+
+def ler_pdf_bytes(pdf_bytes, max_paginas=None, max_processos=None):
     try:
-        doc = fitz.open("pdf", pdf_bytes)
-        texto = "\n".join(page.get_text() for page in doc)
-        return texto, doc
+        resultado = extrair_pdf(pdf_bytes, max_paginas, max_processos)
+        return resultado.texto, resultado
     except Exception as e:
         return f"[Erro ao ler o PDF: {e}]", None
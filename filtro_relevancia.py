@@ -0,0 +1,198 @@
+# filtro_relevancia.py
+#
+# Pré-filtro local (sem IA) entre a extração do PDF e a chamada ao modelo: pontua os trechos
+# do relatório por título de seção, verbos modais e palavras-chave (PT/EN/ES) e envia só os
+# mais relevantes, com a página de origem, até um orçamento de tokens.
+import re
+import unicodedata
+from dataclasses import dataclass
+
+import azure_ia
+
+# ——— Configuração (entra na chave do cache de recomendações) ———
+ATIVO = True
+ORCAMENTO_TOKENS = 4000          # tokens de trechos enviados ao modelo por documento
+VERSAO = "2"                     # incrementar ao mudar as regras de pontuação
+TOKENS_MAX_TRECHO = 250          # trechos maiores são quebrados em frases
+
+# Padrões aplicados ao texto em minúsculas e sem acentos
+_RE_MODAIS = re.compile(
+    r"\brecomenda-se\b|\brecomendamos\b|\brecomenda(?:m|do|da|dos|das|cao|coes)?\b|"
+    r"\bdeve(?:m|ra|rao)?(?:-se)?\b|\bfaz-se necessari|\be (?:necessario|obrigatorio|imprescindivel|fundamental)\b|"
+    r"\bobrigatori|\bprovidenciar\b|\bexigid|"
+    r"\bshall\b|\bmust\b|\b(?:is|are) required\b|\bit is (?:recommended|necessary|mandatory)\b|"
+    r"\brecommend|\bmandatory\b|"
+    r"\bse recomienda\b|\brecomendaci|\bdebe(?:n|ra|ran)?\b|\bse debe\b|\bes (?:necesario|obligatorio|imprescindible)\b|"
+    r"\bobligatori"
+)
+_RE_ACOES = re.compile(
+    r"\b(?:instal|implant|execut|realiz|monitor|inspec|refor[cz]|corrig|substitu|manten|manter|limp|"
+    r"repair|replac|maintain|implement|reparar|reemplaz|mantener|limpiar)\w*"
+)
+_RE_SECAO_ANEXO = re.compile(
+    r"anexo|apendice|appendix|annex|referencias|references|bibliografia|sumario|indice|table of contents|contents"
+)
+_RE_FRASE = re.compile(r"(?<=[\.;:!?])\s+")
+
+
+@dataclass
+class ResultadoFiltro:
+    """
+    Texto a enviar ao modelo (trechos selecionados ou o texto integral) e a redução obtida.
+    """
+    texto: str
+    offsets: list[int] | None       # offsets de página, apenas quando o texto é o integral
+    tokens_originais: int
+    tokens_enviados: int
+    situacao: str
+    trechos: int = 0
+    paginas: tuple[int, ...] = ()
+
+    @property
+    def reducao(self) -> float:
+        return self.tokens_originais / max(1, self.tokens_enviados)
+
+    def estatisticas(self) -> dict:
+        return {
+            "Tokens do Documento": self.tokens_originais,
+            "Tokens Enviados": self.tokens_enviados,
+            "Pré-filtro": self.situacao,
+            "Redução do Filtro": f"{self.reducao:.1f}x",
+        }
+
+
+def parametros_cache(ativo: bool = None, orcamento: int = None) -> dict:
+    return {
+        "filtro_relevancia": ATIVO if ativo is None else ativo,
+        "orcamento_filtro": orcamento or ORCAMENTO_TOKENS,
+        "versao_filtro": VERSAO,
+    }
+
+
+def _simplificar(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def _dividir_em_trechos(pagina: str, titulo: str = "") -> tuple[list[tuple[str, str]], str]:
+    """
+    Trechos de uma página como (título da seção em que começam, texto): quebra em títulos
+    e linhas em branco, e trechos longos em grupos de frases. `titulo` é a seção que vem da
+    página anterior; retorna também a seção em que a página termina.
+    """
+    trechos = []
+    atual: list[str] = []
+
+    def fechar():
+        texto = "\n".join(atual).strip()
+        atual.clear()
+        if not texto:
+            return
+        if azure_ia.contar_tokens(texto) <= TOKENS_MAX_TRECHO:
+            trechos.append((titulo, texto))
+            return
+        grupo, tokens_grupo = [], 0
+        for frase in _RE_FRASE.split(texto.replace("\n", " ")):
+            tokens = azure_ia.contar_tokens(frase)
+            if grupo and tokens_grupo + tokens > TOKENS_MAX_TRECHO:
+                trechos.append((titulo, " ".join(grupo)))
+                grupo, tokens_grupo = [], 0
+            grupo.append(frase)
+            tokens_grupo += tokens
+        if grupo:
+            trechos.append((titulo, " ".join(grupo)))
+
+    for linha in pagina.split("\n"):
+        if not linha.strip():
+            fechar()
+        elif azure_ia.RE_TITULO.fullmatch(linha):
+            fechar()
+            titulo = linha.strip()
+            atual.append(linha)
+        else:
+            atual.append(linha)
+    fechar()
+    return trechos, titulo
+
+
+def pontuar(titulo: str, texto: str) -> float:
+    """
+    Pontuação de um trecho: modais (“recomenda-se”, “deve-se”, shall, must, debe...) pesam
+    mais, ações técnicas e seções de conclusões somam, anexos e tabelas subtraem.
+    """
+    simples = _simplificar(texto)
+    titulo_simples = _simplificar(titulo)
+    pontos = 2.0 * min(3, len(_RE_MODAIS.findall(simples)))
+    pontos += 0.5 * min(2, len(_RE_ACOES.findall(simples)))
+    if azure_ia.RE_SECAO_PRIORITARIA.search(titulo):
+        pontos += 2.0
+    if _RE_SECAO_ANEXO.search(titulo_simples):
+        pontos -= 3.0
+    # Tabelas e listas de números raramente contêm recomendações
+    digitos = sum(c.isdigit() for c in texto)
+    if digitos > 0.3 * max(1, len(texto.strip())):
+        pontos -= 2.0
+    return pontos
+
+
+def filtrar(texto: str, offsets_paginas: list[int] = None, orcamento: int = None, ativo: bool = None) -> ResultadoFiltro:
+    """
+    Seleciona os trechos mais relevantes até `orcamento` tokens, na ordem original do texto e
+    precedidos da página (“[p. 12]”). Sem nenhum trecho relevante, ou com o filtro desativado
+    (`ativo` falso), devolve o texto integral. Sem argumentos, valem ORCAMENTO_TOKENS e ATIVO.
+    """
+    orcamento = orcamento or ORCAMENTO_TOKENS
+    ativo = ATIVO if ativo is None else ativo
+    tokens_originais = azure_ia.contar_tokens(texto)
+
+    def integral(situacao):
+        return ResultadoFiltro(texto, offsets_paginas, tokens_originais, tokens_originais, situacao)
+
+    if not ativo:
+        return integral("desativado")
+    if tokens_originais <= orcamento:
+        return integral("texto integral (curto)")
+
+    if offsets_paginas:
+        fins = offsets_paginas[1:] + [len(texto)]
+        paginas = [texto[a:b] for a, b in zip(offsets_paginas, fins)]
+    else:
+        paginas = texto.split("\f")
+
+    # ——— Pontua cada trecho, guardando página e posição ———
+    candidatos = []
+    secao = ""
+    for numero, pagina in enumerate(paginas, start=1):
+        trechos, secao = _dividir_em_trechos(pagina, secao)
+        for titulo, trecho in trechos:
+            pontos = pontuar(titulo, trecho)
+            if pontos >= 2.0:
+                candidatos.append((pontos, len(candidatos), numero, trecho))
+    if not candidatos:
+        return integral("texto integral (nenhum trecho relevante)")
+
+    # ——— Melhores trechos até o orçamento, depois de volta à ordem do documento ———
+    escolhidos, tokens_enviados = [], 0
+    for pontos, ordem, numero, trecho in sorted(candidatos, key=lambda c: (-c[0], c[1])):
+        tokens = azure_ia.contar_tokens(trecho)
+        if tokens_enviados + tokens > orcamento:
+            continue
+        escolhidos.append((ordem, numero, trecho))
+        tokens_enviados += tokens
+    if not escolhidos:
+        return integral("texto integral (nenhum trecho relevante)")
+    escolhidos.sort()
+
+    selecionado = "Trechos selecionados do relatório (página entre colchetes):\n\n" + "\n\n".join(
+        f"[p. {numero}] {trecho}" for _, numero, trecho in escolhidos
+    )
+    paginas_usadas = tuple(sorted({numero for _, numero, _ in escolhidos}))
+    return ResultadoFiltro(
+        texto=selecionado,
+        offsets=None,
+        tokens_originais=tokens_originais,
+        tokens_enviados=azure_ia.contar_tokens(selecionado),
+        situacao=f"{len(escolhidos)} trechos de {len(paginas_usadas)} páginas",
+        trechos=len(escolhidos),
+        paginas=paginas_usadas,
+    )
@@ -0,0 +1,296 @@
+# imani_lote.py
+#
+# Processamento em lote (sem Streamlit) de todas as empresas do Excel, ou de um subconjunto,
+# com diário para retomar a execução após uma queda ou falta de cota.
+#
+#   python imani_lote.py projetos.xlsx --saida resultados/
+#   python imani_lote.py projetos.xlsx --empresas "Empresa A" "Empresa B" --diagnostico
+#   python imani_lote.py projetos.xlsx --lote-ia      # Batch API do Azure OpenAI (assíncrono)
+import argparse
+import os
+import sys
+from time import time
+
+import pandas as pd
+
+import azure_ia
+import configuracao
+import filtro_relevancia
+import lote_ia
+import motor
+import saida_incremental
+from armazem_textos import ArmazemTextos
+from cache_ia import CacheRecomendacoes
+from duplicatas import IndiceDuplicatas
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="IMANI – análise de relatórios em lote")
+    parser.add_argument("excel", help="Excel com os projetos")
+    parser.add_argument("--abas", nargs="+", help="Abas a processar (padrão: todas as abas de projetos)")
+    parser.add_argument("--empresas", nargs="+", help="Empresas a processar (padrão: todas)")
+    parser.add_argument("--saida", default=".", help="Diretório dos arquivos gerados")
+    parser.add_argument("--diario", help="Diário para retomada (padrão: <saida>/diario_imani.jsonl)")
+    parser.add_argument("--segredos", help="Arquivo secrets.toml (padrão: .streamlit/secrets.toml)")
+    parser.add_argument("--somente-diagnostico", action="store_true", help="Apenas diagnóstico, sem IA")
+    parser.add_argument("--diagnostico", action="store_true", help="Incluir diagnóstico detalhado")
+    parser.add_argument(
+        "--leitura-diagnostico", choices=["parcial", "metadados", "completa"], default="parcial",
+        help="Quanto de cada PDF ler no --somente-diagnostico"
+    )
+    parser.add_argument("--forcar-atualizacao", action="store_true", help="Ignorar o cache da IA")
+    parser.add_argument("--workers-download", type=int, default=4)
+    parser.add_argument("--workers-ia", type=int, default=4)
+    parser.add_argument(
+        "--sem-duplicatas", action="store_true",
+        help="Não reaproveita a análise de relatórios com texto idêntico"
+    )
+    parser.add_argument(
+        "--duplicatas-aproximadas", action="store_true",
+        help="Reaproveita também relatórios quase idênticos (SimHash); o status indica o original para revisão"
+    )
+    parser.add_argument(
+        "--sem-armazem-textos", action="store_true",
+        help="Baixa e lê todos os PDFs, sem reutilizar os textos já extraídos (ver aquecer_textos.py)"
+    )
+    parser.add_argument("--sem-filtro", action="store_true", help="Envia o texto integral, sem o pré-filtro de trechos")
+    parser.add_argument(
+        "--orcamento-filtro", type=int, default=filtro_relevancia.ORCAMENTO_TOKENS,
+        help="Tokens de trechos relevantes enviados por documento"
+    )
+    parser.add_argument("--tpm", type=int, help="Tokens por minuto do deployment (padrão: AZURE_OPENAI_TPM)")
+    parser.add_argument("--rpm", type=int, help="Requisições por minuto do deployment (padrão: AZURE_OPENAI_RPM)")
+    parser.add_argument(
+        "--formatos", nargs="+", choices=["xlsx", "csv", "parquet"], default=["xlsx"],
+        help="Formatos das planilhas geradas (parquet requer pyarrow)"
+    )
+    parser.add_argument(
+        "--aba-por-empresa", action="store_true",
+        help="No xlsx, uma aba por empresa (em vez de uma única aba com todas as linhas)"
+    )
+    parser.add_argument(
+        "--lote-ia", action="store_true",
+        help="Envia os prompts como jobs da Batch API (mais lento, sem cotas por minuto e mais barato); "
+             "documentos que falharem no lote seguem pela chamada síncrona"
+    )
+    parser.add_argument(
+        "--deployment-lote",
+        help="Deployment do tipo Global Batch (padrão: AZURE_OPENAI_BATCH_DEPLOYMENT ou o deployment normal)"
+    )
+    parser.add_argument(
+        "--intervalo-lote", type=float, default=lote_ia.INTERVALO_POLLING,
+        help="Segundos entre consultas ao status dos jobs do lote"
+    )
+    parser.add_argument("--trace", help="Grava os spans da execução neste arquivo (formato Trace Event)")
+    parser.add_argument(
+        "--max-falhas-ia", type=int, default=10,
+        help="Interrompe após N falhas seguidas da IA (ex.: cota esgotada); a retomada refaz essas linhas"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _argumentos(argv)
+
+    # ——— Configuração (mesmos segredos do app Streamlit) ———
+    segredos = configuracao.carregar_segredos(args.segredos)
+    faltando = configuracao.chaves_faltando(segredos)
+    if faltando:
+        print(f"❌ Variáveis obrigatórias faltando: {', '.join(faltando)}", file=sys.stderr)
+        return 2
+
+    credencial, metodo_auth = configuracao.criar_credencial_blob(segredos)
+    print(f"🔑 Autenticação Blob: {metodo_auth}")
+    container_client = configuracao.conectar_container(segredos, credencial)
+    if not args.somente_diagnostico:
+        # Com Service Principal, a mesma credencial (e seus tokens) serve ao Blob e à IA
+        configuracao.configurar_ia(segredos, credencial if metodo_auth == "Service Principal" else None)
+        tpm, rpm = configuracao.limites_ia(segredos)
+        azure_ia.configurar_limites(
+            tpm=args.tpm if args.tpm is not None else tpm,
+            rpm=args.rpm if args.rpm is not None else rpm,
+            max_concorrencia=args.workers_ia,
+        )
+
+    opcoes = motor.OpcoesAnalise(
+        account_url=segredos["BLOB_ACCOUNT_URL"].rstrip("/"),
+        container_name=segredos["BLOB_CONTAINER_NAME"],
+        deployment_name=segredos["AZURE_OPENAI_DEPLOYMENT_NAME"],
+        somente_diagnostico=args.somente_diagnostico,
+        diagnostico_ativo=args.diagnostico,
+        forcar_atualizacao=args.forcar_atualizacao,
+        workers_download=args.workers_download,
+        workers_ia=args.workers_ia,
+        leitura_diagnostico=args.leitura_diagnostico,
+        filtro_ativo=not args.sem_filtro,
+        orcamento_filtro=args.orcamento_filtro,
+        duplicatas_aproximadas=args.duplicatas_aproximadas,
+    )
+    usar_lote = args.lote_ia and not args.somente_diagnostico
+    if usar_lote:
+        opcoes.deployment_lote = (
+            args.deployment_lote or segredos.get("AZURE_OPENAI_BATCH_DEPLOYMENT") or opcoes.deployment_name
+        )
+
+    os.makedirs(args.saida, exist_ok=True)
+    diario = motor.DiarioExecucao(
+        args.diario or os.path.join(args.saida, "diario_imani.jsonl"), opcoes.contexto()
+    )
+    if diario.arquivado:
+        print(f"⚠️ O diário existente é de outra configuração (modo, leitura, prompt, deployment ou "
+              f"parâmetros) e não será retomado; movido para {diario.arquivado}.")
+    cache = CacheRecomendacoes()
+    # No modo lote, cópias idênticas viram uma única requisição (mesmo prompt): sem índice de duplicatas
+    indice_duplicatas = None if args.sem_duplicatas or usar_lote else IndiceDuplicatas()
+    armazem_textos = None if args.sem_armazem_textos else ArmazemTextos()
+    lote = None
+    if usar_lote:
+        lote = lote_ia.LoteIA(azure_ia.client, opcoes.deployment_lote, os.path.join(args.saida, "lote_ia.json"))
+
+    # ——— Monta os itens de todas as abas/empresas escolhidas ———
+    xls = pd.ExcelFile(args.excel)
+    abas = args.abas or motor.abas_de_projetos(xls.sheet_names)
+    indices = {}
+    itens = []
+    for aba in abas:
+        df = motor.ler_aba_projetos(xls, aba)
+        if args.empresas:
+            df = df[df[motor.COLUNA_EMPRESA].str.strip().isin(args.empresas)]
+        itens_aba, _ = motor.preparar_itens(
+            df, container_client, opcoes, indices, cache, aba=aba, indice_duplicatas=indice_duplicatas
+        )
+        itens.extend(itens_aba)
+
+    pendentes = [item for item in itens if item["chave"] not in diario.concluidas]
+    print(f"📄 {len(itens)} linhas; {len(itens) - len(pendentes)} já concluídas no diário; {len(pendentes)} a processar.")
+
+    # ——— Processa o que falta, registrando cada linha concluída no diário ———
+    # Linhas desta execução (inclusive as com erro, que não vão para o diário) ficam em disco
+    novas = saida_incremental.PlanilhaIncremental()
+    falhas_seguidas = 0
+    interrompido = False
+    tempo_inicio = time()
+    resumo = motor.ResumoExecucao()
+    estimador = motor.estimador_eta(pendentes, opcoes)
+    if lote is not None:
+        def ao_atualizar_lote(jobs):
+            for job in jobs:
+                progresso = f" ({job['concluidas']}/{job['total']})" if job.get("total") else ""
+                print(f"⏳ Lote {job['id']}: {job['status']}{progresso}")
+
+        execucao = motor.executar_em_lote(
+            pendentes, container_client, opcoes, lote, cache, args.intervalo_lote, ao_atualizar_lote,
+            armazem_textos=armazem_textos,
+        )
+    else:
+        execucao = motor.executar(
+            pendentes, container_client, opcoes, cache, indice_duplicatas, armazem_textos=armazem_textos
+        )
+    try:
+        for concluidos, (posicao, item, erro) in enumerate(execucao, start=1):
+            if erro is not None:
+                item = dict(pendentes[posicao], erro=str(erro))
+            resultado, diagnostico, mensagens = motor.montar_linha(item, opcoes)
+            for mensagem in mensagens:
+                print(mensagem, file=sys.stderr)
+            novas.adicionar(item["chave"], {"resultado": resultado, "diagnostico": diagnostico})
+            resumo.registrar(item)
+            estimador.concluir(item["chave"], item.get("duracoes", {}))
+
+            # Linhas com erro não entram no diário: serão refeitas na retomada
+            if "erro" in item or "erro_ia" in item:
+                falhas_seguidas += 1 if "erro_ia" in item else 0
+            else:
+                falhas_seguidas = 0
+                diario.registrar(item["chave"], resultado, diagnostico)
+
+            # No modo lote, o tempo é o dos jobs: sem ETA
+            restante = None if lote is not None else estimador.estimar()
+            eta = f" (ETA {restante / 60:.1f} min)" if restante is not None and concluidos < len(pendentes) else ""
+            print(f"[{concluidos}/{len(pendentes)}] {item['empresa']} – {item['nome_arquivo']}: {resultado['Status']}{eta}")
+            if falhas_seguidas >= args.max_falhas_ia:
+                print(f"⛔ {falhas_seguidas} falhas seguidas da IA; interrompendo. Rode o mesmo comando para retomar.",
+                      file=sys.stderr)
+                interrompido = True
+                break
+    except BaseException:
+        # Erro ou Ctrl+C: as linhas já concluídas estão no diário; o arquivo temporário sai
+        novas.apagar()
+        raise
+    finally:
+        execucao.close()
+        diario.fechar()
+
+    # ——— Saídas: mesmas planilhas do app, na ordem do Excel, lidas linha a linha do disco ———
+    def registros(itens_saida=itens):
+        for item in itens_saida:
+            if item["chave"] in novas:
+                yield novas.obter(item["chave"])
+            elif item["chave"] in diario.concluidas:
+                yield diario.obter(item["chave"])
+            # senão: não processada (execução interrompida)
+
+    def linhas_resultado(itens_saida=itens):
+        return (registro["resultado"] for registro in registros(itens_saida))
+
+    def linhas_diagnostico(itens_saida=itens):
+        omitidas = set(motor.COLUNAS_OMITIDAS_DIAGNOSTICO)
+        return (
+            {k: v for k, v in registro["diagnostico"].items() if k not in omitidas}
+            for registro in registros(itens_saida) if registro["diagnostico"] is not None
+        )
+
+    itens_por_empresa: dict[str, list[dict]] = {}
+    for item in itens:
+        itens_por_empresa.setdefault(item["empresa"], []).append(item)
+
+    def por_empresa(linhas):
+        # Para escrever_xlsx_por_grupo: (empresa, linhas da empresa), na ordem do Excel
+        return lambda: ((empresa, linhas(grupo)) for empresa, grupo in itens_por_empresa.items())
+
+    escritores = {
+        "xlsx": saida_incremental.escrever_xlsx,
+        "csv": saida_incremental.escrever_csv,
+        "parquet": saida_incremental.escrever_parquet,
+    }
+    resultados = sum(1 for _ in registros())
+    tem_diagnostico = next(iter(linhas_diagnostico()), None) is not None
+    for formato in args.formatos:
+        if formato == "xlsx" and args.aba_por_empresa:
+            saida_incremental.escrever_xlsx_por_grupo(
+                os.path.join(args.saida, "resultado_ia.xlsx"), por_empresa(linhas_resultado)
+            )
+            if tem_diagnostico:
+                saida_incremental.escrever_xlsx_por_grupo(
+                    os.path.join(args.saida, "diagnostico_ia.xlsx"), por_empresa(linhas_diagnostico)
+                )
+            continue
+        escritores[formato](os.path.join(args.saida, f"resultado_ia.{formato}"), linhas_resultado)
+        if tem_diagnostico:
+            escritores[formato](os.path.join(args.saida, f"diagnostico_ia.{formato}"), linhas_diagnostico)
+    novas.apagar()
+
+    # Resumo por etapa desta execução (linhas reaproveitadas do diário não entram)
+    extras = {} if args.somente_diagnostico else {"IA": azure_ia.agendador.resumo()}
+    with open(os.path.join(args.saida, "resumo_execucao.json"), "wb") as f:
+        f.write(resumo.para_json(extras))
+    if args.trace:
+        resumo.exportar_trace(args.trace)
+
+    if not args.somente_diagnostico:
+        print("🧮 IA: " + ", ".join(f"{k}: {v}" for k, v in azure_ia.agendador.resumo().items()))
+    if lote is not None and len(lote):
+        print(f"📦 Lote: {len(lote)} requisições em {len(lote.jobs)} job(s), {lote.segundos_espera / 60:.1f} min; "
+              f"{len(lote.falhas)} falhas refeitas pela chamada síncrona.")
+    if armazem_textos is not None and armazem_textos.acertos:
+        print(f"🗃️ {armazem_textos.acertos} PDFs reaproveitaram o texto já extraído (sem download).")
+    if resumo.duplicatas:
+        print(f"🧬 {resumo.duplicatas} documentos reaproveitaram a análise de outro relatório.")
+    if lote is not None and not interrompido:
+        lote.encerrar()
+    print(f"✅ {resultados}/{len(itens)} linhas em {time() - tempo_inicio:.1f} segundos → {args.saida}")
+    return 1 if interrompido else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+# indice_blobs.py
+import re
+import unicodedata
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from difflib import get_close_matches
+from time import perf_counter, time
+
+import pandas as pd
+
+RESULTADOS_POR_PAGINA = 5000     # máximo aceito pelo Blob Storage por página da listagem
+WORKERS_LISTAGEM = 8             # prefixos listados em paralelo
+
+
+def normalizar_nome(nome: str) -> str:
+    """
+    Normaliza um nome de arquivo para comparação: remove acentos, colapsa espaços e ignora maiúsculas.
+    """
+    decomposto = unicodedata.normalize("NFKD", nome)
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", sem_acentos).strip().casefold()
+
+
+class IndiceBlobs:
+    """
+    Índice em memória dos blobs de um prefixo, construído com uma única listagem.
+    """
+
+    def __init__(self, prefixo: str, blobs):
+        inicio = perf_counter()
+        self.prefixo = prefixo
+        self.propriedades = {}
+        self._por_nome: dict[str, list[str]] = {}
+        nomes_normalizados = []
+        for blob in blobs:
+            self.propriedades[blob.name] = blob
+            chave = normalizar_nome(blob.name.split("/")[-1])
+            self._por_nome.setdefault(chave, []).append(blob.name)
+            nomes_normalizados.append(normalizar_nome(blob.name))
+
+        # ——— Todos os nomes normalizados em uma única string, para busca por substring em C ———
+        self._nomes = list(self.propriedades)
+        self._inicios = []
+        posicao = 0
+        for nome in nomes_normalizados:
+            self._inicios.append(posicao)
+            posicao += len(nome) + 1
+        self._texto = "\n".join(nomes_normalizados)
+
+        self.tempo_construcao = perf_counter() - inicio
+        self.inicio = None      # início da listagem (epoch), para o span
+        self.acertos = 0
+        self.falhas = 0
+        self.erro = None
+
+    @classmethod
+    def construir(cls, container_client, prefixo: str) -> "IndiceBlobs":
+        """
+        Lista os blobs do prefixo uma única vez e monta o índice.
+        """
+        inicio_epoch = time()
+        inicio = perf_counter()
+        # Páginas grandes: menos idas e voltas ao serviço em prefixos com milhares de blobs
+        try:
+            paginas = container_client.list_blobs(name_starts_with=prefixo, results_per_page=RESULTADOS_POR_PAGINA)
+        except TypeError:
+            paginas = container_client.list_blobs(name_starts_with=prefixo)
+        blobs = list(paginas)
+        indice = cls(prefixo, blobs)
+        indice.tempo_construcao = perf_counter() - inicio
+        indice.inicio = inicio_epoch
+        return indice
+
+    @classmethod
+    def construir_ou_vazio(cls, container_client, prefixo: str) -> "IndiceBlobs":
+        """
+        Como `construir`, mas uma falha na listagem (argumentos não aceitos pelo cliente, erro
+        HTTP, autenticação, timeout) resulta em um índice vazio, com a mensagem em `erro`.
+        """
+        inicio_epoch = time()
+        inicio = perf_counter()
+        try:
+            return cls.construir(container_client, prefixo)
+        except Exception as e:
+            indice = cls(prefixo, [])
+            indice.erro = str(e) or type(e).__name__
+            indice.tempo_construcao = perf_counter() - inicio
+            indice.inicio = inicio_epoch
+            return indice
+
+    def __len__(self):
+        return len(self._nomes)
+
+    def tabela_nomes(self) -> pd.DataFrame:
+        """
+        Uma linha por nome de arquivo normalizado (colunas prefixo, chave e blobs), para
+        cruzar com as linhas do Excel em um único merge.
+        """
+        return pd.DataFrame({
+            "prefixo": self.prefixo,
+            "chave": list(self._por_nome),
+            "blobs": list(self._por_nome.values()),
+        }, columns=["prefixo", "chave", "blobs"])
+
+    def _buscar_substring(self, chave: str) -> list[str]:
+        encontrados = []
+        pos = self._texto.find(chave)
+        while pos != -1:
+            i = bisect_right(self._inicios, pos) - 1
+            encontrados.append(self._nomes[i])
+            # Continua a busca a partir do próximo nome
+            proximo = self._inicios[i + 1] if i + 1 < len(self._inicios) else len(self._texto)
+            pos = self._texto.find(chave, proximo)
+        return encontrados
+
+    def buscar(self, nome_pdf: str) -> tuple[list[str], str]:
+        """
+        Procura o PDF no índice. Retorna (nomes encontrados, tipo da busca), onde o tipo é
+        “exata”, “substring” ou “não encontrado”. Nomes só parecidos não contam (ver `sugerir`).
+        """
+        chave = normalizar_nome(nome_pdf)
+
+        # 1) Busca exata pelo nome do arquivo normalizado
+        if chave in self._por_nome:
+            self.acertos += 1
+            return list(self._por_nome[chave]), "exata"
+
+        # 2) Nome contido no caminho do blob (comportamento original, sem acentos/maiúsculas)
+        encontrados = self._buscar_substring(chave) if chave else []
+        if encontrados:
+            self.acertos += 1
+            return encontrados, "substring"
+
+        self.falhas += 1
+        return [], "não encontrado"
+
+    def sugerir(self, nome_pdf: str) -> str | None:
+        """
+        Blob com nome parecido (erro de digitação, outra revisão...), só para o diagnóstico:
+        nunca é usado como o arquivo da linha. Percorre todos os nomes do índice.
+        """
+        parecidos = get_close_matches(normalizar_nome(nome_pdf), self._por_nome.keys(), n=1, cutoff=0.9)
+        return self._por_nome[parecidos[0]][0] if parecidos else None
+
+    def resumo(self) -> dict[str, str]:
+        """
+        Estatísticas do índice para o diagnóstico.
+        """
+        return {
+            "Prefixo": self.prefixo,
+            "Blobs Indexados": str(len(self)),
+            "Tempo de Construção (s)": f"{self.tempo_construcao:.3f}",
+            "Acertos": str(self.acertos),
+            "Falhas": str(self.falhas),
+            "Erro na Listagem": self.erro or "-",
+        }
+
+
+def listar_subpastas(container_client, raiz: str) -> set[str]:
+    """
+    Prefixos imediatamente abaixo de `raiz` (ex.: uma pasta por empresa), com uma única
+    listagem hierárquica (delimitador “/”), sem percorrer os blobs de cada pasta.
+    """
+    pastas = set()
+    for item in container_client.walk_blobs(name_starts_with=raiz, delimiter="/"):
+        nome = getattr(item, "prefix", None) or item.name
+        if nome.endswith("/"):
+            pastas.add(nome)
+    return pastas
+
+
+def construir_em_paralelo(container_client, prefixos, workers: int = None) -> dict[str, IndiceBlobs]:
+    """
+    Índices de vários prefixos, listados em paralelo (cada listagem é uma sequência de páginas).
+    Um prefixo cuja listagem falha recebe um índice vazio, com o erro em `indice.erro`; os
+    demais seguem normalmente.
+    """
+    def construir(prefixo):
+        return IndiceBlobs.construir_ou_vazio(container_client, prefixo)
+
+    prefixos = list(prefixos)
+    if not prefixos:
+        return {}
+    with ThreadPoolExecutor(
+        max_workers=min(len(prefixos), workers or WORKERS_LISTAGEM), thread_name_prefix="imani-listagem"
+    ) as executor:
+        return dict(zip(prefixos, executor.map(construir, prefixos)))
@@ -0,0 +1,245 @@
+# lote_ia.py
+#
+# Modo “Batch API” do Azure OpenAI para execuções grandes e não interativas: os prompts da
+# execução vão para arquivos JSONL, cada arquivo vira um job (client.batches), o job é
+# acompanhado por polling e as respostas voltam para cada documento pelo custom_id.
+# Os jobs rodam fora das cotas por minuto do deployment síncrono, com custo menor.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from time import monotonic, sleep, time
+
+import azure_ia
+import transferencia_blob
+
+# Limites do Azure OpenAI por arquivo de entrada (com folga)
+MAX_REQUISICOES_POR_JOB = 50000
+MAX_BYTES_POR_JOB = 180 * 1024 * 1024
+JANELA_CONCLUSAO = "24h"
+INTERVALO_POLLING = 30           # segundos entre consultas ao status do job
+STATUS_FINAIS = {"completed", "failed", "expired", "cancelled"}
+
+
+def identificador(prompt: list[dict], deployment: str) -> str:
+    """
+    custom_id determinístico: prompts idênticos (inclusive de documentos duplicados) viram
+    uma única requisição, e uma nova execução reencontra as requisições de um job já enviado.
+    """
+    bruto = json.dumps([deployment, prompt, azure_ia.PARAMETROS_GERACAO], ensure_ascii=False, sort_keys=True)
+    return "imani-" + hashlib.sha256(bruto.encode("utf-8")).hexdigest()[:32]
+
+
+class LoteIA:
+    """
+    Requisições de uma execução em modo lote. `adicionar` grava cada prompt em JSONL (em disco,
+    não em memória); `processar` envia os jobs, espera e lê as respostas.
+
+    O estado dos jobs enviados fica em `caminho_estado`: se a execução cair durante a espera,
+    a próxima reaproveita os jobs em vez de reenviar os prompts.
+    """
+
+    def __init__(self, client, deployment: str, caminho_estado: str = None):
+        self.client = client
+        self.deployment = deployment
+        self.caminho_estado = caminho_estado
+        self._ids: dict[str, int] = {}              # custom_id -> índice do arquivo
+        self._arquivos: list[dict] = []             # {"caminho", "requisicoes", "bytes"}
+        self._respostas: dict[str, dict] = {}       # custom_id -> body da resposta
+        self.falhas: dict[str, str] = {}            # custom_id -> erro
+        self.jobs: list[dict] = self._ler_estado()
+        self.inicio_envio = None
+        self.segundos_espera = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, custom_id):
+        return custom_id in self._ids
+
+    # ——— Estado dos jobs enviados ———
+
+    def _ler_estado(self) -> list[dict]:
+        if not self.caminho_estado or not os.path.exists(self.caminho_estado):
+            return []
+        try:
+            with open(self.caminho_estado, encoding="utf-8") as f:
+                return json.load(f).get("jobs", [])
+        except (OSError, ValueError):
+            return []
+
+    def _gravar_estado(self):
+        if not self.caminho_estado:
+            return
+        temporario = self.caminho_estado + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"deployment": self.deployment, "jobs": self.jobs}, f)
+        os.replace(temporario, self.caminho_estado)
+
+    def encerrar(self):
+        """
+        Fim da execução (respostas já gravadas): apaga os arquivos dos jobs no Azure, que ocupam
+        a cota de armazenamento do recurso, e o estado.
+        """
+        for job in self.jobs:
+            for file_id in (job.get("arquivo"), job.get("saida"), job.get("erros")):
+                if file_id:
+                    try:
+                        self.client.files.delete(file_id)
+                    except Exception:
+                        pass
+        self.jobs = []
+        if self.caminho_estado and os.path.exists(self.caminho_estado):
+            os.unlink(self.caminho_estado)
+
+    # ——— Montagem dos arquivos JSONL ———
+
+    def adicionar(self, texto: str) -> str:
+        """
+        Registra o prompt de extração para `texto` e retorna o seu custom_id (pode ser chamada
+        de várias threads).
+        """
+        prompt = azure_ia.montar_prompt(texto)
+        custom_id = identificador(prompt, self.deployment)
+        linha = (json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/chat/completions",
+            "body": {"model": self.deployment, "messages": prompt, **azure_ia.PARAMETROS_GERACAO},
+        }, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if custom_id not in self._ids:
+                self._gravar_linha(custom_id, linha)
+        return custom_id
+
+    def _gravar_linha(self, custom_id: str, linha: bytes):
+        # Novo arquivo (novo job) ao atingir os limites de requisições ou de bytes
+        atual = self._arquivos[-1] if self._arquivos else None
+        if (atual is None or atual["requisicoes"] >= MAX_REQUISICOES_POR_JOB
+                or atual["bytes"] + len(linha) > MAX_BYTES_POR_JOB):
+            descritor, caminho = tempfile.mkstemp(suffix=".jsonl", prefix="imani-lote-", dir=transferencia_blob.DIRETORIO_TEMP)
+            os.close(descritor)
+            atual = {"caminho": caminho, "requisicoes": 0, "bytes": 0}
+            self._arquivos.append(atual)
+        with open(atual["caminho"], "ab") as f:
+            f.write(linha)
+        atual["requisicoes"] += 1
+        atual["bytes"] += len(linha)
+        self._ids[custom_id] = len(self._arquivos) - 1
+
+    def _limpar_arquivos(self):
+        for arquivo in self._arquivos:
+            if os.path.exists(arquivo["caminho"]):
+                os.unlink(arquivo["caminho"])
+
+    # ——— Envio, polling e leitura dos resultados ———
+
+    def _enviar(self):
+        """
+        Um job por arquivo JSONL, exceto quando um job já enviado (estado) cobre todas as
+        requisições do arquivo.
+        """
+        enviados = [job for job in self.jobs if job.get("status") not in ("failed", "expired", "cancelled")]
+        for indice, arquivo in enumerate(self._arquivos):
+            ids = {c for c, i in self._ids.items() if i == indice}
+            if any(ids <= set(job["ids"]) for job in enviados):
+                continue
+            with open(arquivo["caminho"], "rb") as f:
+                entrada = self.client.files.create(file=f, purpose="batch")
+            job = self.client.batches.create(
+                input_file_id=entrada.id, endpoint="/chat/completions", completion_window=JANELA_CONCLUSAO
+            )
+            self.jobs.append({"id": job.id, "arquivo": entrada.id, "ids": sorted(ids), "status": job.status})
+            self._gravar_estado()
+        self._limpar_arquivos()
+
+    def _linhas_do_arquivo(self, file_id):
+        if not file_id:
+            return
+        try:
+            conteudo = self.client.files.content(file_id)
+        except Exception:
+            # Arquivo expirado ou apagado: as requisições ficam sem resposta (caminho síncrono)
+            return
+        texto = conteudo.text if hasattr(conteudo, "text") else conteudo.read().decode("utf-8")
+        for linha in texto.splitlines():
+            if linha.strip():
+                yield json.loads(linha)
+
+    def _ler_resultados(self, job):
+        for registro in self._linhas_do_arquivo(job.output_file_id):
+            self._registrar(registro)
+        for registro in self._linhas_do_arquivo(job.error_file_id):
+            self._registrar(registro)
+
+    def _registrar(self, registro: dict):
+        custom_id = registro.get("custom_id")
+        resposta = registro.get("response") or {}
+        if resposta.get("status_code") == 200 and not registro.get("error"):
+            self._respostas[custom_id] = resposta.get("body") or {}
+            self.falhas.pop(custom_id, None)
+        elif custom_id not in self._respostas:
+            erro = registro.get("error") or (resposta.get("body") or {}).get("error") or {}
+            self.falhas[custom_id] = erro.get("message") if isinstance(erro, dict) else str(erro)
+
+    def processar(self, intervalo: float = None, ao_atualizar=None):
+        """
+        Envia os jobs e espera todos terminarem. `ao_atualizar(jobs)` recebe o status de cada
+        job a cada consulta. Requisições sem resposta ficam em `falhas` (para o caminho síncrono).
+        """
+        if not self._ids:
+            return
+        intervalo = INTERVALO_POLLING if intervalo is None else intervalo
+        self.inicio_envio = time()
+        inicio = monotonic()
+        self._enviar()
+        relevantes = [job for job in self.jobs if set(job["ids"]) & self._ids.keys()]
+        pendentes = list(relevantes)
+        while pendentes:
+            for registro in list(pendentes):
+                job = self.client.batches.retrieve(registro["id"])
+                registro["status"] = job.status
+                contagem = getattr(job, "request_counts", None)
+                if contagem is not None:
+                    registro["concluidas"] = getattr(contagem, "completed", 0)
+                    registro["total"] = getattr(contagem, "total", 0)
+                if job.status in STATUS_FINAIS:
+                    # Jobs expirados/cancelados ainda podem ter um arquivo de saída parcial
+                    registro.update(saida=job.output_file_id, erros=job.error_file_id)
+                    self._ler_resultados(job)
+                    pendentes.remove(registro)
+            self._gravar_estado()
+            if ao_atualizar is not None:
+                ao_atualizar(relevantes)
+            if pendentes:
+                sleep(intervalo)
+        self.segundos_espera = monotonic() - inicio
+        for custom_id in self._ids:
+            if custom_id not in self._respostas and custom_id not in self.falhas:
+                estados = ", ".join(sorted({job["status"] for job in relevantes}))
+                self.falhas[custom_id] = f"Sem resposta no lote ({estados})"
+
+    def resposta(self, custom_id: str) -> tuple[list[str], dict] | None:
+        """
+        (recomendações, info no formato de azure_ia._chamar_modelo) ou None se a requisição falhou.
+        """
+        corpo = self._respostas.get(custom_id)
+        if corpo is None:
+            return None
+        escolhas = corpo.get("choices") or [{}]
+        uso = corpo.get("usage") or {}
+        info = {
+            "inicio": self.inicio_envio,
+            "segundos_prompt": 0.0,
+            "segundos_modelo": self.segundos_espera,
+            "caracteres": 0,
+            "tokens_prompt": uso.get("prompt_tokens") or 0,
+            "tokens_resposta": uso.get("completion_tokens") or 0,
+            "tentativas": 1,
+            "throttles": 0,
+            "espera_throttle": 0.0,
+            "espera_cota": 0.0,
+        }
+        return azure_ia.interpretar_resposta((escolhas[0].get("message") or {}).get("content")), info
@@ -1,20 +1,32 @@
 # main.py
 
+import hashlib
+import queue
+import threading
 import streamlit as st
 import pandas as pd
-import fitz
+from collections import deque
 from io import BytesIO
-from time import time
-from urllib.parse import quote_plus
+from time import perf_counter, time
+
+import configuracao
+import extracao_pdf
+import filtro_relevancia
+import motor
+import saida_incremental
+import transferencia_blob
+from armazem_textos import ArmazemTextos
+from cache_ia import CacheRecomendacoes
+from duplicatas import IndiceDuplicatas
+import azure_ia
 
-from azure.storage.blob import BlobServiceClient
-# Changed from azure.identity import ClientSecretCredential, DefaultAzureCredential
-# to import from st.secrets directly for credential handling
-from azure.identity import ClientSecretCredential, DefaultAzureCredential, UsernamePasswordCredential # Import all necessary credentials
+inicio_rerun = perf_counter()
 
-from extracao_pdf import ler_pdf_bytes
-from utilidades import extrair_data, extrair_empresa, gerar_diagnostico
-import azure_ia
+# ——— Resultados ao vivo durante a execução ———
+LINHAS_AO_VIVO = 50              # últimas linhas concluídas exibidas durante a execução
+INTERVALO_PARCIAL = 30           # segundos entre atualizações do download parcial
+DOCUMENTOS_EM_STREAMING = 8      # documentos em análise com a resposta parcial exibida
+TODAS_AS_EMPRESAS = "📚 Todas as empresas"
 
 # ================================
 # Configuração inicial do Streamlit
@@ -27,6 +39,155 @@ st.title("IMANI: Analisador de Relatórios utilizando IA")
 # ================================
 somente_diagnostico = st.sidebar.checkbox("🩺 Executar apenas Diagnóstico (sem IA)", value=False)
 
+# ——— No diagnóstico, lê o mínimo possível de cada PDF ———
+LEITURAS_DIAGNOSTICO = {
+    "Parcial (início do PDF)": "parcial",
+    "Somente metadados (sem download)": "metadados",
+    "Completa": "completa",
+}
+leitura_diagnostico = LEITURAS_DIAGNOSTICO[st.sidebar.radio(
+    "Leitura dos PDFs no diagnóstico", list(LEITURAS_DIAGNOSTICO), index=0, disabled=not somente_diagnostico,
+    help="Parcial: baixa só o início do arquivo e lê as primeiras páginas (PDFs grandes não "
+         "linearizados são baixados inteiros, para contar as páginas). "
+         "Metadados: usa apenas tamanho e data da listagem, sem baixar nada."
+)]
+
+# ——— Concorrência do pipeline (download / IA); limitada pelas cotas do Azure ———
+with st.sidebar.expander("⚙️ Desempenho"):
+    workers_download = st.number_input("Downloads simultâneos", min_value=1, max_value=32, value=4)
+    workers_ia = st.number_input("Chamadas simultâneas à IA", min_value=1, max_value=32, value=4)
+    max_concorrencia_download = st.number_input(
+        "Faixas paralelas por download", min_value=1, max_value=16, value=transferencia_blob.MAX_CONCORRENCIA
+    )
+    limite_memoria_download = st.number_input(
+        "Limite em memória por PDF (MB)", min_value=1, max_value=1024,
+        value=transferencia_blob.LIMITE_MEMORIA // (1024 * 1024),
+        help="PDFs maiores são baixados para um arquivo temporário em disco."
+    ) * 1024 * 1024
+    max_processos_extracao = st.number_input(
+        "Processos para extrair PDFs grandes", min_value=1, max_value=16, value=extracao_pdf.MAX_PROCESSOS,
+        help=f"Usados em documentos com {extracao_pdf.MIN_PAGINAS_PARALELO}+ páginas."
+    )
+    limite_tokens_bloco = st.number_input(
+        "Tokens por bloco (relatórios grandes)", min_value=1000, max_value=120000,
+        value=azure_ia.LIMITE_TOKENS_BLOCO, step=1000
+    )
+    workers_blocos = st.number_input(
+        "Blocos simultâneos por documento", min_value=1, max_value=16, value=azure_ia.WORKERS_BLOCOS
+    )
+    priorizar_conclusoes = st.checkbox(
+        "Priorizar conclusões (parar cedo)", value=azure_ia.PRIORIZAR_CONCLUSOES,
+        help="Envia primeiro os blocos de conclusões/recomendações e não processa o resto se já houver resultado."
+    )
+    filtro_ativo = st.checkbox(
+        "Pré-filtro de trechos relevantes", value=filtro_relevancia.ATIVO,
+        help="Envia à IA só os trechos com recomendações prováveis (conclusões, “recomenda-se”, "
+             "“deve-se”, shall, must, debe...), com a página de origem. Sem trechos relevantes, envia o texto integral."
+    )
+    orcamento_filtro = st.number_input(
+        "Tokens de trechos por documento", min_value=500, max_value=120000,
+        value=filtro_relevancia.ORCAMENTO_TOKENS, step=500, disabled=not filtro_ativo
+    )
+    respostas_em_streaming = st.checkbox(
+        "Mostrar respostas da IA em tempo real", value=True,
+        help="Recebe a resposta do modelo em streaming e exibe cada recomendação assim que ela é gerada."
+    )
+
+# ——— Cota do deployment do Azure OpenAI (0 = desconhecida); padrão vem dos segredos ———
+with st.sidebar.expander("🚦 Limites do Azure OpenAI"):
+    tpm_padrao, rpm_padrao = configuracao.limites_ia(st.secrets) if st.secrets else (0, 0)
+    limite_tpm = st.number_input("Tokens por minuto (TPM)", min_value=0, value=tpm_padrao, step=1000)
+    limite_rpm = st.number_input("Requisições por minuto (RPM)", min_value=0, value=rpm_padrao, step=10)
+azure_ia.configurar_limites(tpm=limite_tpm, rpm=limite_rpm, max_concorrencia=workers_ia)
+
+# ——— Cache local de recomendações (por blob, prompt, deployment e parâmetros) ———
+forcar_atualizacao = st.sidebar.checkbox(
+    "♻️ Forçar atualização (ignorar cache da IA)", value=False,
+    help="Reenvia todos os PDFs para a IA, mesmo que o blob e o prompt não tenham mudado."
+)
+
+
+detectar_duplicatas = st.sidebar.checkbox(
+    "🧬 Detectar duplicatas", value=True,
+    help="Relatórios com texto idêntico (cópias com outro nome) reaproveitam a análise de um já feito."
+)
+duplicatas_aproximadas = st.sidebar.checkbox(
+    "🔎 Reaproveitar quase idênticos", value=False, disabled=not detectar_duplicatas,
+    help="Relatórios quase idênticos (revisões, mesmo modelo com outros números) também reaproveitam "
+         "a análise; o status indica o original para revisão."
+)
+
+
+@st.cache_resource
+def obter_cache_ia():
+    return CacheRecomendacoes()
+
+
+@st.cache_resource
+def obter_indice_duplicatas():
+    return IndiceDuplicatas()
+
+
+# ——— Textos já extraídos (por container, blob e ETag): sem novo download nem leitura do PDF ———
+reutilizar_textos = st.sidebar.checkbox(
+    "🗃️ Reutilizar textos extraídos", value=True,
+    help="PDFs já lidos, e não alterados desde então, não são baixados nem lidos de novo."
+)
+
+
+@st.cache_resource
+def obter_armazem_textos():
+    return ArmazemTextos()
+
+
+# ================================
+# Caches entre reruns: o Streamlit reexecuta o script a cada interação
+# ================================
+# Funções cacheadas registram aqui quando realmente executam (rerun “frio”)
+recalculos: list[str] = []
+
+
+@st.cache_resource(show_spinner=False)
+def recurso_credencial_blob(segredos: tuple):
+    recalculos.append("credencial")
+    return configuracao.criar_credencial_blob(dict(segredos))
+
+
+@st.cache_resource(show_spinner=False)
+def recurso_cliente_ia(segredos: tuple):
+    recalculos.append("cliente IA")
+    credencial = None
+    if dict(segredos)["BLOB_AUTH_METHOD"].lower() == "service_principal":
+        # Mesma credencial do Blob: os tokens AAD são reaproveitados
+        credencial, _ = recurso_credencial_blob(segredos)
+    configuracao.configurar_ia(dict(segredos), credencial)
+    return azure_ia.client
+
+
+@st.cache_resource(show_spinner=False)
+def recurso_container(segredos: tuple):
+    recalculos.append("container")
+    credencial, _ = recurso_credencial_blob(segredos)
+    return configuracao.conectar_container(dict(segredos), credencial)
+
+
+@st.cache_data(show_spinner=False)
+def ler_planilha(hash_conteudo: str, _conteudo: bytes):
+    """
+    Abas e aba informativa do Excel, em cache pelo hash do conteúdo enviado.
+    """
+    recalculos.append("planilha")
+    xls = pd.ExcelFile(BytesIO(_conteudo))
+    abas = xls.sheet_names
+    aba_info = motor.ler_aba_informativa(xls, abas[0]) if len(abas) > 1 else None
+    return abas, aba_info
+
+
+@st.cache_data(show_spinner=False)
+def ler_projetos(hash_conteudo: str, _conteudo: bytes, aba: str):
+    recalculos.append(f"aba {aba}")
+    return motor.ler_aba_projetos(pd.ExcelFile(BytesIO(_conteudo)), aba)
+
 # ===================================
 # 1. Expander “Sobre o IMANI”
 # ===================================
@@ -74,14 +235,7 @@ if not st.secrets:
 # ===================================
 # 4. Validação das chaves obrigatórias em st.secrets
 # ===================================
-chaves_obrigatorias = [
-    "AZURE_OPENAI_ENDPOINT",
-    "AZURE_OPENAI_DEPLOYMENT_NAME",
-    "BLOB_ACCOUNT_URL",
-    "BLOB_CONTAINER_NAME",
-    "BLOB_AUTH_METHOD"
-]
-faltando = [c for c in chaves_obrigatorias if c not in st.secrets]
+faltando = configuracao.chaves_faltando(st.secrets)
 if faltando:
     st.error(f"❌ Variáveis obrigatórias faltando nos segredos do Streamlit: {', '.join(faltando)}")
     st.stop()
@@ -89,10 +243,11 @@ if faltando:
 # ===================================
 # 5. Configurar Azure OpenAI
 # ===================================
-azure_endpoint = st.secrets["AZURE_OPENAI_ENDPOINT"].rstrip("/")
+segredos = tuple(sorted((chave, str(valor)) for chave, valor in st.secrets.items()))
 deployment_name = st.secrets["AZURE_OPENAI_DEPLOYMENT_NAME"]
 try:
-    azure_ia.configure_azure(azure_endpoint, deployment_name)
+    azure_ia.client = recurso_cliente_ia(segredos)
+    azure_ia.deployment = deployment_name
 except Exception as e:
     st.error(f"❌ Erro ao configurar Azure OpenAI: {e}")
     st.stop()
@@ -108,46 +263,15 @@ else:
 # ===================================
 account_url = st.secrets["BLOB_ACCOUNT_URL"].rstrip("/")
 container_name = st.secrets["BLOB_CONTAINER_NAME"]
-auth_method = st.secrets["BLOB_AUTH_METHOD"].lower()
 
 try:
-    if auth_method == "service_principal":
-        client_id = st.secrets.get("BLOB_CLIENT_ID", "")
-        client_secret = st.secrets.get("BLOB_CLIENT_SECRET", "")
-        tenant_id = st.secrets.get("BLOB_TENANT_ID", "")
-        if not client_id or not client_secret or not tenant_id:
-            raise KeyError("BLOB_CLIENT_ID, BLOB_CLIENT_SECRET e BLOB_TENANT_ID devem estar nos segredos.")
-        blob_credential = ClientSecretCredential(
-            tenant_id=tenant_id,
-            client_id=client_id,
-            client_secret=client_secret
-        )
-        st.sidebar.info("🔑 Autenticação Blob: Service Principal")
-
-    elif auth_method == "username_password":
-        username = st.secrets.get("BLOB_USERNAME", "")
-        password = st.secrets.get("BLOB_PASSWORD", "")
-        tenant_id = st.secrets.get("BLOB_TENANT_ID", "")
-        if not username or not password or not tenant_id:
-            raise KeyError("BLOB_USERNAME, BLOB_PASSWORD e BLOB_TENANT_ID devem estar nos segredos.")
-        blob_credential = UsernamePasswordCredential( # Correctly import UsernamePasswordCredential
-            username=username,
-            password=password,
-            tenant_id=tenant_id
-        )
-        st.sidebar.info("🔑 Autenticação Blob: Usuário/Senha")
-
-    else:  # azure_cli
-        blob_credential = DefaultAzureCredential()
-        st.sidebar.info("🔑 Autenticação Blob: Azure CLI (DefaultAzureCredential) - Pode exigir autenticação no ambiente de deploy.")
+    _, metodo_auth = recurso_credencial_blob(segredos)
+    if metodo_auth.startswith("Azure CLI"):
+        st.sidebar.info(f"🔑 Autenticação Blob: {metodo_auth} - Pode exigir autenticação no ambiente de deploy.")
+    else:
+        st.sidebar.info(f"🔑 Autenticação Blob: {metodo_auth}")
 
-    # Instancia o BlobServiceClient e obtém o container_client
-    blob_service_client = BlobServiceClient(
-        account_url=account_url,
-        credential=blob_credential
-    )
-    container_client = blob_service_client.get_container_client(container_name)
-    container_client.get_container_properties()  # Verificação de existência
+    container_client = recurso_container(segredos)
     st.sidebar.success(f"✅ Conectado ao container `{container_name}`")
     st.session_state.container_client = container_client
 
@@ -174,174 +298,233 @@ if not uploaded_file:
 # 8. Processar o Excel e rodar a análise (com ou sem IA)
 # ===================================
 try:
-    xls = pd.ExcelFile(uploaded_file)
-    abas = xls.sheet_names
+    # ——— Excel em cache pelo hash do conteúdo: reruns não relêem a planilha ———
+    conteudo_excel = uploaded_file.getvalue()
+    hash_excel = hashlib.sha256(conteudo_excel).hexdigest()
+    abas, aba_info = ler_planilha(hash_excel, conteudo_excel)
+    aba_escolhida = st.selectbox("Escolha a aba para analisar:", motor.abas_de_projetos(abas), index=0)
 
     # Se houver mais de uma aba, a primeira (índice 0) é apenas informativa
-    if len(abas) > 1:
-        aba_escolhida = st.selectbox("Escolha a aba para analisar:", abas[1:], index=0)
-
-        # ——— Montamos o DataFrame da aba “informativa” (índice 0) removendo NaNs e a última coluna ———
-        aba_info = pd.read_excel(xls, sheet_name=abas[0])
-        aba_info = aba_info.dropna(how="all", axis=0).dropna(how="all", axis=1)
-        # Remove a última coluna inteira (conforme você pediu)
-        if aba_info.shape[1] > 1:
-            aba_info = aba_info.iloc[:, :-1]
-        aba_info = aba_info.astype(str)
-
+    if aba_info is not None:
         with st.expander("ℹ️ Conteúdo da primeira aba (informativa)"):
             st.dataframe(aba_info, use_container_width=True)
 
-    else:
-        aba_escolhida = st.selectbox("Escolha a aba para analisar:", abas, index=0)
-
-    # ——— Identifica, na aba escolhida, qual linha contém o cabeçalho “Empresa” ———
-    df = pd.read_excel(xls, sheet_name=aba_escolhida, header=None)
-    for i in range(10):
-        if df.iloc[i].astype(str).str.contains("Empresa").any():
-            df.columns = df.iloc[i].astype(str).str.strip()
-            df = df[i + 1 :].reset_index(drop=True)
-            break
-
-    # ——— Limpa colunas “Unnamed” e converte tudo para string ———
-    df = df.loc[:, ~df.columns.astype(str).str.contains("^Unnamed", na=False)]
-    df = df.dropna(axis=1, how="all")
-    df = df.astype(str)
-
-    empresa_col = "Empresa"
-    arquivo_col = "Nome do arquivo salvo"
-    empresas_disponiveis = sorted(df[empresa_col].dropna().unique())
-    empresa_selecionada = st.selectbox("Selecione a empresa para análise:", empresas_disponiveis)
+    # ——— Identifica o cabeçalho “Empresa” e limpa a aba escolhida ———
+    df = ler_projetos(hash_excel, conteudo_excel, aba_escolhida)
+
+    empresas_disponiveis = sorted(df[motor.COLUNA_EMPRESA].dropna().unique())
+    # “Todas as empresas”: uma única execução (e uma planilha com uma aba por empresa)
+    empresa_selecionada = st.selectbox(
+        "Selecione a empresa para análise:", [TODAS_AS_EMPRESAS] + empresas_disponiveis,
+        index=1 if empresas_disponiveis else 0
+    )
+    todas_as_empresas = empresa_selecionada == TODAS_AS_EMPRESAS
+
+    # ——— Tempo de preparação deste rerun (frio = algum cache foi recalculado) ———
+    tempo_rerun = perf_counter() - inicio_rerun
+    historico = st.session_state.setdefault("tempos_rerun", [])
+    historico.append(("frio" if recalculos else "quente", tempo_rerun))
+    del historico[:-10]
+    st.sidebar.caption(
+        f"⏱️ Rerun {'frio' if recalculos else 'quente'}: **{tempo_rerun:.2f}s**"
+        + (f" (recalculado: {', '.join(recalculos)})" if recalculos else "")
+    )
+    for tipo in ("frio", "quente"):
+        tempos = [t for k, t in historico if k == tipo]
+        if tempos:
+            st.sidebar.caption(f"Média dos reruns {tipo}s: {sum(tempos) / len(tempos):.2f}s ({len(tempos)})")
 
     # ——— Definimos um botão “Iniciar Análise” (ou “Somente Diagnóstico”) ———
     if st.button("🔍 Iniciar Análise"):
 
         st.write("📄 Processando... aguarde alguns segundos 🙂")
 
-        df_filtrado = df[df[empresa_col] == empresa_selecionada].copy()
+        if todas_as_empresas:
+            df_filtrado = df[df[motor.COLUNA_EMPRESA].isin(empresas_disponiveis)].copy()
+        else:
+            df_filtrado = df[df[motor.COLUNA_EMPRESA] == empresa_selecionada].copy()
         container_client = st.session_state.container_client
+        opcoes = motor.OpcoesAnalise(
+            account_url=account_url,
+            container_name=container_name,
+            deployment_name=deployment_name,
+            somente_diagnostico=somente_diagnostico,
+            diagnostico_ativo=diagnostico_ativo,
+            forcar_atualizacao=forcar_atualizacao,
+            workers_download=workers_download,
+            workers_ia=workers_ia,
+            leitura_diagnostico=leitura_diagnostico,
+            max_concorrencia_download=max_concorrencia_download,
+            limite_memoria_download=limite_memoria_download,
+            max_processos_extracao=max_processos_extracao,
+            limite_tokens_bloco=limite_tokens_bloco,
+            workers_blocos=workers_blocos,
+            priorizar_conclusoes=priorizar_conclusoes,
+            filtro_ativo=filtro_ativo,
+            orcamento_filtro=orcamento_filtro,
+            duplicatas_aproximadas=duplicatas_aproximadas,
+        )
 
-        resultados: list[dict[str, str]] = []
-        diagnosticos: list[dict[str, str]] = []
         total = len(df_filtrado)
+        resumo = motor.ResumoExecucao()
+
+        # ——— Linhas gravadas em disco à medida que concluem (apaga as da execução anterior) ———
+        for planilha in st.session_state.pop("saidas_anteriores", []):
+            planilha.apagar()
+        saida_resultados = saida_incremental.PlanilhaIncremental()
+        saida_diagnostico = saida_incremental.PlanilhaIncremental(omitir=motor.COLUNAS_OMITIDAS_DIAGNOSTICO)
+        st.session_state.saidas_anteriores = [saida_resultados, saida_diagnostico]
 
         # ——— Barra de progresso e placeholder para status + ETA ———
         barra = st.progress(0)
         status_text = st.empty()
+        respostas_ao_vivo = st.empty()
+        tabela_ao_vivo = st.empty()
+        download_parcial = st.empty()
+        recentes = deque(maxlen=LINHAS_AO_VIVO)
+        ultimo_parcial = time()
 
         tempo_inicio = time()
 
-        for i, (_, row) in enumerate(df_filtrado.iterrows()):
-            empresa = row[empresa_col].strip()
-            nome_arquivo = row[arquivo_col].strip()
-            nome_pdf = f"{nome_arquivo}.pdf"
-            prefixo = f"Relatórios Técnicos/{empresa}/Relatórios/"
-
-            # ——— Cálculo de ETA ———
-            elapsed = time() - tempo_inicio
-            avg_per_item = elapsed / (i + 1)
-            remaining = avg_per_item * (total - (i + 1))
-            remaining_h = int(remaining // 3600)
-            remaining_m = int((remaining % 3600) // 60)
-            remaining_s = int(remaining % 60)
-            eta_str = f"{remaining_h:02d}:{remaining_m:02d}:{remaining_s:02d}"
-
-            status_text.markdown(
-                f"🔄 Processando **{empresa} – {nome_arquivo}** (`{i+1}`/`{total}`)  \n"
-                f"⏱️ Tempo decorrido: **{elapsed:.1f}s** |   ⏳ ETA: **{eta_str}**"
-            )
+        cache_ia = obter_cache_ia()
+        cache_ia.acertos = cache_ia.falhas = 0
+        azure_ia.agendador.zerar_totais()
 
-            # ——— Tenta listar blobs no prefixo da empresa ———
-            try:
-                blobs = list(container_client.list_blobs(name_starts_with=prefixo))
-            except TypeError as te:
-                st.error(f"Erro ao chamar list_blobs(name_starts_with=...): {te}")
-                blobs = []
-
-            nomes_disponiveis = [b.name for b in blobs]
-            match = [n for n in nomes_disponiveis if nome_pdf.lower() in n.lower()]
-
-            # ——— Prepara o link para a pasta ou para o PDF encontrado ———
-            # Note que usamos quote_plus para URL-encodar espaços ou caracteres especiais
-            pasta_empresa_url = f"{account_url}/{container_name}/{quote_plus(prefixo)}"
-            if match:
-                # Se encontrou ao menos um blob cujo nome casa (match[0]), link direto para ele
-                link_blob = f"{account_url}/{container_name}/{quote_plus(match[0])}"
-            else:
-                # Senão, link “genérico” para a pasta da empresa
-                link_blob = pasta_empresa_url
-
-            # ——— Executa somente diagnóstico ou diagnóstico + IA ———
-            if somente_diagnostico:
-                # Chama gerar_diagnostico em qualquer caso (com ou sem PDF)
-                if match:
-                    # se encontrou, baixa e gera diagnóstico com texto e doc
-                    blob = container_client.get_blob_client(match[0])
-                    pdf_bytes = blob.download_blob().readall()
-                    texto, doc = ler_pdf_bytes(BytesIO(pdf_bytes))
-                    diagnosticos.append(
-                        gerar_diagnostico(nome_arquivo, match[0], texto, doc)
-                    )
-                    status = "✔️ Encontrado (diagnóstico)"
-                else:
-                    # se não encontrou, não há PDF para gerar texto, mas ainda faz diagnóstico “vazio”
-                    diagnosticos.append(
-                        gerar_diagnostico(nome_arquivo, "-", "", None)
+        indice_duplicatas = obter_indice_duplicatas() if detectar_duplicatas else None
+
+        # ——— Localiza cada PDF no índice (uma listagem por prefixo por sessão) ———
+        itens, indices_usados = motor.preparar_itens(
+            df_filtrado, container_client, opcoes,
+            st.session_state.setdefault("indices_blobs", {}), cache_ia,
+            aba=aba_escolhida, avisar=st.error, indice_duplicatas=indice_duplicatas
+        )
+        estimador = motor.estimador_eta(itens, opcoes)
+        ordem = [item["chave"] for item in itens]
+        chaves_por_empresa: dict[str, list[str]] = {}
+        for item in itens:
+            chaves_por_empresa.setdefault(item["empresa"], []).append(item["chave"])
+
+        def planilha_xlsx(saida, colunas=None) -> bytes:
+            # Todas as empresas: uma aba por empresa; senão, uma única aba
+            if todas_as_empresas:
+                return saida_incremental.xlsx_por_grupo_em_bytes(
+                    lambda: ((empresa, saida.linhas(chaves)) for empresa, chaves in chaves_por_empresa.items()),
+                    colunas
+                )
+            return saida_incremental.xlsx_em_bytes(lambda: saida.linhas(ordem), colunas)
+
+        # ——— Respostas da IA em streaming: as threads da IA enfileiram, a thread principal exibe ———
+        nomes = {item["chave"]: f"{item['empresa']} – {item['nome_arquivo']}" for item in itens}
+        linhas_recebidas = queue.SimpleQueue()
+        parciais: dict[str, list[str]] = {}
+        cancelado = threading.Event()
+
+        def receber_linha(chave, linha, descartar=()):
+            if cancelado.is_set():
+                raise azure_ia.Cancelado()  # execução interrompida: abandona a resposta
+            linhas_recebidas.put((chave, linha, descartar))
+
+        def mostrar_parciais(atualizar=False):
+            novas = atualizar
+            while True:
+                try:
+                    chave, linha, descartar = linhas_recebidas.get_nowait()
+                except queue.Empty:
+                    break
+                linhas = parciais.setdefault(chave, [])
+                # Retentativa de uma chamada: as linhas da tentativa que falhou saem da tela
+                for antiga in descartar:
+                    if antiga in linhas:
+                        linhas.remove(antiga)
+                if linha is not None:
+                    linhas.append(linha)
+                novas = True
+            if not novas:
+                return
+            blocos = [
+                f"**⏳ {nomes[chave]}**  \n" + "  \n".join(linhas)
+                for chave, linhas in list(parciais.items())[-DOCUMENTOS_EM_STREAMING:]
+            ]
+            respostas_ao_vivo.markdown("\n\n".join(blocos) if blocos else "")
+
+        usar_streaming = respostas_em_streaming and not somente_diagnostico
+        # Qualquer clique interrompe o script (rerun); o streaming em andamento é abandonado no finally
+        st.button("⏹️ Interromper análise", help="Interrompe a análise; as respostas em andamento são descartadas.")
+        execucao = motor.executar(
+            itens, container_client, opcoes, cache_ia, indice_duplicatas,
+            ao_receber_linha=receber_linha if usar_streaming else None,
+            ao_aguardar=mostrar_parciais if usar_streaming else None,
+            armazem_textos=obter_armazem_textos() if reutilizar_textos else None,
+            cancelado=cancelado,
+        )
+
+        # ——— Pipeline concorrente: download → extração → IA ———
+        try:
+            for concluidos, (posicao, item, erro) in enumerate(execucao, start=1):
+                if erro is not None:
+                    item = dict(itens[posicao], erro=str(erro))
+
+                resultado, diagnostico, mensagens = motor.montar_linha(item, opcoes)
+                for mensagem in mensagens:
+                    st.error(mensagem)
+                saida_resultados.adicionar(item["chave"], resultado)
+                if diagnostico is not None:
+                    saida_diagnostico.adicionar(item["chave"], diagnostico)
+                resumo.registrar(item)
+
+                # ——— Últimas linhas concluídas e, de tempos em tempos, o Excel parcial ———
+                recentes.appendleft(resultado)
+                tabela_ao_vivo.dataframe(pd.DataFrame(list(recentes)).astype(str), use_container_width=True)
+                if concluidos < total and time() - ultimo_parcial >= INTERVALO_PARCIAL:
+                    download_parcial.download_button(
+                        f"📥 Baixar resultado parcial ({concluidos}/{total})",
+                        data=planilha_xlsx(saida_resultados),
+                        file_name="resultado_ia_parcial.xlsx",
+                        on_click="ignore",  # sem rerun: a análise continua
+                        key=f"parcial-{concluidos}",
                     )
-                    status = "❌ Arquivo não encontrado (diagnóstico)"
-                recomendacoes = []  # em somente diagnóstico, não queremos extrair recomendações via IA
-            else:
-                # Modo “normal”: tenta baixar, extrair texto e enviar pra IA
-                if match:
-                    blob = container_client.get_blob_client(match[0])
-                    pdf_bytes = blob.download_blob().readall()
-                    texto, doc = ler_pdf_bytes(BytesIO(pdf_bytes))
-                    recomendacoes = azure_ia.extrair_recomendacoes_ia(texto)
-
-                    if recomendacoes:
-                        status = "✔️ Encontrado"
-                    else:
-                        status = "✔️ Encontrado (sem recomendações)"
-
-                    if diagnostico_ativo:
-                        diagnosticos.append(
-                            gerar_diagnostico(nome_arquivo, match[0], texto, doc)
-                        )
-                else:
-                    recomendacoes = []
-                    texto = ""
-                    status = "❌ Arquivo não encontrado"
-                    if diagnostico_ativo:
-                        diagnosticos.append(
-                            gerar_diagnostico(nome_arquivo, "-", "", None)
-                        )
-
-            # ——— Monta a linha de resultado (empresa, arquivo, status, recomendações, link) ———
-            resultados.append({
-                "Empresa": empresa,
-                "Arquivo": nome_arquivo,
-                "Status": status,
-                "Recomendações": "\n".join(recomendacoes) if (recomendacoes and not somente_diagnostico) else "-"
-            })
-
-            # Atualiza barra de progresso
-            pct = int((i + 1) * 100 / total)
-            barra.progress(pct)
+                    ultimo_parcial = time()
+                estimador.concluir(item["chave"], item.get("duracoes", {}))
+
+                # ——— Atualiza barra de progresso e ETA conforme os itens concluem ———
+                # ETA pela vazão de cada etapa e pelo tamanho dos PDFs restantes; média simples até haver amostras
+                elapsed = time() - tempo_inicio
+                remaining = estimador.estimar()
+                if remaining is None:
+                    remaining = elapsed / concluidos * (total - concluidos)
+                remaining_h = int(remaining // 3600)
+                remaining_m = int((remaining % 3600) // 60)
+                remaining_s = int(remaining % 60)
+                eta_str = f"{remaining_h:02d}:{remaining_m:02d}:{remaining_s:02d}"
+
+                status_text.markdown(
+                    f"🔄 Concluído **{item['empresa']} – {item['nome_arquivo']}** (`{concluidos}`/`{total}`)  \n"
+                    f"⏱️ Tempo decorrido: **{elapsed:.1f}s** |   ⏳ ETA: **{eta_str}**"
+                )
+                barra.progress(int(concluidos * 100 / total))
+
+                # A resposta completa já está na tabela: sai das respostas parciais
+                if parciais.pop(item["chave"], None) is not None:
+                    mostrar_parciais(atualizar=True)
+        finally:
+            cancelado.set()
+            execucao.close()
 
         status_text.empty()
+        respostas_ao_vivo.empty()
+        tabela_ao_vivo.empty()
+        download_parcial.empty()
 
         # ——— 9. Exibe Tabela de Resultados ———
         st.subheader("🔍 Resultados da Análise")
-        df_resultado = pd.DataFrame(resultados).astype(str)
+        df_resultado = motor.tabela_resultados(list(saida_resultados.linhas(ordem)))
 
         st.dataframe(df_resultado, use_container_width=True)
 
-        # Botão para baixar resultado em Excel (incluindo a coluna “Link” em texto simples)
-        buffer = BytesIO()
-        df_resultado.to_excel(buffer, index=False)
+        # Botão para baixar resultado em Excel (gerado linha a linha a partir do disco)
         st.download_button(
             "📥 Baixar Resultado em Excel",
-            data=buffer.getvalue(),
+            data=planilha_xlsx(saida_resultados, saida_resultados.colunas),
             file_name="resultado_ia.xlsx"
         )
 
@@ -349,20 +532,22 @@ try:
         if diagnostico_ativo or somente_diagnostico:
             st.subheader("📋 Diagnóstico Detalhado")
 
-            df_diag = pd.DataFrame(diagnosticos).astype(str)
-
-            # — Remover as colunas indesejadas conforme a imagem (“Título”, “Data de Recebimento”, “Empresa Elaboradora”)
-            for coluna_para_remover in ["Título", "Data de Recebimento", "Empresa Elaboradora"]:
-                if coluna_para_remover in df_diag.columns:
-                    df_diag = df_diag.drop(columns=[coluna_para_remover])
+            # — Sem as colunas “Título”, “Data de Recebimento” e “Empresa Elaboradora”
+            df_diag = motor.tabela_diagnostico(list(saida_diagnostico.linhas(ordem)))
 
             st.dataframe(df_diag, use_container_width=True)
 
-            buf_diag = BytesIO()
-            df_diag.to_excel(buf_diag, index=False)
+            # ——— Estatísticas do índice de blobs (tempo de construção e acertos/falhas) ———
+            if indices_usados:
+                st.caption("🗂️ Índice de blobs por prefixo")
+                st.dataframe(
+                    pd.DataFrame([ind.resumo() for ind in indices_usados.values()]),
+                    use_container_width=True
+                )
+
             st.download_button(
                 "📥 Baixar Diagnóstico",
-                data=buf_diag.getvalue(),
+                data=planilha_xlsx(saida_diagnostico, saida_diagnostico.colunas),
                 file_name="diagnostico_ia.xlsx"
             )
 
@@ -370,6 +555,52 @@ try:
         total_time = time() - tempo_inicio
         modo = "Somente Diagnóstico" if somente_diagnostico else "Análise completa"
         st.success(f"✅ {modo} concluído em **{total_time:.1f} segundos**.")
+        if resumo.bytes:
+            st.caption(
+                f"📦 Baixados {resumo.bytes / 1024 / 1024:.1f} MB "
+                f"({resumo.bytes / 1024 / 1024 / max(resumo.segundos_download, 1e-9):.2f} MB/s por documento, em média)."
+            )
+        if not somente_diagnostico:
+            st.caption(
+                f"🗄️ Cache da IA: {cache_ia.acertos} respostas reaproveitadas, "
+                f"{cache_ia.falhas} enviadas ao modelo."
+            )
+            if resumo.duplicatas:
+                st.caption(f"🧬 Duplicatas: {resumo.duplicatas} documentos reaproveitaram a análise de outro relatório.")
+            st.caption(f"🔢 Tokens de relatório enviados à IA: {resumo.tokens_enviados} em {resumo.blocos} blocos.")
+            if resumo.tokens_enviados < resumo.tokens:
+                st.caption(
+                    f"✂️ Pré-filtro: {resumo.tokens} tokens nos relatórios, {resumo.tokens_enviados} enviados "
+                    f"({resumo.tokens / max(1, resumo.tokens_enviados):.1f}x menos)."
+                )
+            resumo_ia = azure_ia.agendador.resumo()
+            st.caption(
+                f"🚦 IA: {resumo_ia['Chamadas']} chamadas, {resumo_ia['Throttles (429)']} throttles (429) "
+                f"com {resumo_ia['Espera por Throttling (s)']}s de espera, "
+                f"{resumo_ia['Espera por Cota Local (s)']}s aguardando cota local, "
+                f"{resumo_ia['Falhas']} falhas definitivas."
+            )
+            if resumo.tokens_prompt:
+                st.caption(
+                    f"🧾 Tokens cobrados: {resumo.tokens_prompt} de prompt + {resumo.tokens_resposta} de resposta."
+                )
+
+        # ——— Tempo e volume por etapa (spans de cada documento) ———
+        with st.expander("⏱️ Tempo por etapa"):
+            st.dataframe(resumo.tabela_etapas(), use_container_width=True)
+            st.download_button(
+                "📥 Baixar Resumo da Execução",
+                data=resumo.para_json({} if somente_diagnostico else {"IA": azure_ia.agendador.resumo()}),
+                file_name="resumo_execucao.json",
+                mime="application/json"
+            )
+            st.download_button(
+                "🧭 Baixar Trace",
+                data=resumo.para_trace(),
+                file_name="trace_execucao.json",
+                mime="application/json",
+                help="Spans da execução no formato Trace Event (abre em chrome://tracing ou Perfetto)."
+            )
 
 except Exception as e:
-    st.error(f"❌ Erro ao processar arquivo Excel: {e}")
\ No newline at end of file
+    st.error(f"❌ Erro ao processar arquivo Excel: {e}")
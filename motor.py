@@ -0,0 +1,787 @@
+# motor.py
+import json
+import os
+from dataclasses import dataclass
+from functools import partial
+from datetime import datetime
+from time import perf_counter, time
+from urllib.parse import quote_plus
+
+import pandas as pd
+
+import azure_ia
+import duplicatas
+import extracao_pdf
+import filtro_relevancia
+import processamento
+import telemetria
+import transferencia_blob
+from cache_ia import gerar_chave, identidade_blob
+import indice_blobs
+from indice_blobs import IndiceBlobs, normalizar_nome
+from utilidades import gerar_diagnostico
+
+# ================================
+# Motor de análise (sem Streamlit): usado pelo app e pelo processamento em lote
+# ================================
+
+COLUNA_EMPRESA = "Empresa"
+COLUNA_ARQUIVO = "Nome do arquivo salvo"
+RAIZ_RELATORIOS = "Relatórios Técnicos/"
+SUBPASTA_RELATORIOS = "/Relatórios/"
+# Colunas do diagnóstico que não vão para a planilha final
+COLUNAS_OMITIDAS_DIAGNOSTICO = ["Título", "Data de Recebimento", "Empresa Elaboradora"]
+
+
+def prefixo_empresa(empresa: str) -> str:
+    return f"{RAIZ_RELATORIOS}{empresa}{SUBPASTA_RELATORIOS}"
+
+
+@dataclass
+class OpcoesAnalise:
+    """
+    Parâmetros de uma execução da análise.
+    """
+    account_url: str
+    container_name: str
+    deployment_name: str
+    somente_diagnostico: bool = False
+    diagnostico_ativo: bool = False
+    forcar_atualizacao: bool = False
+    workers_download: int = 4
+    workers_ia: int = 4
+    # Leitura dos PDFs no “somente diagnóstico”: parcial, metadados ou completa
+    leitura_diagnostico: str = "parcial"
+    paginas_diagnostico: int = 3
+    # Modo lote (Batch API): deployment que responde aos jobs; None fora do modo lote
+    deployment_lote: str = None
+    # Download: faixas paralelas por blob e limite em memória (acima, arquivo temporário)
+    max_concorrencia_download: int = transferencia_blob.MAX_CONCORRENCIA
+    limite_memoria_download: int = transferencia_blob.LIMITE_MEMORIA
+    # Processos para extrair PDFs grandes (a partir de extracao_pdf.MIN_PAGINAS_PARALELO páginas)
+    max_processos_extracao: int = extracao_pdf.MAX_PROCESSOS
+    # Relatórios grandes: tokens por bloco, blocos em paralelo e conclusões primeiro
+    limite_tokens_bloco: int = azure_ia.LIMITE_TOKENS_BLOCO
+    workers_blocos: int = azure_ia.WORKERS_BLOCOS
+    priorizar_conclusoes: bool = azure_ia.PRIORIZAR_CONCLUSOES
+    # Pré-filtro de trechos relevantes antes da IA
+    filtro_ativo: bool = filtro_relevancia.ATIVO
+    orcamento_filtro: int = filtro_relevancia.ORCAMENTO_TOKENS
+    # Duplicatas: reaproveitar também relatórios quase idênticos (SimHash), marcados para revisão
+    duplicatas_aproximadas: bool = False
+
+    def parametros_download(self) -> dict:
+        return {"limite_memoria": self.limite_memoria_download, "max_concorrencia": self.max_concorrencia_download}
+
+    def parametros_blocos(self) -> dict:
+        return {
+            "limite_tokens_bloco": self.limite_tokens_bloco,
+            "workers_blocos": self.workers_blocos,
+            "priorizar_conclusoes": self.priorizar_conclusoes,
+        }
+
+    def parametros_filtro(self) -> dict:
+        return {"ativo": self.filtro_ativo, "orcamento": self.orcamento_filtro}
+
+    def parametros_ia(self) -> dict:
+        """
+        Parâmetros que alteram a resposta da IA (entram na chave do cache).
+        """
+        return {
+            **azure_ia.parametros_cache(self.limite_tokens_bloco, self.priorizar_conclusoes),
+            **filtro_relevancia.parametros_cache(self.filtro_ativo, self.orcamento_filtro),
+        }
+
+    def contexto(self) -> dict:
+        """
+        O que define o conteúdo das linhas de uma execução: modo, leitura dos PDFs, prompt,
+        deployment(s) e parâmetros da IA. Vai no cabeçalho do diário (ver DiarioExecucao).
+        """
+        if self.somente_diagnostico:
+            return {
+                "modo": "diagnostico",
+                "leitura": self.leitura_diagnostico,
+                "paginas_diagnostico": self.paginas_diagnostico,
+            }
+        return {
+            "modo": "analise",
+            "diagnostico": self.diagnostico_ativo,
+            "versao_prompt": azure_ia.versao_prompt(),
+            "deployment": self.deployment_name,
+            "deployment_lote": self.deployment_lote,
+            "parametros": self.parametros_ia(),
+        }
+
+
+# ================================
+# Leitura do Excel
+# ================================
+
+def ler_aba_informativa(xls, aba) -> pd.DataFrame:
+    """
+    Aba “informativa” (índice 0) sem linhas/colunas vazias e sem a última coluna.
+    """
+    aba_info = pd.read_excel(xls, sheet_name=aba)
+    aba_info = aba_info.dropna(how="all", axis=0).dropna(how="all", axis=1)
+    # Remove a última coluna inteira
+    if aba_info.shape[1] > 1:
+        aba_info = aba_info.iloc[:, :-1]
+    return aba_info.astype(str)
+
+
+def abas_de_projetos(abas: list[str]) -> list[str]:
+    # Se houver mais de uma aba, a primeira (índice 0) é apenas informativa
+    return abas[1:] if len(abas) > 1 else abas
+
+
+def ler_aba_projetos(xls, aba) -> pd.DataFrame:
+    """
+    Lê a aba de projetos, localizando nas 10 primeiras linhas o cabeçalho com “Empresa”.
+    """
+    df = pd.read_excel(xls, sheet_name=aba, header=None)
+    # Detecção vetorizada: uma busca por coluna nas 10 primeiras linhas, sem laço por linha
+    contem_empresa = (
+        df.head(10).astype(str)
+        .apply(lambda coluna: coluna.str.contains("Empresa", regex=False))
+        .any(axis=1)
+        .to_numpy()
+    )
+    if contem_empresa.any():
+        i = int(contem_empresa.argmax())
+        df.columns = df.iloc[i].astype(str).str.strip()
+        df = df[i + 1 :].reset_index(drop=True)
+
+    # ——— Limpa colunas “Unnamed” e converte tudo para string ———
+    df = df.loc[:, ~df.columns.astype(str).str.contains("^Unnamed", na=False)]
+    df = df.dropna(axis=1, how="all")
+    return df.astype(str)
+
+
+# ================================
+# Preparação e execução
+# ================================
+
+def obter_indice(container_client, prefixo, indices, avisar=print) -> IndiceBlobs:
+    """
+    Índice de blobs do prefixo, reaproveitado de `indices` (uma listagem por prefixo).
+    """
+    indice = indices.get(prefixo)
+    if indice is None:
+        indice = IndiceBlobs.construir_ou_vazio(container_client, prefixo)
+        if indice.erro:
+            avisar(f"Erro ao listar os blobs de {prefixo}: {indice.erro}")
+        indices[prefixo] = indice
+    return indice
+
+
+def carregar_indices(container_client, prefixos, indices, avisar=print) -> dict[str, list[dict]]:
+    """
+    Constrói de uma vez os índices dos prefixos que ainda não estão em `indices`. Com vários
+    prefixos (ex.: todas as empresas da planilha), uma listagem hierárquica da raiz mostra
+    quais pastas existem e só essas são listadas, em paralelo. Uma falha na listagem de um
+    prefixo é avisada e deixa só esse prefixo sem PDFs.
+    Retorna os spans de listagem de cada prefixo construído agora (o da listagem da raiz vai
+    para o primeiro prefixo).
+    """
+    faltantes = [p for p in dict.fromkeys(prefixos) if p not in indices]
+    if not faltantes:
+        return {}
+    inicio = time()
+    spans = {prefixo: [] for prefixo in faltantes}
+    if len(faltantes) == 1:
+        obter_indice(container_client, faltantes[0], indices, avisar)
+    else:
+        inicio_raiz = perf_counter()
+        atributos = {}
+        try:
+            pastas = indice_blobs.listar_subpastas(container_client, RAIZ_RELATORIOS)
+            atributos["pastas"] = len(pastas)
+        except (AttributeError, TypeError):
+            pastas = None  # cliente sem listagem hierárquica: lista todos os prefixos
+        except Exception as e:
+            # Falha na listagem da raiz: cada prefixo é listado (e falha, se for o caso) por si
+            pastas = None
+            atributos["erro"] = str(e)
+        spans[faltantes[0]].append(telemetria.novo_span(
+            "listagem_raiz", inicio, perf_counter() - inicio_raiz, prefixo=RAIZ_RELATORIOS, **atributos
+        ))
+        existentes = [
+            p for p in faltantes
+            if pastas is None or p.removesuffix(SUBPASTA_RELATORIOS) + "/" in pastas
+        ]
+        construidos = indice_blobs.construir_em_paralelo(container_client, existentes)
+        for prefixo in faltantes:
+            # (um índice vazio é falso: `or` descartaria o erro da listagem)
+            indice = construidos[prefixo] if prefixo in construidos else IndiceBlobs(prefixo, [])
+            if indice.erro:
+                avisar(f"Erro ao listar os blobs de {prefixo}: {indice.erro}")
+            indices[prefixo] = indice
+    # A listagem é por prefixo: o span fica no primeiro documento que a provocou
+    for prefixo in faltantes:
+        indice = indices[prefixo]
+        atributos = {"erro": indice.erro} if indice.erro else {}
+        spans[prefixo].append(telemetria.novo_span(
+            "listagem", indice.inicio or inicio, indice.tempo_construcao,
+            prefixo=prefixo, blobs=len(indice.propriedades), **atributos,
+        ))
+    return spans
+
+
+def localizar_pdfs(df_linhas, indices) -> list[tuple[list[str], str]]:
+    """
+    (blobs encontrados, tipo da busca) de cada linha, na ordem de `df_linhas`. Os nomes exatos
+    são resolvidos com um único merge contra os nomes de todos os índices; só as linhas sem
+    correspondência exata passam pela busca por substring de IndiceBlobs.buscar.
+    """
+    if df_linhas.empty:
+        return []
+    linhas = pd.DataFrame({
+        "prefixo": RAIZ_RELATORIOS + df_linhas[COLUNA_EMPRESA].str.strip() + SUBPASTA_RELATORIOS,
+        "nome_pdf": df_linhas[COLUNA_ARQUIVO].str.strip() + ".pdf",
+    }).reset_index(drop=True)
+    linhas["chave"] = linhas["nome_pdf"].map(normalizar_nome)
+    nomes = pd.concat([indices[p].tabela_nomes() for p in linhas["prefixo"].unique()], ignore_index=True)
+    # (prefixo, chave) é único em `nomes`: o merge à esquerda mantém uma linha por linha do Excel, na ordem
+    cruzado = linhas.merge(nomes, on=["prefixo", "chave"], how="left")
+
+    exatas = cruzado["blobs"].notna()
+    for prefixo, quantidade in cruzado.loc[exatas, "prefixo"].value_counts().items():
+        indices[prefixo].acertos += int(quantidade)
+    return [
+        (list(blobs), "exata") if exata else indices[prefixo].buscar(nome_pdf)
+        for prefixo, nome_pdf, blobs, exata in zip(cruzado["prefixo"], cruzado["nome_pdf"], cruzado["blobs"], exatas)
+    ]
+
+
+def metadados_blob(propriedades) -> dict:
+    """
+    Tamanho e data de modificação vindos da listagem (sem download).
+    """
+    if propriedades is None:
+        return {"Tamanho (bytes)": "-", "Última Modificação": "-"}
+    modificado = getattr(propriedades, "last_modified", None)
+    return {
+        "Tamanho (bytes)": getattr(propriedades, "size", "-"),
+        "Última Modificação": modificado.strftime("%d/%m/%Y %H:%M") if modificado else "-",
+    }
+
+
+def preparar_itens(df_linhas, container_client, opcoes, indices, cache=None, aba="", avisar=print,
+                   indice_duplicatas=None):
+    """
+    Localiza cada PDF no índice e consulta o cache da IA (rápido, sem downloads). As linhas
+    podem ser de várias empresas: os prefixos que faltam são listados de uma vez.
+    Com `indice_duplicatas`, cópias idênticas (mesmo MD5 na listagem) já ficam
+    marcadas para reaproveitar a análise do primeiro documento, sem download.
+    Retorna (itens, índices usados nesta execução).
+    """
+    itens = []
+    indices_usados: dict[str, IndiceBlobs] = {}
+    parametros_ia = opcoes.parametros_ia()
+    # Prompt, deployment e parâmetros: recomendações só são reaproveitadas dentro do mesmo contexto
+    contexto_ia = gerar_chave("", azure_ia.versao_prompt(), opcoes.deployment_name, parametros_ia)
+
+    empresas = df_linhas[COLUNA_EMPRESA].str.strip()
+    spans_listagem = carregar_indices(container_client, empresas.map(prefixo_empresa), indices, avisar)
+    for prefixo in dict.fromkeys(empresas.map(prefixo_empresa)):
+        # Acertos/falhas contados por execução, mesmo com índice reaproveitado
+        indices[prefixo].acertos = indices[prefixo].falhas = 0
+        indices_usados[prefixo] = indices[prefixo]
+    buscas = localizar_pdfs(df_linhas, indices)
+
+    for (posicao_excel, row), (match, tipo_busca) in zip(df_linhas.iterrows(), buscas):
+        empresa = row[COLUNA_EMPRESA].strip()
+        nome_arquivo = row[COLUNA_ARQUIVO].strip()
+        prefixo = prefixo_empresa(empresa)
+        indice = indices[prefixo]
+        spans = spans_listagem.pop(prefixo, [])
+
+        # ——— Link para o PDF encontrado ou, senão, para a pasta da empresa ———
+        # quote_plus para URL-encodar espaços ou caracteres especiais
+        if match:
+            link_blob = f"{opcoes.account_url}/{opcoes.container_name}/{quote_plus(match[0])}"
+        else:
+            link_blob = f"{opcoes.account_url}/{opcoes.container_name}/{quote_plus(prefixo)}"
+
+        # ——— Consulta o cache de recomendações antes de baixar qualquer PDF ———
+        # (no modo lote, também o que o deployment do lote já respondeu, na sua própria chave)
+        chave_cache = chave_cache_lote = None
+        recomendacoes_cache = None
+        if match and not opcoes.somente_diagnostico and cache is not None:
+            identidade = identidade_blob(indice.propriedades[match[0]])
+            chave_cache = gerar_chave(identidade, azure_ia.versao_prompt(), opcoes.deployment_name, parametros_ia)
+            if opcoes.deployment_lote:
+                chave_cache_lote = gerar_chave(
+                    identidade, azure_ia.versao_prompt(), opcoes.deployment_lote, parametros_ia
+                )
+            if not opcoes.forcar_atualizacao:
+                recomendacoes_cache = cache.obter(chave_cache)
+                if recomendacoes_cache is None and chave_cache_lote:
+                    recomendacoes_cache = cache.obter(chave_cache_lote)
+
+        # ——— Cópias idênticas pelo MD5 da listagem ———
+        # Com diagnóstico o PDF é lido de qualquer forma: a cópia é detectada pelo texto
+        reservas, extras_duplicata = [], {}
+        if (indice_duplicatas is not None and match and recomendacoes_cache is None
+                and not opcoes.somente_diagnostico and not opcoes.diagnostico_ativo):
+            identidade = identidade_blob(indice.propriedades[match[0]])
+            if identidade.startswith("md5:"):
+                reserva, dona = indice_duplicatas.reservar_identidade(identidade, match[0])
+                if dona:
+                    reservas.append(reserva)
+                else:
+                    extras_duplicata = {
+                        "duplicata": duplicatas.Correspondencia(reserva.blob, "exata (MD5)", reserva=reserva),
+                        "duplicata_exata_de": reserva.blob,
+                    }
+
+        itens.append({
+            "chave": f"{aba}|{posicao_excel}|{empresa}|{nome_arquivo}",
+            "empresa": empresa,
+            "nome_arquivo": nome_arquivo,
+            "match": match,
+            "link": link_blob,
+            "chave_cache": chave_cache,
+            "chave_cache_lote": chave_cache_lote,
+            "recomendacoes_cache": recomendacoes_cache,
+            "precisa_pdf": (recomendacoes_cache is None and not extras_duplicata) or opcoes.diagnostico_ativo,
+            "propriedades": indice.propriedades[match[0]] if match else None,
+            "contexto_ia": contexto_ia,
+            "reservas": reservas,
+            **extras_duplicata,
+            "spans": spans,
+            "extras_diag": {
+                "Busca no Índice": tipo_busca,
+                "Tempo do Índice (s)": f"{indice.tempo_construcao:.3f}",
+                **metadados_blob(indice.propriedades[match[0]] if match else None),
+            },
+        })
+        if opcoes.diagnostico_ativo or opcoes.somente_diagnostico:
+            # Não encontrado: um nome parecido vai para o diagnóstico, para conferência manual
+            sugestao = None if match else indice.sugerir(nome_arquivo + ".pdf")
+            itens[-1]["extras_diag"]["Nome Parecido"] = sugestao or "-"
+    # Listagens que falharam são refeitas na próxima execução, em vez de reaproveitadas vazias
+    for prefixo, indice in indices_usados.items():
+        if indice.erro:
+            indices.pop(prefixo, None)
+    return itens, indices_usados
+
+
+def executar(itens, container_client, opcoes, cache=None, indice_duplicatas=None,
+             ao_receber_linha=None, ao_aguardar=None, armazem_textos=None, cancelado=None):
+    """
+    Pipeline concorrente download → extração → [duplicatas →] IA. Gera (posição, item, erro)
+    conforme concluem.
+    `ao_receber_linha(chave, linha)` recebe, das threads da IA, cada linha de resposta em
+    streaming (e `ao_receber_linha(chave, None, descartar=linhas)` quando uma retentativa
+    descarta as linhas já enviadas); `ao_aguardar()` é chamada na thread chamadora enquanto
+    nenhum item termina. Sinalizar `cancelado` abandona as chamadas à IA ainda não feitas.
+    Com `armazem_textos`, PDFs já lidos (mesmo ETag) não são baixados nem extraídos de novo.
+    """
+    # No “somente diagnóstico” basta o início do PDF (ou nem isso, só os metadados)
+    leitura = opcoes.leitura_diagnostico if opcoes.somente_diagnostico else "completa"
+    max_paginas = opcoes.paginas_diagnostico if opcoes.somente_diagnostico else None
+    usar_ia = not opcoes.somente_diagnostico
+    if not usar_ia:
+        indice_duplicatas = None
+    analisar = partial(
+        processamento.analisar_ia, usar_ia=usar_ia, cache=cache, indice_duplicatas=indice_duplicatas,
+        ao_receber_linha=ao_receber_linha, cancelado=cancelado, blocos=opcoes.parametros_blocos(),
+        filtro=opcoes.parametros_filtro(),
+    )
+    etapas = [
+        ("download", partial(
+            processamento.baixar_pdf, container_client=container_client, leitura=leitura,
+            armazem=armazem_textos, max_paginas=max_paginas, **opcoes.parametros_download(),
+        ), opcoes.workers_download),
+        # PyMuPDF não é thread-safe: a extração roda em uma única thread (PDFs grandes usam processos)
+        ("extracao", partial(
+            processamento.extrair_texto, container_client=container_client, max_paginas=max_paginas,
+            armazem=armazem_textos, max_processos=opcoes.max_processos_extracao, **opcoes.parametros_download(),
+        ), 1),
+    ]
+    if indice_duplicatas is not None:
+        # Uma única thread, na ordem de chegada: o original entra na fila da IA antes das suas cópias
+        etapas.append(("duplicatas", partial(
+            processamento.identificar_duplicata, indice=indice_duplicatas, persistente=not opcoes.forcar_atualizacao,
+            aproximadas=opcoes.duplicatas_aproximadas,
+        ), 1))
+    etapas.append(("ia", analisar, opcoes.workers_ia))
+    if indice_duplicatas is None:
+        return processamento.processar_em_pipeline(itens, etapas, ao_aguardar=ao_aguardar)
+    return _executar_com_duplicatas(itens, etapas, analisar, indice_duplicatas, ao_aguardar)
+
+
+def _executar_com_duplicatas(itens, etapas, analisar, indice, ao_aguardar=None):
+    """
+    Cópias idênticas pelo MD5 ficam fora do pipeline: cada uma sai logo depois do seu
+    original, sem ocupar uma thread da IA esperando por ele.
+    """
+    originais = {id(reserva) for item in itens for reserva in item.get("reservas", [])}
+    adiadas = set()
+    for p, item in enumerate(itens):
+        if "duplicata_exata_de" not in item:
+            continue
+        if id(item["duplicata"].reserva) in originais:
+            adiadas.add(p)
+        else:
+            # Original fora desta execução (ex.: já concluído no diário): a cópia é analisada normalmente
+            del item["duplicata"], item["duplicata_exata_de"]
+            item["precisa_pdf"] = True
+    execucao = processamento.processar_em_pipeline(
+        [i for p, i in enumerate(itens) if p not in adiadas], etapas, ao_aguardar=ao_aguardar
+    )
+    posicoes = [p for p in range(len(itens)) if p not in adiadas]
+
+    def prontas():
+        for p in sorted(adiadas):
+            if itens[p]["duplicata"].reserva.concluida:
+                adiadas.discard(p)
+                yield p, analisar(itens[p]), None
+
+    try:
+        for posicao, item, erro in execucao:
+            posicao = posicoes[posicao]
+            if erro is not None:
+                # O original falhou antes da IA: as cópias seguem sem ele
+                for reserva in itens[posicao].pop("reservas", []):
+                    reserva.concluir(None)
+            yield posicao, item, erro
+            yield from prontas()
+        indice.liberar_todas()
+        yield from prontas()
+    finally:
+        execucao.close()
+        indice.liberar_todas()
+
+
+def executar_em_lote(itens, container_client, opcoes, lote, cache=None, intervalo=None,
+                     ao_atualizar_lote=None, ao_aguardar=None, armazem_textos=None):
+    """
+    Modo lote (Batch API, ver lote_ia): download → extração → prompts no `lote` para todos
+    os documentos; depois o envio e a espera dos jobs e, por fim, as recomendações de cada
+    documento. Os que falharam no lote seguem pelo caminho síncrono. Gera (posição, item, erro).
+    `ao_atualizar_lote(jobs)` recebe o status dos jobs a cada consulta.
+    """
+    manter_texto = opcoes.diagnostico_ativo
+    analisar = partial(
+        processamento.analisar_ia, usar_ia=True, cache=cache, blocos=opcoes.parametros_blocos(),
+        filtro=opcoes.parametros_filtro(),
+    )
+    etapas = [
+        ("download", partial(
+            processamento.baixar_pdf, container_client=container_client, armazem=armazem_textos,
+            **opcoes.parametros_download(),
+        ), opcoes.workers_download),
+        ("extracao", partial(
+            processamento.extrair_texto, container_client=container_client, armazem=armazem_textos,
+            max_processos=opcoes.max_processos_extracao, **opcoes.parametros_download(),
+        ), 1),
+    ]
+
+    # ——— Prompts de todos os documentos no lote (cache e não encontrados saem já) ———
+    no_lote, sincronos = [], []
+    preparar = partial(
+        processamento.preparar_lote, lote=lote, manter_texto=manter_texto,
+        limite_tokens_bloco=opcoes.limite_tokens_bloco, filtro=opcoes.parametros_filtro(),
+    )
+    for posicao, item, erro in processamento.processar_em_pipeline(
+        itens, etapas + [("lote", preparar, opcoes.workers_ia)], ao_aguardar=ao_aguardar
+    ):
+        if erro is not None:
+            yield posicao, item, erro
+        elif "lote" in item:
+            no_lote.append((posicao, item))
+        elif item["match"] and item.get("recomendacoes_cache") is None:
+            # Sem texto extraído: mesmo tratamento do modo síncrono
+            item["precisa_pdf"] = False
+            sincronos.append((posicao, item))
+        else:
+            yield posicao, analisar(item), None
+
+    # ——— Envio e espera; respostas de volta para cada documento ———
+    lote.processar(intervalo, ao_atualizar_lote)
+    for posicao, item in no_lote:
+        if processamento.aplicar_lote(item, lote, cache):
+            yield posicao, item, None
+            continue
+        del item["lote"]
+        if manter_texto:
+            item["precisa_pdf"] = False
+        else:
+            # O texto foi descartado: vem de novo do armazém de textos ou do PDF
+            item.pop("doc", None)
+            item.pop("texto", None)
+            item["precisa_pdf"] = True
+        sincronos.append((posicao, item))
+
+    # ——— Caminho síncrono para o que falhou no lote ———
+    if sincronos:
+        execucao = processamento.processar_em_pipeline(
+            [item for _, item in sincronos], etapas + [("ia", analisar, opcoes.workers_ia)], ao_aguardar=ao_aguardar
+        )
+        try:
+            for p, item, erro in execucao:
+                if erro is None and "erro_lote" in item:
+                    item.setdefault("estatisticas_ia", {})["Modo da IA"] = f"Síncrono (falha no lote: {item['erro_lote']})"
+                yield sincronos[p][0], item, erro
+        finally:
+            execucao.close()
+
+
+def estimador_eta(itens, opcoes) -> telemetria.EstimadorETA:
+    """
+    Estimador do tempo restante com o tamanho (na listagem) que cada documento leva a cada etapa.
+    """
+    estimador = telemetria.EstimadorETA(
+        {"download": opcoes.workers_download, "extracao": 1, "ia": opcoes.workers_ia}
+    )
+    le_pdf = not (opcoes.somente_diagnostico and opcoes.leitura_diagnostico == "metadados")
+    for item in itens:
+        tamanho = getattr(item["propriedades"], "size", 0) or 0
+        baixa = bool(item["match"]) and item["precisa_pdf"] and le_pdf
+        estimador.adicionar(item["chave"], {
+            "download": tamanho if baixa else 0,
+            "extracao": tamanho if baixa else 0,
+            "ia": tamanho if item["match"] and item["recomendacoes_cache"] is None and not opcoes.somente_diagnostico else 0,
+        })
+    return estimador
+
+
+def montar_linha(item, opcoes) -> tuple[dict, dict | None, list[str]]:
+    """
+    Monta a linha de resultado e o diagnóstico de um item concluído.
+    Retorna (resultado, diagnóstico ou None, mensagens de erro).
+    """
+    nome_arquivo = item["nome_arquivo"]
+    match = item["match"]
+    texto = item.get("texto", "")
+    doc = item.get("doc")
+    recomendacoes = item.get("recomendacoes", [])
+    mensagens = []
+
+    if "erro" in item:
+        mensagens.append(f"❌ Erro ao processar {nome_arquivo}: {item['erro']}")
+        status = "⚠️ Erro no processamento"
+    elif opcoes.somente_diagnostico:
+        status = "✔️ Encontrado (diagnóstico)" if match else "❌ Arquivo não encontrado (diagnóstico)"
+    elif match and "erro_ia" in item:
+        # Falha real da IA (não confundir com documento sem recomendações)
+        mensagens.append(f"❌ Erro ao chamar AzureOpenAI: {item['erro_ia']}")
+        status = "⚠️ Falha na IA"
+    elif match and "duplicado_de" in item and item["duplicata"].tipo == duplicatas.APROXIMADA:
+        status = f"🔎 Quase idêntico a {os.path.basename(item['duplicado_de'])} (revisar)"
+    elif match and "duplicado_de" in item:
+        status = f"♻️ Duplicado de {os.path.basename(item['duplicado_de'])}"
+    elif match:
+        status = "✔️ Encontrado" if recomendacoes else "✔️ Encontrado (sem recomendações)"
+    else:
+        status = "❌ Arquivo não encontrado"
+
+    extras_diag = dict(item["extras_diag"])
+    if opcoes.somente_diagnostico and match:
+        extras_diag["Leitura"] = item.get("leitura", opcoes.leitura_diagnostico)
+    if doc is not None:
+        extras_diag["Tempo de Extração (s)"] = f"{doc.tempos['total']:.2f}"
+        extras_diag["Processos na Extração"] = doc.tempos["processos"]
+    if item.get("texto_armazenado"):
+        extras_diag["Texto do Armazém"] = "Sim"
+    download = item.get("download")
+    if download:
+        extras_diag["Bytes Transferidos"] = download["bytes"]
+        vazao = download["bytes"] / 1024 / 1024 / download["segundos"] if download["segundos"] else 0.0
+        extras_diag["Vazão (MB/s)"] = f"{vazao:.2f}"
+        extras_diag["Download em Disco"] = "Sim" if download["em_disco"] else "Não"
+    extras_diag.update(item.get("estatisticas_ia") or {})
+    correspondencia = item.get("duplicata")
+    if correspondencia is not None and "duplicado_de" in item:
+        extras_diag["Duplicata de"] = correspondencia.blob
+        extras_diag["Tipo de Duplicata"] = correspondencia.tipo
+        extras_diag["Distância SimHash"] = correspondencia.distancia
+
+    diagnostico = None
+    if opcoes.somente_diagnostico or opcoes.diagnostico_ativo:
+        # Diagnóstico em qualquer caso (com ou sem PDF)
+        diagnostico = gerar_diagnostico(nome_arquivo, match[0] if match else "-", texto, doc, extras_diag)
+
+    resultado = {
+        "Empresa": item["empresa"],
+        "Arquivo": nome_arquivo,
+        "Status": status,
+        "Recomendações": "\n".join(recomendacoes) if (recomendacoes and not opcoes.somente_diagnostico) else "-"
+    }
+    return resultado, diagnostico, mensagens
+
+
+class ResumoExecucao:
+    """
+    Totais de uma execução (tokens, blocos, bytes baixados) e spans de cada documento.
+    """
+
+    def __init__(self):
+        self.inicio = time()
+        self.documentos = 0
+        self.tokens = 0
+        self.tokens_enviados = 0
+        self.blocos = 0
+        self.tokens_prompt = 0
+        self.tokens_resposta = 0
+        self.bytes = 0
+        self.segundos_download = 0.0
+        self.duplicatas = 0
+        self.spans: list[dict] = []
+
+    def registrar(self, item):
+        self.documentos += 1
+        if "duplicado_de" in item:
+            self.duplicatas += 1
+        estatisticas_ia = item.get("estatisticas_ia")
+        if estatisticas_ia:
+            self.tokens += estatisticas_ia["Tokens do Documento"]
+            self.tokens_enviados += estatisticas_ia.get("Tokens Enviados", estatisticas_ia["Tokens do Documento"])
+            self.blocos += estatisticas_ia["Blocos"]
+            self.tokens_prompt += estatisticas_ia.get("Tokens do Prompt", 0)
+            self.tokens_resposta += estatisticas_ia.get("Tokens da Resposta", 0)
+        download = item.get("download")
+        if download:
+            self.bytes += download["bytes"]
+            self.segundos_download += download["segundos"]
+        documento = f"{item['empresa']} – {item['nome_arquivo']}"
+        self.spans.extend({"documento": documento, **span} for span in item.get("spans", []))
+
+    def tabela_etapas(self) -> pd.DataFrame:
+        return telemetria.tabela_etapas(self.spans)
+
+    def totais(self) -> dict:
+        return {
+            "Documentos": self.documentos,
+            "Duração (s)": round(time() - self.inicio, 1),
+            "Bytes Baixados": self.bytes,
+            "Tokens do Documento": self.tokens,
+            "Tokens Enviados": self.tokens_enviados,
+            "Blocos": self.blocos,
+            "Tokens do Prompt": self.tokens_prompt,
+            "Tokens da Resposta": self.tokens_resposta,
+            "Duplicatas Reaproveitadas": self.duplicatas,
+        }
+
+    def para_json(self, extras: dict = None) -> bytes:
+        """
+        Resumo da execução (totais, agregação por etapa e todos os spans) para download.
+        """
+        resumo = {
+            "totais": {**self.totais(), **(extras or {})},
+            "etapas": self.tabela_etapas().to_dict(orient="records"),
+            "spans": self.spans,
+        }
+        return json.dumps(resumo, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+
+    def para_trace(self) -> bytes:
+        """
+        Spans no formato Trace Event (chrome://tracing, Perfetto) para download.
+        """
+        return json.dumps(telemetria.trace_chrome(self.spans), ensure_ascii=False, default=str).encode("utf-8")
+
+    def exportar_trace(self, caminho: str):
+        telemetria.exportar_trace(self.spans, caminho)
+
+
+# ================================
+# Saídas
+# ================================
+
+def tabela_resultados(resultados) -> pd.DataFrame:
+    return pd.DataFrame(resultados).astype(str)
+
+
+def tabela_diagnostico(diagnosticos) -> pd.DataFrame:
+    df_diag = pd.DataFrame(diagnosticos).astype(str)
+    colunas = [c for c in COLUNAS_OMITIDAS_DIAGNOSTICO if c in df_diag.columns]
+    return df_diag.drop(columns=colunas)
+
+
+# ================================
+# Diário de execução (checkpoint/retomada)
+# ================================
+
+class DiarioExecucao:
+    """
+    Registro em JSONL de cada linha concluída. Em uma nova execução com o mesmo diário, as
+    linhas já registradas são reaproveitadas e só o restante é processado.
+    Em memória fica só a posição de cada registro no arquivo (ver `obter`).
+
+    A primeira linha guarda o `contexto` da execução (OpcoesAnalise.contexto): um diário de
+    outro contexto (só diagnóstico, outro prompt, deployment ou filtro) não é retomado; ele é
+    renomeado para `arquivado` e um diário novo começa.
+    """
+
+    def __init__(self, caminho: str, contexto: dict = None):
+        self.caminho = caminho
+        self.concluidas: dict[str, int] = {}   # chave -> posição do registro no arquivo
+        self.arquivado = None
+        # Normalizado como no arquivo (tuplas viram listas etc.)
+        contexto = json.loads(json.dumps(contexto, default=str))
+        incompleto = False
+        if os.path.exists(caminho) and self._ler_cabecalho(caminho) != contexto:
+            base = f"{caminho}.{datetime.now():%Y%m%d-%H%M%S}"
+            self.arquivado, n = base, 1
+            while os.path.exists(self.arquivado):
+                n += 1
+                self.arquivado = f"{base}-{n}"
+            os.replace(caminho, self.arquivado)
+        if os.path.exists(caminho):
+            with open(caminho, "rb") as f:
+                f.readline()  # cabeçalho
+                while True:
+                    posicao = f.tell()
+                    linha = f.readline()
+                    if not linha:
+                        break
+                    try:
+                        registro = json.loads(linha)
+                    except json.JSONDecodeError:
+                        incompleto = not linha.endswith(b"\n")
+                        continue  # última linha incompleta (queda no meio da gravação)
+                    self.concluidas[registro["chave"]] = posicao
+            self._arquivo = open(caminho, "a", encoding="utf-8")
+            if incompleto:
+                self._arquivo.write("\n")  # não emenda o próximo registro na linha quebrada
+        else:
+            self._arquivo = open(caminho, "a", encoding="utf-8")
+            self._arquivo.write(json.dumps({"cabecalho": contexto}, ensure_ascii=False) + "\n")
+            self._arquivo.flush()
+
+    @staticmethod
+    def _ler_cabecalho(caminho: str):
+        """
+        Contexto gravado na primeira linha, ou um marcador que nunca confere (diário sem
+        cabeçalho, de uma versão anterior, ou ilegível).
+        """
+        with open(caminho, "rb") as f:
+            try:
+                primeira = json.loads(f.readline())
+            except json.JSONDecodeError:
+                return object()
+        if not isinstance(primeira, dict) or "cabecalho" not in primeira:
+            return object()
+        return primeira["cabecalho"]
+
+    def registrar(self, chave: str, resultado: dict, diagnostico: dict | None):
+        registro = {"chave": chave, "resultado": resultado, "diagnostico": diagnostico}
+        self._arquivo.flush()
+        posicao = self._arquivo.tell()
+        self._arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self.concluidas[chave] = posicao
+
+    def obter(self, chave: str) -> dict:
+        """
+        Registro {"chave", "resultado", "diagnostico"} de uma linha concluída.
+        """
+        with open(self.caminho, "rb") as f:
+            f.seek(self.concluidas[chave])
+            return json.loads(f.readline())
+
+    def fechar(self):
+        self._arquivo.close()
@@ -0,0 +1,409 @@
+# processamento.py
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from itertools import count
+from time import perf_counter
+
+import azure_ia
+import duplicatas
+import filtro_relevancia
+import telemetria
+from extracao_pdf import ler_pdf_bytes
+from transferencia_blob import baixar_blob, baixar_inicio_blob
+
+
+def _cronometrar(nome, funcao, item):
+    """
+    Executa uma etapa e guarda sua duração em item["duracoes"][nome] (segundos).
+    """
+    inicio = perf_counter()
+    try:
+        return funcao(item)
+    finally:
+        if isinstance(item, dict):
+            item.setdefault("duracoes", {})[nome] = perf_counter() - inicio
+
+
+INTERVALO_AGUARDAR = 0.25   # segundos entre chamadas de `ao_aguardar` enquanto nada termina
+
+
+def processar_em_pipeline(itens, etapas, max_em_andamento=None, ao_aguardar=None):
+    """
+    Executa cada item pelas etapas encadeadas (download → extração → IA), cada etapa com
+    seu próprio pool de threads. `etapas` é uma lista de (nome, função, workers).
+
+    É um gerador executado na thread chamadora: devolve (posição, item, erro) à medida que
+    os itens terminam, para que a interface do Streamlit seja atualizada só na thread principal.
+    Enquanto nada termina, `ao_aguardar()` é chamada (na mesma thread) a cada INTERVALO_AGUARDAR
+    segundos, ex.: para mostrar respostas parciais da IA.
+    O número de itens em andamento é limitado para não acumular PDFs baixados na memória.
+    A duração de cada etapa fica em item["duracoes"].
+    """
+    executores = [
+        ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"imani-{nome}")
+        for nome, _, workers in etapas
+    ]
+    limite = max_em_andamento or 2 * sum(max(1, workers) for _, _, workers in etapas)
+    fila = iter(enumerate(itens))
+    pendentes = {}  # future -> (posição, índice da etapa, ordem de envio)
+    envios = count()
+    esgotada = False
+
+    try:
+        while pendentes or not esgotada:
+            # ——— Alimenta a primeira etapa respeitando o limite de itens em andamento ———
+            while not esgotada and len(pendentes) < limite:
+                try:
+                    posicao, item = next(fila)
+                except StopIteration:
+                    esgotada = True
+                    break
+                futuro = executores[0].submit(_cronometrar, etapas[0][0], etapas[0][1], item)
+                pendentes[futuro] = (posicao, 0, next(envios))
+
+            if not pendentes:
+                break
+
+            concluidos, _ = wait(
+                pendentes, timeout=INTERVALO_AGUARDAR if ao_aguardar else None, return_when=FIRST_COMPLETED
+            )
+            if not concluidos:
+                ao_aguardar()
+                continue
+            # Na ordem de envio: itens de uma etapa de uma só thread seguem na mesma ordem para a próxima
+            for futuro in sorted(concluidos, key=lambda f: pendentes[f][2]):
+                posicao, etapa, _ = pendentes.pop(futuro)
+                try:
+                    item = futuro.result()
+                except Exception as e:
+                    yield posicao, None, e
+                    continue
+
+                if etapa + 1 < len(etapas):
+                    nome, funcao, _ = etapas[etapa + 1]
+                    proximo = executores[etapa + 1].submit(_cronometrar, nome, funcao, item)
+                    pendentes[proximo] = (posicao, etapa + 1, next(envios))
+                else:
+                    yield posicao, item, None
+    finally:
+        # Se a execução for interrompida (ex.: rerun do Streamlit), descarta o que não começou
+        for executor in executores:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ================================
+# Etapas por documento
+# ================================
+
+def _registrar_download(item, arquivo):
+    anterior = item.get("download") or {"bytes": 0, "segundos": 0.0}
+    item["download"] = {
+        "bytes": anterior["bytes"] + arquivo.bytes_transferidos,
+        "segundos": anterior["segundos"] + arquivo.segundos,
+        "em_disco": arquivo.em_disco,
+    }
+
+
+def chave_armazem(item, container_client) -> tuple[str, str, str]:
+    etag = getattr(item.get("propriedades"), "etag", None)
+    if etag is None:
+        # Sem ETag na listagem: consulta só as propriedades do blob, sem baixar o conteúdo
+        etag = container_client.get_blob_client(item["match"][0]).get_blob_properties().etag
+    return getattr(container_client, "container_name", ""), item["match"][0], etag
+
+
+def _do_armazem(item, container_client, armazem, leitura, max_paginas=None) -> bool:
+    """
+    Texto já extraído desta versão do blob (ETag) no armazém: dispensa download e extração.
+    Na leitura “metadados”, só os metadados (título, data, autor, páginas) vão para o diagnóstico.
+    """
+    chave = chave_armazem(item, container_client)
+    with telemetria.medir(item, "armazem_textos", leitura=leitura) as span:
+        if leitura == "metadados":
+            metadados = armazem.metadados(*chave)
+            if metadados is not None:
+                item["extras_diag"] = {**item["extras_diag"], **metadados}
+            encontrado = metadados is not None
+        else:
+            doc = armazem.obter(*chave)
+            if doc is not None:
+                if max_paginas is not None and doc.page_count > max_paginas:
+                    # Diagnóstico: o mesmo recorte das primeiras páginas que a leitura parcial faria
+                    doc.texto = doc.texto[:doc.offsets[max_paginas]]
+                    doc.offsets = doc.offsets[:max_paginas]
+                item["texto"], item["doc"] = doc.texto, doc
+            encontrado = doc is not None
+        span["acerto"] = encontrado
+    if encontrado:
+        item["texto_armazenado"] = True
+    return encontrado
+
+
+def baixar_pdf(item, container_client, leitura="completa", armazem=None, max_paginas=None,
+               limite_memoria=None, max_concorrencia=None):
+    """
+    Baixa o PDF encontrado no Blob Storage (se houver). No diagnóstico, `leitura` pode ser
+    “parcial” (só a faixa inicial do blob) ou “metadados” (nenhum download).
+    `limite_memoria` e `max_concorrencia` vão para transferencia_blob.baixar_blob.
+    Com `armazem` (armazem_textos.ArmazemTextos), um texto já extraído da mesma versão do
+    blob dispensa o download.
+    """
+    # Respostas já em cache dispensam o download (a não ser que o diagnóstico precise do texto)
+    if not item["match"] or not item.get("precisa_pdf", True):
+        return item
+    if armazem is not None and _do_armazem(item, container_client, armazem, leitura, max_paginas):
+        return item
+    if leitura == "metadados":
+        return item
+
+    with telemetria.medir(item, "download", leitura=leitura) as span:
+        if leitura == "parcial":
+            tamanho = getattr(item.get("propriedades"), "size", None)
+            arquivo, completo, paginas = baixar_inicio_blob(container_client, item["match"][0], tamanho)
+            if not completo and paginas is None and tamanho is not None:
+                # Grande e não linearizado: só o cabeçalho foi lido; o total de páginas exige o PDF inteiro
+                cabecalho = arquivo
+                arquivo = baixar_blob(container_client, item["match"][0], limite_memoria, max_concorrencia)
+                arquivo.bytes_transferidos += cabecalho.bytes_transferidos
+                arquivo.segundos += cabecalho.segundos
+                item["leitura"] = span["leitura"] = "completa"
+            else:
+                item["parcial"] = not completo
+                item["paginas_declaradas"] = paginas
+        else:
+            arquivo = baixar_blob(container_client, item["match"][0], limite_memoria, max_concorrencia)
+        span.update(bytes=arquivo.bytes_transferidos, em_disco=arquivo.em_disco)
+    item["arquivo"] = arquivo
+    _registrar_download(item, arquivo)
+    return item
+
+
+def _extrair(item, arquivo, max_paginas, max_processos=None):
+    with telemetria.medir(item, "extracao") as span, arquivo:
+        item["texto"], item["doc"] = ler_pdf_bytes(arquivo.origem, max_paginas, max_processos)
+        span["bytes"] = arquivo.bytes_transferidos
+        if item["doc"] is not None:
+            span.update(paginas=item["doc"].page_count, processos=item["doc"].tempos["processos"])
+        else:
+            span["erro"] = item["texto"]
+
+
+def extrair_texto(item, container_client=None, max_paginas=None, armazem=None,
+                  limite_memoria=None, max_concorrencia=None, max_processos=None):
+    """
+    Extrai o texto do PDF baixado e libera o buffer/arquivo temporário. `doc` recebe o
+    ResultadoPDF (texto, páginas, offsets e tempos), não o documento aberto.
+    Com `max_paginas`, lê só as primeiras páginas (diagnóstico). Textos completos vão
+    para o `armazem`, se houver. PDFs grandes usam até `max_processos` processos.
+    """
+    arquivo = item.pop("arquivo", None)
+    if arquivo is None:
+        return item
+    _extrair(item, arquivo, max_paginas, max_processos)
+    if armazem is not None and max_paginas is None and item["doc"] is not None:
+        with telemetria.medir(item, "armazem_textos", gravacao=True):
+            armazem.gravar(*chave_armazem(item, container_client), item["doc"])
+
+    if item.pop("parcial", False):
+        paginas = item.pop("paginas_declaradas", None)
+        if item["doc"] is not None and paginas is not None:
+            # PDF linearizado: as primeiras páginas bastam e o total vem do cabeçalho
+            item["doc"].page_count = paginas
+            item["leitura"] = "parcial"
+        else:
+            # Sem total confiável na faixa inicial: baixa o arquivo inteiro (ainda lendo poucas páginas)
+            with telemetria.medir(item, "download", leitura="completa") as span:
+                arquivo = baixar_blob(container_client, item["match"][0], limite_memoria, max_concorrencia)
+                span.update(bytes=arquivo.bytes_transferidos, em_disco=arquivo.em_disco)
+            _registrar_download(item, arquivo)
+            _extrair(item, arquivo, max_paginas, max_processos)
+            item["leitura"] = "completa"
+    return item
+
+
+def identificar_duplicata(item, indice=None, persistente=True, aproximadas=False):
+    """
+    Impressão digital do texto extraído e busca de um documento idêntico (ou, com
+    `aproximadas`, quase idêntico) na execução ou no índice. Duplicatas recebem
+    item["duplicata"]; originais, uma reserva que libera as suas duplicatas quando a IA terminar.
+    """
+    if (indice is None or not item["match"] or item.get("doc") is None
+            or item.get("recomendacoes_cache") is not None or "duplicata" in item):
+        return item
+    with telemetria.medir(item, "duplicatas") as span:
+        assinatura = duplicatas.impressao_digital(item.get("texto", ""))
+        if assinatura is None:
+            return item
+        item["assinatura"] = assinatura
+        correspondencia, reserva = indice.localizar(
+            assinatura, item["contexto_ia"], item["match"][0], persistente, aproximadas
+        )
+        if reserva is not None:
+            item.setdefault("reservas", []).append(reserva)
+        if correspondencia is not None:
+            item["duplicata"] = correspondencia
+            span["duplicata_de"] = correspondencia.blob
+    return item
+
+
+def _reaproveitar_duplicata(item) -> bool:
+    """
+    Copia as recomendações do original (esperando-o, se ainda estiver em análise).
+    Retorna False se o original falhou: o documento segue para a IA.
+    """
+    correspondencia = item.get("duplicata")
+    if correspondencia is None:
+        return False
+    if correspondencia.reserva is not None:
+        with telemetria.medir(item, "espera_original", original=correspondencia.blob):
+            recomendacoes = correspondencia.reserva.esperar()
+    else:
+        recomendacoes = correspondencia.recomendacoes
+    if recomendacoes is None:
+        del item["duplicata"]
+        return False
+    item["recomendacoes"] = list(recomendacoes)
+    item["duplicado_de"] = correspondencia.blob
+    return True
+
+
+def _filtrar(item, filtro=None):
+    pdf = item.get("doc")
+    with telemetria.medir(item, "filtro") as span:
+        filtrado = filtro_relevancia.filtrar(
+            item.get("texto", ""), pdf.offsets if pdf is not None else None, **(filtro or {})
+        )
+        span.update(
+            tokens_documento=filtrado.tokens_originais, tokens_enviados=filtrado.tokens_enviados,
+            trechos=filtrado.trechos,
+        )
+    return filtrado
+
+
+def _chamar_ia(item, ao_receber_linha=None, cancelado=None, blocos=None, filtro=None):
+    chamadas = []
+    try:
+        filtrado = _filtrar(item, filtro)
+        item["recomendacoes"], item["estatisticas_ia"] = azure_ia.extrair_recomendacoes_detalhado(
+            filtrado.texto, offsets_paginas=filtrado.offsets, chamadas=chamadas,
+            ao_receber_linha=partial(ao_receber_linha, item["chave"]) if ao_receber_linha else None,
+            cancelado=cancelado, **(blocos or {}),
+        )
+        item["estatisticas_ia"].update(filtrado.estatisticas())
+    finally:
+        telemetria.registrar_chamadas(item, chamadas)
+
+
+def analisar_ia(item, usar_ia, cache=None, indice_duplicatas=None, ao_receber_linha=None, cancelado=None,
+                blocos=None, filtro=None):
+    """
+    Envia o texto extraído para a IA, a menos que a resposta já esteja no cache ou que o
+    documento seja duplicata de outro já analisado. Antes, o pré-filtro local reduz o texto
+    aos trechos relevantes (ou o mantém integral).
+    Com `ao_receber_linha(chave, linha)`, a resposta vem em streaming, linha a linha.
+    Com `cancelado` (threading.Event) sinalizado, as chamadas ainda não feitas são abandonadas.
+    `blocos` e `filtro` são os ajustes da execução para azure_ia.extrair_recomendacoes_detalhado
+    e filtro_relevancia.filtrar.
+    Erros da IA ficam registrados no item, não interrompem a execução.
+    """
+    item["recomendacoes"] = []
+    if not (usar_ia and item["match"]):
+        return item
+    if item.get("recomendacoes_cache") is not None:
+        item["recomendacoes"] = item["recomendacoes_cache"]
+        return item
+
+    sucesso = False
+    try:
+        if not _reaproveitar_duplicata(item):
+            if item.get("doc") is None and "duplicata_exata_de" in item:
+                # Cópia idêntica não baixada e o original falhou: fica para a próxima execução
+                item["erro_ia"] = f"Falha na análise do original {item['duplicata_exata_de']}"
+                return item
+            try:
+                _chamar_ia(item, ao_receber_linha, cancelado, blocos, filtro)
+            except azure_ia.Cancelado:
+                item["erro_ia"] = "Análise interrompida"
+                return item
+            except Exception as e:
+                item["erro_ia"] = str(e)
+                return item
+        sucesso = True
+
+        # Reaproveitamento de um quase idêntico fica para revisão: não vira resposta deste blob
+        if "duplicado_de" in item and item["duplicata"].tipo == duplicatas.APROXIMADA:
+            return item
+        # Textos com erro de leitura não são guardados, para que sejam refeitos na próxima execução
+        # (cópias não baixadas recebem o resultado do original, que leu o PDF)
+        if cache is not None and item.get("chave_cache") and (item.get("doc") is not None or "duplicado_de" in item):
+            cache.gravar(item["chave_cache"], item["match"][0], item["recomendacoes"])
+        if indice_duplicatas is not None and "assinatura" in item:
+            indice_duplicatas.registrar(item["assinatura"], item["contexto_ia"], item["match"][0], item["recomendacoes"])
+    finally:
+        # Libera as duplicatas que esperam por este documento (None = analisem por conta própria)
+        for reserva in item.pop("reservas", []):
+            reserva.concluir(item["recomendacoes"] if sucesso else None)
+    return item
+
+
+# ================================
+# Modo lote (Batch API)
+# ================================
+
+def preparar_lote(item, lote, manter_texto=True, limite_tokens_bloco=None, filtro=None):
+    """
+    Em vez de chamar a IA, registra no `lote` (lote_ia.LoteIA) os prompts do documento: o
+    texto pré-filtrado inteiro ou os seus blocos. Documentos sem texto, sem PDF ou com cache
+    seguem sem item["lote"]. Sem `manter_texto` (sem diagnóstico), o texto é descartado:
+    até o lote terminar, só os custom_ids ficam em memória.
+    """
+    if not item["match"] or item.get("recomendacoes_cache") is not None or item.get("doc") is None:
+        return item
+    filtrado = _filtrar(item, filtro)
+    blocos = azure_ia.blocos_do_documento(filtrado.texto, filtrado.offsets, limite_tokens_bloco)
+    item["lote"] = {
+        "ids": [lote.adicionar(bloco) for bloco in blocos],
+        "estatisticas": {
+            "Tokens do Documento": azure_ia.contar_tokens(filtrado.texto),
+            "Blocos": len(blocos),
+            "Chamadas à IA": len(blocos),
+            "Parada Antecipada": "Não",
+        },
+        "filtro": filtrado.estatisticas(),
+    }
+    if not manter_texto:
+        item["texto"] = item["doc"].texto = ""
+    return item
+
+
+def aplicar_lote(item, lote, cache=None) -> bool:
+    """
+    Recomendações do documento a partir das respostas do lote (mescladas, se em blocos).
+    Retorna False se alguma requisição do documento falhou: ele deve seguir pelo caminho síncrono.
+    """
+    ids = item["lote"]["ids"]
+    respostas = [lote.resposta(custom_id) for custom_id in ids]
+    if any(resposta is None for resposta in respostas):
+        item["erro_lote"] = next(lote.falhas.get(c, "Sem resposta") for c, r in zip(ids, respostas) if r is None)
+        return False
+
+    infos = [info for _, info in respostas]
+    if len(respostas) == 1:
+        item["recomendacoes"] = respostas[0][0]
+    else:
+        item["recomendacoes"] = azure_ia.mesclar_recomendacoes([lista for lista, _ in respostas])
+    item["estatisticas_ia"] = {
+        **item["lote"]["estatisticas"],
+        "Retentativas": 0,
+        "Throttling (s)": "0.0",
+        "Espera por Cota (s)": "0.0",
+        "Tokens do Prompt": sum(i["tokens_prompt"] for i in infos),
+        "Tokens da Resposta": sum(i["tokens_resposta"] for i in infos),
+        **item["lote"]["filtro"],
+        "Modo da IA": "Lote",
+    }
+    telemetria.registrar_chamadas(item, infos)
+    # Respondido pelo deployment do lote: fica na chave desse deployment, não na do síncrono
+    if cache is not None and item.get("chave_cache_lote"):
+        cache.gravar(item["chave_cache_lote"], item["match"][0], item["recomendacoes"])
+    return True
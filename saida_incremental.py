@@ -0,0 +1,222 @@
+# saida_incremental.py
+#
+# Saídas gravadas linha a linha: cada documento concluído vai para um arquivo JSONL em disco
+# (com flush), e as planilhas (xlsx, CSV, Parquet) são geradas a partir dele em streaming,
+# sem montar DataFrames com todas as linhas. Serve tanto para o download parcial durante a
+# execução quanto para o arquivo final.
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import weakref
+from typing import Callable, Iterable
+
+from openpyxl import Workbook
+
+import transferencia_blob
+
+# Parquet é opcional: sem pyarrow, apenas xlsx e CSV
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+LINHAS_POR_LOTE_PARQUET = 1000
+VALOR_AUSENTE = "-"
+_RE_CARACTERES_ABA = re.compile(r"[\[\]:*?/\\]")
+
+
+def _apagar_arquivo(arquivo, caminho):
+    arquivo.close()
+    if os.path.exists(caminho):
+        os.unlink(caminho)
+
+
+class PlanilhaIncremental:
+    """
+    Linhas (dicionários) gravadas em JSONL à medida que ficam prontas. Em memória ficam só
+    as posições de cada linha no arquivo, para ler de volta na ordem desejada.
+    Sem `caminho`, o arquivo é temporário: apagado por apagar(), quando o objeto é descartado
+    (ex.: fim da sessão do Streamlit) ou ao sair do processo.
+    """
+
+    def __init__(self, caminho: str = None, omitir: Iterable[str] = ()):
+        temporario = caminho is None
+        if temporario:
+            descritor, caminho = tempfile.mkstemp(suffix=".jsonl", prefix="imani-", dir=transferencia_blob.DIRETORIO_TEMP)
+            os.close(descritor)
+        self.caminho = caminho
+        self.omitir = set(omitir)
+        self._posicoes: dict[str, int] = {}
+        self._colunas: dict[str, None] = {}   # ordem de primeira aparição
+        self._arquivo = open(caminho, "w", encoding="utf-8")
+        self._finalizador = weakref.finalize(self, _apagar_arquivo, self._arquivo, caminho) if temporario else None
+
+    def __len__(self):
+        return len(self._posicoes)
+
+    def __contains__(self, chave):
+        return chave in self._posicoes
+
+    @property
+    def colunas(self) -> list[str]:
+        return list(self._colunas)
+
+    def adicionar(self, chave: str, linha: dict):
+        """
+        Grava a linha e faz flush: o que já foi concluído sobrevive a uma queda da sessão.
+        """
+        linha = {k: v for k, v in linha.items() if k not in self.omitir}
+        self._posicoes[chave] = self._arquivo.tell()
+        self._arquivo.write(json.dumps(linha, ensure_ascii=False, default=str) + "\n")
+        self._arquivo.flush()
+        for coluna in linha:
+            self._colunas.setdefault(coluna, None)
+
+    def obter(self, chave: str) -> dict:
+        with open(self.caminho, encoding="utf-8") as f:
+            f.seek(self._posicoes[chave])
+            return json.loads(f.readline())
+
+    def linhas(self, chaves: Iterable[str] = None):
+        """
+        Gera as linhas na ordem de `chaves` (as ausentes são puladas) ou na ordem de gravação.
+        """
+        with open(self.caminho, encoding="utf-8") as f:
+            if chaves is None:
+                for linha in f:
+                    yield json.loads(linha)
+                return
+            for chave in chaves:
+                posicao = self._posicoes.get(chave)
+                if posicao is not None:
+                    f.seek(posicao)
+                    yield json.loads(f.readline())
+
+    def fechar(self):
+        self._arquivo.close()
+
+    def apagar(self):
+        if self._finalizador is not None:
+            self._finalizador()
+        else:
+            _apagar_arquivo(self._arquivo, self.caminho)
+
+
+# ================================
+# Escrita em streaming
+# ================================
+
+def _colunas(linhas: Callable[[], Iterable[dict]], colunas: list[str] = None) -> list[str]:
+    if colunas is not None:
+        return colunas
+    encontradas: dict[str, None] = {}
+    for linha in linhas():
+        for coluna in linha:
+            encontradas.setdefault(coluna, None)
+    return list(encontradas)
+
+
+def _valores(linha: dict, colunas: list[str]) -> list[str]:
+    return [VALOR_AUSENTE if linha.get(c) is None else str(linha[c]) for c in colunas]
+
+
+def escrever_xlsx(destino, linhas: Callable[[], Iterable[dict]], colunas: list[str] = None):
+    """
+    xlsx em modo write_only do openpyxl (linhas vão direto para o arquivo). `linhas` é uma
+    função que gera as linhas; é chamada duas vezes se as colunas não forem informadas.
+    `destino` é um caminho ou um arquivo binário.
+    """
+    colunas = _colunas(linhas, colunas)
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet("Sheet1")
+    planilha.append(colunas)
+    for linha in linhas():
+        planilha.append(_valores(linha, colunas))
+    livro.save(destino)
+
+
+def nome_de_aba(nome: str, usados: set[str]) -> str:
+    """
+    Nome válido e único para uma aba do Excel (até 31 caracteres, sem []:*?/\\).
+    """
+    base = _RE_CARACTERES_ABA.sub("_", nome).strip("' ") or "Aba"
+    candidato, n = base[:31], 1
+    while candidato.casefold() in usados:
+        n += 1
+        sufixo = f" ({n})"
+        candidato = base[: 31 - len(sufixo)] + sufixo
+    usados.add(candidato.casefold())
+    return candidato
+
+
+def escrever_xlsx_por_grupo(
+    destino, grupos: Callable[[], Iterable[tuple[str, Iterable[dict]]]], colunas: list[str] = None
+):
+    """
+    Um xlsx com uma aba por grupo (ex.: por empresa), em modo write_only. `grupos` gera
+    (nome do grupo, linhas do grupo); cada grupo é escrito por inteiro antes do próximo.
+    """
+    colunas = _colunas(lambda: (linha for _, linhas in grupos() for linha in linhas), colunas)
+    livro = Workbook(write_only=True)
+    usados: set[str] = set()
+    for nome, linhas in grupos():
+        planilha = livro.create_sheet(nome_de_aba(str(nome), usados))
+        planilha.append(colunas)
+        for linha in linhas:
+            planilha.append(_valores(linha, colunas))
+    if not usados:
+        livro.create_sheet("Sheet1").append(colunas)
+    livro.save(destino)
+
+
+def escrever_csv(destino, linhas: Callable[[], Iterable[dict]], colunas: list[str] = None):
+    """
+    CSV em UTF-8 com BOM (abre direto no Excel), uma linha por vez.
+    """
+    colunas = _colunas(linhas, colunas)
+    with open(destino, "w", encoding="utf-8-sig", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(colunas)
+        for linha in linhas():
+            escritor.writerow(_valores(linha, colunas))
+
+
+def escrever_parquet(destino, linhas: Callable[[], Iterable[dict]], colunas: list[str] = None):
+    """
+    Parquet (todas as colunas como texto) em lotes de LINHAS_POR_LOTE_PARQUET. Requer pyarrow.
+    """
+    if pq is None:
+        raise RuntimeError("Parquet requer o pacote pyarrow.")
+    colunas = _colunas(linhas, colunas)
+    esquema = pa.schema([(c, pa.string()) for c in colunas])
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        lote = []
+        for linha in linhas():
+            lote.append(_valores(linha, colunas))
+            if len(lote) >= LINHAS_POR_LOTE_PARQUET:
+                escritor.write_table(pa.Table.from_pylist([dict(zip(colunas, v)) for v in lote], schema=esquema))
+                lote = []
+        if lote:
+            escritor.write_table(pa.Table.from_pylist([dict(zip(colunas, v)) for v in lote], schema=esquema))
+
+
+def xlsx_em_bytes(linhas: Callable[[], Iterable[dict]], colunas: list[str] = None) -> bytes:
+    """
+    xlsx para o botão de download do Streamlit (gerado em streaming; só o arquivo final,
+    compactado, fica em memória).
+    """
+    buffer = io.BytesIO()
+    escrever_xlsx(buffer, linhas, colunas)
+    return buffer.getvalue()
+
+
+def xlsx_por_grupo_em_bytes(
+    grupos: Callable[[], Iterable[tuple[str, Iterable[dict]]]], colunas: list[str] = None
+) -> bytes:
+    buffer = io.BytesIO()
+    escrever_xlsx_por_grupo(buffer, grupos, colunas)
+    return buffer.getvalue()
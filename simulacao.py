@@ -0,0 +1,395 @@
+# simulacao.py
+#
+# Substitutos locais do Blob Storage e do Azure OpenAI (inclusive arquivos e jobs da Batch API),
+# com latência e falhas configuráveis, e geração de PDFs sintéticos. Usados pelo benchmark para
+# medir o IMANI sem tocar no Azure.
+import hashlib
+import json
+import random
+import threading
+from datetime import datetime, timezone
+from io import BytesIO
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+import fitz
+import openai
+
+# ================================
+# PDFs sintéticos
+# ================================
+
+_PALAVRAS = (
+    "ensaio sondagem talude barragem piezômetro fundação solo rocha drenagem aterro "
+    "monitoramento estabilidade recalque compactação granulometria permeabilidade"
+).split()
+
+_RECOMENDACOES = [
+    "Recomenda-se instalar piezômetros adicionais na ombreira direita.",
+    "Deve-se executar a limpeza do sistema de drenagem interna.",
+    "É obrigatório realizar inspeção trimestral do talude de jusante.",
+]
+
+
+def gerar_pdf_sintetico(paginas: int, palavras_por_pagina: int = 350, semente: int = 0) -> bytes:
+    """
+    PDF com texto corrido, cabeçalho de diagnóstico (data e “elaborado por”) e uma seção de conclusões.
+    """
+    aleatorio = random.Random(semente)
+    doc = fitz.open()
+    for numero in range(paginas):
+        if numero == 0:
+            texto = f"RELATÓRIO TÉCNICO {semente}\nElaborado por Geotecnia Simulada Ltda.\n{1 + semente % 28:02d}/03/2024\n"
+        elif numero == paginas - 1:
+            texto = "5. CONCLUSÕES E RECOMENDAÇÕES\n" + "\n".join(_RECOMENDACOES) + "\n"
+        else:
+            texto = f"{numero}. SEÇÃO {numero}\n"
+        texto += " ".join(aleatorio.choice(_PALAVRAS) for _ in range(palavras_por_pagina))
+        pagina = doc.new_page()
+        pagina.insert_textbox(pagina.rect + (36, 36, -36, -36), texto, fontsize=8)
+    # Sem datas nem ID novos: o mesmo corpus gera os mesmos bytes (e ETags) a cada execução
+    doc.set_metadata({})
+    conteudo = doc.tobytes(deflate=True, no_new_id=True)
+    doc.close()
+    return conteudo
+
+
+def gerar_corpus(perfis: list[tuple[int, int]], empresa: str = "Empresa Simulada") -> dict[str, bytes]:
+    """
+    Corpus de PDFs: `perfis` é uma lista de (quantidade, páginas). Retorna {nome do blob: bytes}.
+    """
+    corpus = {}
+    semente = 0
+    for quantidade, paginas in perfis:
+        for _ in range(quantidade):
+            nome = f"Relatórios Técnicos/{empresa}/Relatórios/REL-{semente:04d}-{paginas}p.pdf"
+            corpus[nome] = gerar_pdf_sintetico(paginas, semente=semente)
+            semente += 1
+    return corpus
+
+
+def _atraso(base: float, variacao: float = 0.25):
+    if base > 0:
+        sleep(base * random.uniform(1 - variacao, 1 + variacao))
+
+
+# ================================
+# Blob Storage simulado
+# ================================
+
+class _DownloaderSimulado:
+    def __init__(self, conteudo: bytes, tamanho_total: int, inicio: int, latencia_mb: float):
+        self._conteudo = conteudo
+        self._latencia_mb = latencia_mb
+        self.size = len(conteudo)
+        fim = inicio + len(conteudo) - 1
+        self.properties = SimpleNamespace(size=len(conteudo), content_range=f"bytes {inicio}-{fim}/{tamanho_total}")
+
+    def readinto(self, stream) -> int:
+        _atraso(self._latencia_mb * len(self._conteudo) / 1024 / 1024)
+        stream.write(self._conteudo)
+        return len(self._conteudo)
+
+    def readall(self) -> bytes:
+        buffer = BytesIO()
+        self.readinto(buffer)
+        return buffer.getvalue()
+
+    def chunks(self):
+        yield self.readall()
+
+
+class _BlobSimulado:
+    def __init__(self, container, nome):
+        self._container = container
+        self._nome = nome
+
+    def get_blob_properties(self):
+        self._container._falhar_talvez()
+        return self._container._propriedades(self._nome)
+
+    def download_blob(self, offset=None, length=None, max_concurrency=1, **kwargs):
+        container = self._container
+        _atraso(container.latencia_requisicao)
+        container._falhar_talvez()
+        conteudo = container.blobs[self._nome]
+        inicio = offset or 0
+        fim = len(conteudo) if length is None else min(len(conteudo), inicio + length)
+        with container._lock:
+            container.bytes_servidos += fim - inicio
+        # Faixas paralelas dividem o tempo de transferência
+        latencia_mb = container.latencia_por_mb / max(1, max_concurrency)
+        return _DownloaderSimulado(conteudo[inicio:fim], len(conteudo), inicio, latencia_mb)
+
+
+class ContainerSimulado:
+    """
+    Imita o ContainerClient: list_blobs, walk_blobs e get_blob_client, com latência por
+    requisição, latência por MB transferido e taxa de falhas.
+    """
+
+    def __init__(self, blobs: dict[str, bytes], latencia_requisicao=0.02, latencia_por_mb=0.05, taxa_falha=0.0):
+        self.container_name = "simulado"
+        self.blobs = blobs
+        self.latencia_requisicao = latencia_requisicao
+        self.latencia_por_mb = latencia_por_mb
+        self.taxa_falha = taxa_falha
+        self.bytes_servidos = 0
+        self.listagens = 0
+        self._lock = threading.Lock()
+        self._modificado = datetime.now(timezone.utc)
+
+    def _falhar_talvez(self):
+        if self.taxa_falha and random.random() < self.taxa_falha:
+            raise ConnectionError("falha simulada do Blob Storage")
+
+    def _propriedades(self, nome):
+        conteudo = self.blobs[nome]
+        md5 = hashlib.md5(conteudo).digest()
+        return SimpleNamespace(
+            name=nome,
+            size=len(conteudo),
+            etag=f'"0x{md5.hex()[:16].upper()}"',
+            last_modified=self._modificado,
+            content_settings=SimpleNamespace(content_md5=bytearray(md5)),
+        )
+
+    def get_container_properties(self):
+        return SimpleNamespace(name="simulado")
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        _atraso(self.latencia_requisicao)
+        with self._lock:
+            self.listagens += 1
+        prefixo = name_starts_with or ""
+        return [self._propriedades(n) for n in sorted(self.blobs) if n.startswith(prefixo)]
+
+    def walk_blobs(self, name_starts_with=None, delimiter="/", **kwargs):
+        _atraso(self.latencia_requisicao)
+        prefixo = name_starts_with or ""
+        vistos = set()
+        for nome in sorted(self.blobs):
+            if not nome.startswith(prefixo):
+                continue
+            resto = nome[len(prefixo):]
+            if delimiter in resto:
+                subprefixo = prefixo + resto.split(delimiter, 1)[0] + delimiter
+                if subprefixo not in vistos:
+                    vistos.add(subprefixo)
+                    yield SimpleNamespace(name=subprefixo, prefix=subprefixo)
+            else:
+                yield self._propriedades(nome)
+
+    def get_blob_client(self, nome):
+        return _BlobSimulado(self, nome)
+
+
+# ================================
+# Azure OpenAI simulado
+# ================================
+
+def _erro_status(status: int, mensagem: str, retry_after_ms: int = None):
+    cabecalhos = {"retry-after-ms": str(retry_after_ms)} if retry_after_ms else {}
+    resposta = SimpleNamespace(status_code=status, headers=cabecalhos, request=None)
+    classe = openai.RateLimitError if status == 429 else openai.InternalServerError
+    return classe(mensagem, response=resposta, body=None)
+
+
+class _ConclusoesSimuladas:
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def create(self, model=None, messages=None, max_tokens=1024, stream=False, **kwargs):
+        cliente = self._cliente
+        prompt = "".join(m["content"] for m in messages or [])
+        tokens_prompt = len(prompt) // 4 + 1
+        _atraso(cliente.latencia_base + cliente.latencia_por_mil_tokens * tokens_prompt / 1000)
+
+        sorteio = random.random()
+        if sorteio < cliente.taxa_throttle:
+            with cliente._lock:
+                cliente.throttles += 1
+            raise _erro_status(429, "Rate limit simulado", retry_after_ms=cliente.retry_after_ms)
+        if sorteio < cliente.taxa_throttle + cliente.taxa_falha:
+            raise _erro_status(500, "Falha simulada do Azure OpenAI")
+
+        conteudo, uso = _responder(prompt, max_tokens)
+        with cliente._lock:
+            cliente.chamadas += 1
+            cliente.tokens_prompt += tokens_prompt
+        tokens_resposta = uso.completion_tokens
+        if stream:
+            return _fluxo_simulado(conteudo, uso, cliente.latencia_por_token_resposta)
+        _atraso(cliente.latencia_por_token_resposta * tokens_resposta)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=conteudo), finish_reason="stop")],
+            usage=uso,
+        )
+
+
+def _responder(prompt: str, max_tokens: int):
+    """
+    Responde com as frases “obrigatórias” presentes no trecho enviado. Retorna (conteúdo, uso).
+    """
+    tokens_prompt = len(prompt) // 4 + 1
+    linhas = [r for r in _RECOMENDACOES if r in prompt]
+    conteudo = "\n".join(f"{i}. {r}" for i, r in enumerate(linhas, start=1))
+    tokens_resposta = min(max_tokens, len(conteudo) // 4 + 1)
+    return conteudo, SimpleNamespace(
+        prompt_tokens=tokens_prompt,
+        completion_tokens=tokens_resposta,
+        total_tokens=tokens_prompt + tokens_resposta,
+    )
+
+
+def _fluxo_simulado(conteudo: str, uso, latencia_por_token: float):
+    """
+    Eventos de uma resposta em streaming: fragmentos de ~4 caracteres (um token) e, por
+    último, um evento só com o uso de tokens (stream_options include_usage).
+    """
+    for inicio in range(0, len(conteudo), 4):
+        _atraso(latencia_por_token)
+        delta = SimpleNamespace(content=conteudo[inicio:inicio + 4])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+    yield SimpleNamespace(choices=[], usage=uso)
+
+
+class ClienteOpenAISimulado:
+    """
+    Imita `AzureOpenAI` em `chat.completions.create`, com latência proporcional aos tokens
+    (do prompt até o primeiro token e, depois, por token gerado), taxas de 429 (com
+    Retry-After) e de erros 500, e respostas em streaming (stream=True).
+    """
+
+    def __init__(self, latencia_base=0.3, latencia_por_mil_tokens=0.05, taxa_falha=0.0,
+                 taxa_throttle=0.0, retry_after_ms=200, latencia_por_token_resposta=0.0,
+                 duracao_lote=1.0, taxa_falha_lote=0.0):
+        self.latencia_base = latencia_base
+        self.latencia_por_mil_tokens = latencia_por_mil_tokens
+        self.latencia_por_token_resposta = latencia_por_token_resposta
+        self.duracao_lote = duracao_lote            # segundos até um job da Batch API concluir
+        self.taxa_falha_lote = taxa_falha_lote      # fração das requisições do job que falham
+        self.taxa_falha = taxa_falha
+        self.taxa_throttle = taxa_throttle
+        self.retry_after_ms = retry_after_ms
+        self.chamadas = 0
+        self.throttles = 0
+        self.tokens_prompt = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_ConclusoesSimuladas(self))
+        self.files = _ArquivosSimulados()
+        self.batches = _LotesSimulados(self)
+        self.requisicoes_lote = 0
+
+
+# ——— Batch API: arquivos JSONL e jobs ———
+
+class _ArquivosSimulados:
+    """
+    `client.files`: upload (purpose="batch") e download do conteúdo de arquivos.
+    """
+
+    def __init__(self):
+        self._arquivos: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def _guardar(self, conteudo: bytes) -> str:
+        with self._lock:
+            identificador = f"file-{len(self._arquivos) + 1:06d}"
+            self._arquivos[identificador] = conteudo
+        return identificador
+
+    def create(self, file=None, purpose=None, **kwargs):
+        conteudo = file.read() if hasattr(file, "read") else file[1].read() if isinstance(file, tuple) else file
+        return SimpleNamespace(id=self._guardar(conteudo), purpose=purpose, bytes=len(conteudo), status="processed")
+
+    def content(self, file_id):
+        conteudo = self._arquivos[file_id]
+        return SimpleNamespace(text=conteudo.decode("utf-8"), read=lambda: conteudo)
+
+    def delete(self, file_id):
+        with self._lock:
+            self._arquivos.pop(file_id, None)
+
+
+class _LotesSimulados:
+    """
+    `client.batches`: o job fica “in_progress” por `duracao_lote` segundos e, na primeira
+    consulta depois disso, responde a todas as requisições do arquivo de entrada (uma fração
+    `taxa_falha_lote` vai para o arquivo de erros).
+    """
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, input_file_id=None, endpoint=None, completion_window="24h", **kwargs):
+        with self._lock:
+            identificador = f"batch-{len(self._jobs) + 1:06d}"
+            self._jobs[identificador] = {
+                "entrada": input_file_id, "criado": monotonic(), "status": "validating",
+                "saida": None, "erros": None, "contagem": (0, 0, 0),
+            }
+        return self.retrieve(identificador)
+
+    def _processar(self, job):
+        cliente = self._cliente
+        linhas_saida, linhas_erro = [], []
+        for linha in cliente.files._arquivos[job["entrada"]].decode("utf-8").splitlines():
+            if not linha.strip():
+                continue
+            requisicao = json.loads(linha)
+            corpo = requisicao["body"]
+            if random.random() < cliente.taxa_falha_lote:
+                linhas_erro.append({
+                    "custom_id": requisicao["custom_id"],
+                    "response": {"status_code": 500, "body": {"error": {"message": "Falha simulada no lote"}}},
+                    "error": None,
+                })
+                continue
+            prompt = "".join(m["content"] for m in corpo["messages"])
+            conteudo, uso = _responder(prompt, corpo.get("max_tokens", 1024))
+            linhas_saida.append({
+                "custom_id": requisicao["custom_id"],
+                "response": {"status_code": 200, "body": {
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": conteudo},
+                                 "finish_reason": "stop"}],
+                    "usage": vars(uso),
+                }},
+                "error": None,
+            })
+        with cliente._lock:
+            cliente.requisicoes_lote += len(linhas_saida) + len(linhas_erro)
+            cliente.tokens_prompt += sum(l["response"]["body"]["usage"]["prompt_tokens"] for l in linhas_saida)
+
+        def arquivo(linhas):
+            if not linhas:
+                return None
+            return cliente.files._guardar("".join(json.dumps(l, ensure_ascii=False) + "\n" for l in linhas).encode("utf-8"))
+
+        total = len(linhas_saida) + len(linhas_erro)
+        job.update(status="completed", saida=arquivo(linhas_saida), erros=arquivo(linhas_erro),
+                   contagem=(total, len(linhas_saida), len(linhas_erro)))
+
+    def retrieve(self, batch_id):
+        with self._lock:
+            job = self._jobs[batch_id]
+            if job["status"] in ("validating", "in_progress"):
+                decorrido = monotonic() - job["criado"]
+                if decorrido >= self._cliente.duracao_lote:
+                    self._processar(job)
+                elif decorrido > 0:
+                    job["status"] = "in_progress"
+            total, concluidas, falhas = job["contagem"]
+            return SimpleNamespace(
+                id=batch_id, status=job["status"], input_file_id=job["entrada"],
+                output_file_id=job["saida"], error_file_id=job["erros"],
+                request_counts=SimpleNamespace(total=total, completed=concluidas, failed=falhas),
+                errors=None,
+            )
+
+    def cancel(self, batch_id):
+        with self._lock:
+            self._jobs[batch_id]["status"] = "cancelled"
+        return self.retrieve(batch_id)
@@ -0,0 +1,202 @@
+# telemetria.py
+#
+# Spans por documento (listagem, download, extração, montagem do prompt e chamada ao modelo),
+# agregação por etapa, exportação de trace e estimativa do tempo restante.
+import json
+from contextlib import contextmanager
+from time import time
+
+import pandas as pd
+
+# Atributos numéricos somados na agregação por etapa
+ATRIBUTOS_SOMADOS = {
+    "bytes": "Bytes",
+    "paginas": "Páginas",
+    "tokens_documento": "Tokens do Documento",
+    "tokens_enviados": "Tokens Enviados",
+    "tokens_prompt": "Tokens do Prompt",
+    "tokens_resposta": "Tokens da Resposta",
+    "retentativas": "Retentativas",
+}
+
+
+def novo_span(etapa: str, inicio: float, duracao: float, **atributos) -> dict:
+    return {"etapa": etapa, "inicio": inicio, "duracao": duracao, **atributos}
+
+
+@contextmanager
+def medir(item: dict, etapa: str, **atributos):
+    """
+    Mede o bloco e registra o span em item["spans"]. O dicionário devolvido recebe os
+    atributos conhecidos só ao final (bytes, páginas...).
+    """
+    span = novo_span(etapa, time(), 0.0, **atributos)
+    try:
+        yield span
+    except Exception as e:
+        span["erro"] = str(e)
+        raise
+    finally:
+        span["duracao"] = time() - span["inicio"]
+        item.setdefault("spans", []).append(span)
+
+
+def registrar_chamadas(item: dict, chamadas: list[dict]):
+    """
+    Converte as informações das chamadas ao modelo (ver azure_ia._chamar_modelo) em spans
+    de montagem do prompt e de chamada ao modelo.
+    """
+    spans = item.setdefault("spans", [])
+    for info in chamadas:
+        # Em streaming: tempo até a primeira linha completa da resposta
+        extras = {"primeira_linha": round(info["segundos_primeira_linha"], 3)} if "segundos_primeira_linha" in info else {}
+        spans.append(novo_span("prompt", info["inicio"], info["segundos_prompt"], caracteres=info["caracteres"]))
+        spans.append(novo_span(
+            "modelo", info["inicio"] + info["segundos_prompt"], info["segundos_modelo"],
+            tokens_prompt=info["tokens_prompt"],
+            tokens_resposta=info["tokens_resposta"],
+            retentativas=info["tentativas"] - 1,
+            throttles=info["throttles"],
+            espera_throttle=round(info["espera_throttle"], 3),
+            espera_cota=round(info["espera_cota"], 3),
+            **extras,
+        ))
+
+
+def percentis(valores: list[float]) -> dict:
+    """
+    p50/p90/p99, média e máximo (segundos) de uma lista de durações.
+    """
+    if not valores:
+        return {"n": 0}
+    serie = pd.Series(valores)
+    return {
+        "n": len(valores),
+        "p50": round(float(serie.quantile(0.5)), 4),
+        "p90": round(float(serie.quantile(0.9)), 4),
+        "p99": round(float(serie.quantile(0.99)), 4),
+        "media": round(float(serie.mean()), 4),
+        "max": round(float(serie.max()), 4),
+    }
+
+
+def tabela_etapas(spans: list[dict]) -> pd.DataFrame:
+    """
+    Uma linha por etapa: quantidade de spans, tempo total e percentis, e somas de bytes,
+    páginas, tokens e retentativas.
+    """
+    linhas = []
+    por_etapa: dict[str, list[dict]] = {}
+    for span in spans:
+        por_etapa.setdefault(span["etapa"], []).append(span)
+    for etapa, lista in por_etapa.items():
+        duracoes = percentis([s["duracao"] for s in lista])
+        linha = {
+            "Etapa": etapa,
+            "Spans": len(lista),
+            "Total (s)": round(sum(s["duracao"] for s in lista), 3),
+            "p50 (s)": duracoes["p50"],
+            "p90 (s)": duracoes["p90"],
+            "Erros": sum(1 for s in lista if "erro" in s),
+        }
+        for atributo, coluna in ATRIBUTOS_SOMADOS.items():
+            if any(atributo in s for s in lista):
+                linha[coluna] = sum(s.get(atributo) or 0 for s in lista)
+        linhas.append(linha)
+    tabela = pd.DataFrame(linhas)
+    # Atributos que não se aplicam à etapa (ex.: páginas na listagem) ficam zerados
+    somadas = [c for c in ATRIBUTOS_SOMADOS.values() if c in tabela.columns]
+    tabela[somadas] = tabela[somadas].fillna(0).astype(int)
+    return tabela
+
+
+def trace_chrome(spans: list[dict]) -> dict:
+    """
+    Spans no formato Trace Event (chrome://tracing, Perfetto): uma linha do tempo por documento.
+    """
+    if not spans:
+        return {"traceEvents": []}
+    origem = min(s["inicio"] for s in spans)
+    linhas_tempo: dict[str, int] = {}
+    eventos = []
+    for span in spans:
+        documento = span.get("documento", "-")
+        tid = linhas_tempo.setdefault(documento, len(linhas_tempo) + 1)
+        eventos.append({
+            "name": span["etapa"],
+            "cat": span["etapa"],
+            "ph": "X",
+            "ts": round((span["inicio"] - origem) * 1e6),
+            "dur": round(span["duracao"] * 1e6),
+            "pid": 1,
+            "tid": tid,
+            "args": {k: v for k, v in span.items() if k not in ("etapa", "inicio", "duracao")},
+        })
+    eventos += [
+        {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": documento}}
+        for documento, tid in linhas_tempo.items()
+    ]
+    return {"traceEvents": eventos, "displayTimeUnit": "ms"}
+
+
+def exportar_trace(spans: list[dict], caminho: str):
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(trace_chrome(spans), f, ensure_ascii=False, default=str)
+
+
+# ================================
+# Estimativa do tempo restante
+# ================================
+
+class EstimadorETA:
+    """
+    Estima o tempo restante a partir da vazão observada em cada etapa e do tamanho dos
+    documentos que ainda faltam: custo = fixo + segundos por byte, ajustado por mínimos
+    quadrados. Como as etapas rodam em paralelo, o restante é o da etapa mais lenta.
+    """
+
+    def __init__(self, workers: dict[str, int]):
+        self.workers = {etapa: max(1, n) for etapa, n in workers.items()}
+        self._amostras: dict[str, list[tuple[int, float]]] = {etapa: [] for etapa in workers}
+        self._pendentes: dict[str, dict[str, int]] = {}
+
+    def adicionar(self, chave: str, tamanhos: dict[str, int]):
+        """
+        Documento a processar, com os bytes que passam por cada etapa (0 = etapa não se aplica).
+        """
+        self._pendentes[chave] = tamanhos
+
+    def concluir(self, chave: str, duracoes: dict[str, float]):
+        tamanhos = self._pendentes.pop(chave, {})
+        for etapa, segundos in duracoes.items():
+            if etapa in self._amostras and tamanhos.get(etapa):
+                self._amostras[etapa].append((tamanhos[etapa], segundos))
+
+    def _modelo(self, etapa: str) -> tuple[float, float] | None:
+        amostras = self._amostras[etapa]
+        if not amostras:
+            return None
+        n = len(amostras)
+        media_x = sum(x for x, _ in amostras) / n
+        media_y = sum(y for _, y in amostras) / n
+        variancia = sum((x - media_x) ** 2 for x, _ in amostras)
+        if variancia == 0:
+            return 0.0, media_y / media_x   # um só tamanho: proporcional aos bytes
+        inclinacao = max(0.0, sum((x - media_x) * (y - media_y) for x, y in amostras) / variancia)
+        return max(0.0, media_y - inclinacao * media_x), inclinacao
+
+    def estimar(self) -> float | None:
+        """
+        Segundos restantes, ou None enquanto alguma etapa pendente não tiver amostras.
+        """
+        restante = 0.0
+        for etapa, workers in self.workers.items():
+            tamanhos = [t[etapa] for t in self._pendentes.values() if t.get(etapa)]
+            if not tamanhos:
+                continue
+            modelo = self._modelo(etapa)
+            if modelo is None:
+                return None
+            fixo, por_byte = modelo
+            restante = max(restante, sum(fixo + por_byte * t for t in tamanhos) / workers)
+        return restante
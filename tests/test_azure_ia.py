@@ -0,0 +1,25 @@
+# test_azure_ia.py
+import azure_ia
+
+
+def test_mesclar_sem_recomendacoes_em_nenhum_bloco():
+    listas = [["Nenhuma recomendação encontrada."], ["Este trecho não contém recomendações."]]
+    assert azure_ia.mesclar_recomendacoes(listas) == []
+
+
+def test_mesclar_descarta_preambulo_e_duplicatas():
+    listas = [
+        ["Recomendações técnicas:", "1. Substituir a válvula de alívio."],
+        ["1. Substituir a valvula de alivio", "2. Inspecionar o duto de exaustão."],
+    ]
+    assert azure_ia.mesclar_recomendacoes(listas) == [
+        "1. Substituir a válvula de alívio.",
+        "2. Inspecionar o duto de exaustão.",
+    ]
+
+
+def test_blocos_mantem_quebras_de_linha_e_pagina():
+    texto = "primeira linha do parágrafo\nsegunda linha\n\n" * 800 + "\f" + "linha da página dois\n" * 800
+    blocos = azure_ia.dividir_em_blocos(texto, limite_tokens=500)
+    assert len(blocos) > 1
+    assert "".join(blocos) == texto
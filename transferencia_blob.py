@@ -0,0 +1,136 @@
+# transferencia_blob.py
+import os
+import re
+import tempfile
+from io import BytesIO
+from time import perf_counter
+
+# ——— Parâmetros do download ———
+LIMITE_MEMORIA = 32 * 1024 * 1024     # acima disso, o PDF vai para um arquivo temporário em disco
+MAX_CONCORRENCIA = 4                  # downloads por faixas (ranged) em paralelo para blobs grandes
+DIRETORIO_TEMP = os.environ.get("IMANI_TEMP_DIR") or None
+BYTES_INICIAIS = 1024 * 1024          # faixa inicial lida no diagnóstico parcial
+BYTES_CABECALHO = 4 * 1024            # sondagem da linearização antes da faixa inicial
+
+# Dicionário de linearização (“fast web view”) no início do PDF: /L = tamanho do arquivo, /N = páginas
+_RE_LINEARIZADO = re.compile(rb"/Linearized\s.*?>>", re.DOTALL)
+_RE_LIN_TAMANHO = re.compile(rb"/L\s+(\d+)")
+_RE_LIN_PAGINAS = re.compile(rb"/N\s+(\d+)")
+
+
+class ArquivoBaixado:
+    """
+    PDF baixado do Blob Storage: em memória (pequeno) ou em arquivo temporário (grande).
+    `origem` pode ser passada direto para `ler_pdf_bytes` sem cópias adicionais.
+    """
+
+    def __init__(self, nome, origem, bytes_transferidos, segundos, caminho=None):
+        self.nome = nome
+        self.origem = origem
+        self.bytes_transferidos = bytes_transferidos
+        self.segundos = segundos
+        self.caminho = caminho
+
+    @property
+    def em_disco(self) -> bool:
+        return self.caminho is not None
+
+    @property
+    def vazao_mb_s(self) -> float:
+        return self.bytes_transferidos / 1024 / 1024 / self.segundos if self.segundos > 0 else 0.0
+
+    def fechar(self):
+        """
+        Libera a memória ou remove o arquivo temporário.
+        """
+        self.origem = None
+        if self.caminho is not None:
+            try:
+                os.unlink(self.caminho)
+            except FileNotFoundError:
+                pass
+            self.caminho = None
+
+    def __del__(self):
+        # Garante a remoção do temporário se o item for descartado sem passar pela extração
+        self.fechar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def baixar_blob(container_client, nome_blob, limite_memoria=None, max_concorrencia=None) -> ArquivoBaixado:
+    """
+    Baixa o blob em fluxo (readinto), sem `readall()`: blobs pequenos ficam em um único buffer
+    em memória; os maiores que `limite_memoria` são gravados direto em disco, com faixas
+    baixadas em paralelo.
+    """
+    limite_memoria = LIMITE_MEMORIA if limite_memoria is None else limite_memoria
+    max_concorrencia = max_concorrencia or MAX_CONCORRENCIA
+
+    inicio = perf_counter()
+    downloader = container_client.get_blob_client(nome_blob).download_blob(max_concurrency=max_concorrencia)
+
+    if downloader.size > limite_memoria:
+        arquivo = tempfile.NamedTemporaryFile(suffix=".pdf", dir=DIRETORIO_TEMP, delete=False)
+        try:
+            with arquivo:
+                transferidos = downloader.readinto(arquivo)
+        except BaseException:
+            os.unlink(arquivo.name)
+            raise
+        return ArquivoBaixado(nome_blob, arquivo.name, transferidos, perf_counter() - inicio, caminho=arquivo.name)
+
+    buffer = BytesIO()
+    transferidos = downloader.readinto(buffer)
+    # memoryview do buffer: o PyMuPDF abre sem copiar os bytes
+    return ArquivoBaixado(nome_blob, buffer.getbuffer(), transferidos, perf_counter() - inicio)
+
+
+def paginas_linearizadas(inicio: bytes, tamanho_blob: int) -> int | None:
+    """
+    Número de páginas declarado no dicionário de linearização, se o PDF for linearizado
+    e o dicionário ainda for válido (/L igual ao tamanho do blob).
+    """
+    dicionario = _RE_LINEARIZADO.search(inicio[:2048])
+    if not dicionario:
+        return None
+    tamanho = _RE_LIN_TAMANHO.search(dicionario.group(0))
+    paginas = _RE_LIN_PAGINAS.search(dicionario.group(0))
+    if not tamanho or not paginas or int(tamanho.group(1)) != tamanho_blob:
+        return None
+    return int(paginas.group(1))
+
+
+def baixar_inicio_blob(container_client, nome_blob, tamanho_total=None, num_bytes=None) -> tuple[ArquivoBaixado, bool, int | None]:
+    """
+    Baixa só os primeiros `num_bytes` do blob (requisições com Range). `tamanho_total`
+    vem da listagem; sem ele, é lido do Content-Range da resposta.
+    Blobs maiores que a faixa só valem a leitura parcial se forem linearizados (é de onde vem
+    o total de páginas): o cabeçalho é sondado antes e, sem linearização, a faixa não é lida.
+    Retorna (arquivo, completo?, páginas declaradas na linearização); com arquivo incompleto
+    e sem páginas, só o PDF inteiro dá o total de páginas.
+    """
+    num_bytes = num_bytes or BYTES_INICIAIS
+    inicio = perf_counter()
+    blob_client = container_client.get_blob_client(nome_blob)
+    if tamanho_total is not None and tamanho_total > num_bytes:
+        cabecalho = blob_client.download_blob(offset=0, length=BYTES_CABECALHO).readall()
+        paginas = paginas_linearizadas(cabecalho, tamanho_total)
+        if paginas is None:
+            return ArquivoBaixado(nome_blob, cabecalho, len(cabecalho), perf_counter() - inicio), False, None
+        resto = blob_client.download_blob(offset=len(cabecalho), length=num_bytes - len(cabecalho)).readall()
+        conteudo = cabecalho + resto
+        return ArquivoBaixado(nome_blob, conteudo, len(conteudo), perf_counter() - inicio), False, paginas
+
+    downloader = blob_client.download_blob(offset=0, length=num_bytes)
+    conteudo = downloader.readall()
+    if tamanho_total is None:
+        # Content-Range: “bytes 0-1048575/<total>”
+        faixa = getattr(getattr(downloader, "properties", None), "content_range", None) or ""
+        tamanho_total = int(faixa.rsplit("/", 1)[1]) if "/" in faixa else len(conteudo)
+    arquivo = ArquivoBaixado(nome_blob, conteudo, len(conteudo), perf_counter() - inicio)
+    return arquivo, len(conteudo) >= tamanho_total, paginas_linearizadas(conteudo, tamanho_total)
@@ -1,23 +1,35 @@
 # utilidades.py
 import re
 
+# Padrões pré-compilados (o diagnóstico roda sobre o texto de muitos documentos)
+_RE_DATA = re.compile(r"\d{2}/\d{2}/\d{4}")
+_RE_LINHA_EMPRESA = re.compile(r"^.*(?:elaborado por|responsável).*$", re.IGNORECASE | re.MULTILINE)
+
 def extrair_data(texto):
-    match = re.search(r"\d{2}/\d{2}/\d{4}", texto)
+    match = _RE_DATA.search(texto)
     return match.group(0) if match else "-"
 
 def extrair_empresa(texto):
-    for linha in texto.split("\n"):
-        if "elaborado por" in linha.lower() or "responsável" in linha.lower():
-            return linha.strip()
-    return "-"
+    match = _RE_LINHA_EMPRESA.search(texto)
+    return match.group(0).strip() if match else "-"
 
-def gerar_diagnostico(nome_excel, nome_blob, texto, doc):
+def metadados_texto(texto, doc):
+    # Título (primeira linha), data, linha do autor e páginas, como no diagnóstico
     return {
-        "Nome no Excel": nome_excel,
-        "Nome Encontrado": nome_blob.split("/")[-1],
-        "Match Exato": "Sim" if nome_excel + ".pdf" == nome_blob.split("/")[-1] else "Não",
         "Título": texto.split("\n")[0][:100] if texto else "-",
         "Data de Recebimento": extrair_data(texto),
         "Empresa Elaboradora": extrair_empresa(texto),
         "Páginas": doc.page_count if doc else "-"
     }
+
+def gerar_diagnostico(nome_excel, nome_blob, texto, doc, extras=None):
+    diagnostico = {
+        "Nome no Excel": nome_excel,
+        "Nome Encontrado": nome_blob.split("/")[-1],
+        "Match Exato": "Sim" if nome_excel + ".pdf" == nome_blob.split("/")[-1] else "Não",
+        **metadados_texto(texto, doc),
+    }
+    # Colunas adicionais (ex.: estatísticas do índice de blobs)
+    if extras:
+        diagnostico.update(extras)
+    return diagnostico